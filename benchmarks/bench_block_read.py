@@ -0,0 +1,117 @@
+""" Block read engine of `ScanALL` against the file engine.
+
+Scans a synthetic .all file (or the given files) with the file engine, which
+reads each header through the default buffer and seeks over the payloads,
+and with the block engine at several block sizes, which reads the file in
+large sequential blocks. Each scan is run with the file in the page cache
+(warm) and, where `posix_fadvise` is available, after asking the kernel to
+drop it from the page cache (cold), which is closer to reading the file from
+a disk or a network share for the first time.
+
+Usage::
+
+    python benchmarks/bench_block_read.py [-s 1GB] [-b 1MB 8MB 64MB]
+        [-n REPEAT] [file.all ...]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from hyo2.mate.lib.scan_ALL import ScanALL, ENGINE_FILE, ENGINE_BLOCK
+from hyo2.mate.lib.synth_ALL import write_synthetic_all
+
+_units = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'B': 1}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit, factor in _units.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def drop_cache(path):
+    """ Asks the kernel to drop the pages of the file from the page cache.
+    Returns False if this is not supported.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+def scan_seconds(path, engine, block_size, cold, repeat):
+    """ Best time in seconds of `repeat` scans of the file """
+    best = None
+    for _ in range(repeat):
+        if cold and not drop_cache(path):
+            return None
+        scan = ScanALL(path, engine)
+        if block_size is not None:
+            scan.block_size = block_size
+        start = time.perf_counter()
+        scan.scan_datagram()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "files", nargs='*',
+        help='files to scan, a synthetic file is written if none is given')
+    parser.add_argument(
+        "-s", "--size", default='256MB',
+        help='size of the synthetic file, eg; 1GB')
+    parser.add_argument(
+        "-b", "--block-sizes", nargs='+', default=['1MB', '8MB', '64MB'],
+        help='block sizes of the block engine')
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=3,
+        help='scans of each measurement, the best time is reported')
+    args = parser.parse_args()
+
+    temp_dir = None
+    files = args.files
+    if not files:
+        temp_dir = tempfile.mkdtemp(prefix='mate_bench_')
+        files = [os.path.join(temp_dir, 'synthetic.all')]
+        write_synthetic_all(files[0], size=parse_size(args.size))
+
+    runs = [(ENGINE_FILE, None)] + [
+        (ENGINE_BLOCK, parse_size(b)) for b in args.block_sizes]
+    try:
+        for path in files:
+            size_mb = os.path.getsize(path) / 1024 ** 2
+            print("{} ({:.1f} MB)".format(os.path.basename(path), size_mb))
+            print("{:<8} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+                'engine', 'block', 'warm s', 'MB/s', 'cold s', 'MB/s'))
+            for engine, block_size in runs:
+                row = [engine, '-' if block_size is None else
+                       '{:.0f}MB'.format(block_size / 1024 ** 2)]
+                for cold in (False, True):
+                    seconds = scan_seconds(
+                        path, engine, block_size, cold, args.repeat)
+                    if seconds is None:
+                        row += ['-', '-']
+                    else:
+                        row += ['{:.3f}'.format(seconds),
+                                '{:.1f}'.format(size_mb / seconds)]
+                print("{:<8} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+                    *row))
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
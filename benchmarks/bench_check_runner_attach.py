@@ -0,0 +1,103 @@
+""" Scaling of the attachment of the check outputs in `CheckRunner`.
+
+Builds a synthetic QA JSON with one check definition per (file, check) pair
+for all the Mate checks, as the QAX plugin does, and times
+`CheckRunner.initialize` and the attachment of one output per definition.
+The attachment is timed both with the index built by `initialize` and with
+the linear search over all the definitions it replaced; the latter is only
+run up to `--max-linear` files as it is quadratic.
+
+Usage::
+
+    python benchmarks/bench_check_runner_attach.py [-f 1000 10000]
+"""
+import argparse
+import logging
+import time
+
+from hyo2.mate.lib.check_runner import CheckRunner
+from hyo2.mate.lib.output_stream import find_check
+from hyo2.mate.lib.scan_utils import all_checks
+
+
+class Outputs:
+    """ Stands for the `QaJsonOutputs` of a check """
+
+    def to_dict(self):
+        return {'qa_pass': 'yes'}
+
+
+def synthetic_checks(file_count):
+    checks = []
+    for i in range(file_count):
+        path = "survey/line_{:06d}.all".format(i)
+        for check_class in all_checks:
+            checks.append({
+                "info": {
+                    "id": check_class.id,
+                    "name": check_class.name,
+                    "version": check_class.version,
+                    "group": {"id": "", "name": ""},
+                },
+                "inputs": {"files": [{"path": path, "description": ""}]},
+            })
+    return checks
+
+
+def bench(file_count, linear):
+    checks = synthetic_checks(file_count)
+    pairs = [
+        (check['info']['id'], check['inputs']['files'][0]['path'])
+        for check in checks
+    ]
+
+    start = time.perf_counter()
+    checkrunner = CheckRunner(checks, use_scan_cache=False)
+    checkrunner.initialize()
+    initialize_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for check_id, path in pairs:
+        checkrunner._add_output(check_id, path, Outputs())
+    index_time = time.perf_counter() - start
+
+    linear_time = None
+    if linear:
+        output = Outputs()
+        start = time.perf_counter()
+        for check_id, path in pairs:
+            find_check(checkrunner.output, check_id, path)['outputs'] = \
+                output.to_dict()
+        linear_time = time.perf_counter() - start
+
+    return {
+        'files': file_count,
+        'outputs': len(pairs),
+        'initialize_s': initialize_time,
+        'index_s': index_time,
+        'linear_s': linear_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-f", "--files", type=int, nargs='+',
+        default=[100, 1000, 2000, 10000], help='numbers of files')
+    parser.add_argument(
+        "--max-linear", type=int, default=2000,
+        help='largest number of files timed with the linear search')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    print("{:>8} {:>8} {:>14} {:>12} {:>12}".format(
+        "files", "outputs", "initialize s", "index s", "linear s"))
+    for file_count in args.files:
+        r = bench(file_count, file_count <= args.max_linear)
+        print("{:>8} {:>8} {:>14.3f} {:>12.3f} {:>12}".format(
+            r['files'], r['outputs'], r['initialize_s'], r['index_s'],
+            '-' if r['linear_s'] is None else '{:.3f}'.format(r['linear_s'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+""" Startup time of the CLI.
+
+Imports `hyo2.mate.app.cli` in a new interpreter with `-X importtime`, as
+the CLI does when invoked, and prints the slowest imports by cumulative
+time (median of `--repeat` runs), then the total import time with the
+modules the CLI imports once it runs the checks (`check_runner`) and
+validates the input (`hyo2.qax.lib.qa_json`). The difference is what a run
+with `--no-validate --assemble` saves.
+
+Usage::
+
+    python benchmarks/bench_cli_startup.py [-r 5] [-n 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = [
+    ('cli', 'import hyo2.mate.app.cli'),
+    ('cli + check_runner',
+     'import hyo2.mate.app.cli, hyo2.mate.lib.check_runner'),
+    ('cli + check_runner + qa_json',
+     'import hyo2.mate.app.cli, hyo2.mate.lib.check_runner, '
+     'hyo2.qax.lib.qa_json'),
+]
+
+
+def import_times(code):
+    """ Cumulative import time in microseconds of each imported module """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    times = {}
+    for line in output.stderr.decode().splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def median_times(code, repeat):
+    runs = [import_times(code) for _ in range(repeat)]
+    return {
+        name: statistics.median(run.get(name, 0) for run in runs)
+        for name in runs[-1]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help='runs of each import')
+    parser.add_argument(
+        "-n", "--top", type=int, default=15,
+        help='number of slowest imports printed')
+    args = parser.parse_args()
+
+    times = median_times(STATEMENTS[0][1], args.repeat)
+    print("{:>12}  {}".format("cumulative ms", "module"))
+    for name, us in sorted(
+            times.items(), key=lambda item: -item[1])[:args.top]:
+        print("{:>12.1f}  {}".format(us / 1000, name))
+    print()
+
+    print("{:>12}  {}".format("total ms", "imports"))
+    for label, code in STATEMENTS:
+        times = median_times(code, args.repeat)
+        # the total is the sum of the top level imports
+        total = sum(
+            us for name, us in times.items()
+            if name in code.replace(',', ' ').split())
+        print("{:>12.1f}  {}".format(total / 1000, label))
+
+
+if __name__ == '__main__':
+    main()
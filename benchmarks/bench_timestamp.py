@@ -0,0 +1,87 @@
+""" Per datagram cost of the time-stamp conversion done by `ScanALL`.
+
+Compares the original conversion (`datetime.strptime` and a `timedelta`
+for every datagram) with the cached `record_time_to_epoch`, both on the
+conversion alone and on a full `scan_datagram` of the bundled test files.
+
+Usage::
+
+    python benchmarks/bench_timestamp.py [-n REPEAT] [file.all ...]
+"""
+import argparse
+import glob
+import os
+import timeit
+from datetime import datetime, timedelta
+
+from hyo2.mate.lib.scan import record_time_to_epoch
+from hyo2.mate.lib.scan_ALL import ScanALL
+
+TEST_DATA = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.pardir, "tests", "test_data"))
+
+
+def strptime_to_epoch(record_date, record_time):
+    """ Time-stamp conversion as originally done by `ScanALL._read_header`
+    """
+    return (datetime.strptime(str(record_date), '%Y%m%d')
+            + timedelta(0, float(record_time / 1000.0))
+            - datetime(1970, 1, 1)).total_seconds()
+
+
+class StrptimeScanALL(ScanALL):
+    """ `ScanALL` with the original time-stamp conversion plugged in """
+    time_converter = staticmethod(strptime_to_epoch)
+
+
+def per_datagram_ns(func, count, repeat):
+    """ Best time in ns of `func` over `repeat` runs, divided by `count` """
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1e9 / count
+
+
+def bench_file(path, repeat):
+    index = ScanALL(path).header_index
+    records = list(zip(
+        index['RecordDate'].tolist(), index['RecordTime'].tolist()))
+    count = len(records)
+
+    def convert(converter):
+        return lambda: [converter(d, t) for d, t in records]
+
+    def scan(scan_class):
+        return lambda: scan_class(path).scan_datagram()
+
+    return {
+        'file': os.path.basename(path),
+        'datagrams': count,
+        'convert_before_ns': per_datagram_ns(
+            convert(strptime_to_epoch), count, repeat),
+        'convert_after_ns': per_datagram_ns(
+            convert(record_time_to_epoch), count, repeat),
+        'scan_before_ns': per_datagram_ns(
+            scan(StrptimeScanALL), count, repeat),
+        'scan_after_ns': per_datagram_ns(scan(ScanALL), count, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "files", nargs='*', help='.all files, defaults to the test data')
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=5, help='runs per measure')
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(TEST_DATA, '*.all')))
+    print("{:<60} {:>9} {:>14} {:>14}".format(
+        "file", "datagrams", "convert ns/dg", "scan ns/dg"))
+    for path in files:
+        r = bench_file(path, args.repeat)
+        print("{:<60} {:>9} {:>6.0f} > {:>5.0f} {:>6.0f} > {:>5.0f}".format(
+            r['file'], r['datagrams'],
+            r['convert_before_ns'], r['convert_after_ns'],
+            r['scan_before_ns'], r['scan_after_ns']))
+
+
+if __name__ == '__main__':
+    main()
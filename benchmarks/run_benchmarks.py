@@ -0,0 +1,288 @@
+""" Benchmarks of the scanners and of the check pipeline on synthetic files.
+
+Generates synthetic .all files of the given sizes and datagram mix (see
+`hyo2.mate.lib.synth_ALL`) and measures, on each of them:
+
+- `ScanALL.scan_datagram`, once per scan engine
+- `ScanALL.get_size_n_pings`, for half the pings of the file
+- `CheckRunner.run_checks`, with all the Mate checks (skipped if QAX is
+  missing)
+- `MateQaxPlugin.run`, with all the Mate checks (skipped if QAX is missing)
+
+Each measurement runs in a fresh process, so the reported peak RSS is the
+one of the measurement alone. Alongside time, throughput (MB/s and
+datagrams/s) and peak RSS (not on Windows, which lacks the `resource`
+module), the read/write syscall counts and bytes are taken from
+`/proc/self/io` where available. The results are written to a JSON
+file; pass a previous results file to `--compare` to print the change in
+time of each measurement.
+
+Usage::
+
+    python benchmarks/run_benchmarks.py [-s 100MB 1GB] [-o results.json]
+        [--mix X:6000:1,N:3500:1] [--data-dir DIR] [--compare OLD.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import hyo2.mate
+from hyo2.mate.lib.scan_ALL import ScanALL, \
+    ENGINE_FILE, ENGINE_MMAP, ENGINE_INDEX, ENGINE_CHUNKED, ENGINE_BLOCK
+from hyo2.mate.lib.synth_ALL import DEFAULT_MIX, write_synthetic_all
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINES = [
+    ENGINE_FILE, ENGINE_MMAP, ENGINE_INDEX, ENGINE_CHUNKED, ENGINE_BLOCK]
+BENCHMARKS = (
+    ['scan_datagram[{}]'.format(engine) for engine in ENGINES] +
+    ['get_size_n_pings', 'check_runner', 'qax_plugin'])
+
+_units = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'B': 1}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit, factor in _units.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def parse_mix(text):
+    mix = []
+    for item in text.split(','):
+        dg_type, body_size, every = item.split(':')
+        mix.append((dg_type, int(body_size), int(every)))
+    return mix
+
+
+def _proc_io():
+    """ Read/write syscall counts and bytes of this process, or None if
+    `/proc/self/io` is not available.
+    """
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+    except OSError:
+        return None
+    return {key: int(fields[key]) for key in ('syscr', 'syscw', 'rchar')}
+
+
+def _peak_rss_mb():
+    # the resource module is only available on Unix
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return rss / divisor
+
+
+def _checks(path):
+    """ Definitions of all the Mate checks, with their default parameters,
+    for a single file.
+    """
+    from hyo2.mate.lib.scan_utils import all_checks
+    checks = []
+    for check_class in all_checks:
+        checks.append({
+            "info": {
+                "id": check_class.id,
+                "name": check_class.name,
+                "version": check_class.version,
+                "group": {"id": "", "name": ""},
+            },
+            "inputs": {
+                "files": [{"path": path, "description": ""}],
+                "params": [
+                    {"name": p.name, "value": p.value}
+                    for p in check_class.default_params
+                ],
+            },
+        })
+    return checks
+
+
+def _run_check_runner(path, workers):
+    from hyo2.mate.lib.check_runner import CheckRunner
+    checkrunner = CheckRunner(
+        _checks(path), max_workers=workers, use_scan_cache=False)
+    checkrunner.initialize()
+    checkrunner.run_checks()
+
+
+def _run_qax_plugin(path, workers):
+    from hyo2.mate.qax.plugin import MateQaxPlugin
+    from hyo2.qax.lib.qa_json import QaJsonRoot
+    qajson = QaJsonRoot.from_dict({
+        "qa": {
+            "version": "0.1.0",
+            "raw_data": {"checks": _checks(path)},
+        }
+    })
+    plugin = MateQaxPlugin()
+    plugin.use_scan_cache = False
+    plugin.run(qajson, lambda plugin, progress: None)
+
+
+def measure(benchmark, path, pings, workers):
+    """ Runs one benchmark on the file at `path`. Called in a fresh process.
+
+    Returns:
+        Dict with the elapsed time, the bytes processed, the peak RSS and
+        the syscall counts (where available) of the benchmark, or None if it
+        could not run as QAX is missing.
+    """
+    size = os.path.getsize(path)
+    io_before = _proc_io()
+    start = time.perf_counter()
+    if benchmark.startswith('scan_datagram'):
+        engine = benchmark[len('scan_datagram['):-1]
+        ScanALL(path, engine=engine).scan_datagram()
+    elif benchmark == 'get_size_n_pings':
+        size = ScanALL(path).get_size_n_pings(pings // 2)
+    elif benchmark in ('check_runner', 'qax_plugin'):
+        # the checks and the plugin need QAX
+        run = _run_check_runner if benchmark == 'check_runner' \
+            else _run_qax_plugin
+        try:
+            run(path, workers)
+        except ImportError:
+            return None
+    seconds = time.perf_counter() - start
+    io_after = _proc_io()
+
+    result = {
+        'seconds': seconds,
+        'bytes': size,
+    }
+    peak_rss_mb = _peak_rss_mb()
+    if peak_rss_mb is not None:
+        result['peak_rss_mb'] = peak_rss_mb
+    if io_before is not None and io_after is not None:
+        result['read_syscalls'] = io_after['syscr'] - io_before['syscr']
+        result['write_syscalls'] = io_after['syscw'] - io_before['syscw']
+        result['read_bytes'] = io_after['rchar'] - io_before['rchar']
+    return result
+
+
+def run_benchmark(benchmark, path, pings, workers):
+    """ Runs `measure` in a new process """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(
+            measure, benchmark, path, pings, workers).result()
+
+
+def compare(results, previous):
+    """ Prints the ratio of the time of each measurement to the time of the
+    same measurement (same benchmark and file size) in `previous`.
+    """
+    old = {
+        (r['benchmark'], r['file_size']): r['seconds']
+        for r in previous['results']
+    }
+    print("\nChange in time from version {}:".format(previous['version']))
+    for r in results['results']:
+        old_seconds = old.get((r['benchmark'], r['file_size']))
+        if not old_seconds:
+            continue
+        print("{:<24} {:>12} {:>8.2f}x".format(
+            r['benchmark'], r['file_size'], r['seconds'] / old_seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s", "--sizes", nargs='+', default=['100MB'],
+        help='sizes of the synthetic files, eg; 10MB 1GB')
+    parser.add_argument(
+        "--mix", type=parse_mix, default=DEFAULT_MIX,
+        help='datagram mix as comma separated type:body size:every n pings')
+    parser.add_argument(
+        "-b", "--benchmarks", nargs='+', default=BENCHMARKS,
+        choices=BENCHMARKS, help='benchmarks to run')
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1,
+        help='worker processes of the check runner')
+    parser.add_argument(
+        "--data-dir",
+        help='folder of the synthetic files, kept after the run. A '
+             'temporary folder is used if not given')
+    parser.add_argument(
+        "-o", "--output",
+        default=os.path.join(
+            BENCHMARKS_DIR, 'results',
+            'mate-{}.json'.format(hyo2.mate.__version__)),
+        help='path of the results file')
+    parser.add_argument(
+        "--compare", help='previous results file to compare with')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='mate_bench_')
+    os.makedirs(data_dir, exist_ok=True)
+    results = {
+        'version': hyo2.mate.__version__,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'mix': args.mix,
+        'results': [],
+    }
+    try:
+        for size in [parse_size(s) for s in args.sizes]:
+            path = os.path.join(data_dir, 'synthetic_{}.all'.format(size))
+            written = write_synthetic_all(path, size=size, mix=args.mix)
+            datagrams = written['datagrams']
+            pings = written['pings']
+            file_size = written['bytes']
+
+            for benchmark in args.benchmarks:
+                r = run_benchmark(benchmark, path, pings, args.workers)
+                if r is None:
+                    print("{:<24} skipped, hyo2.qax is not installed"
+                          .format(benchmark))
+                    continue
+                r['benchmark'] = benchmark
+                r['file_size'] = file_size
+                r['mb_per_s'] = r['bytes'] / r['seconds'] / 1024 ** 2
+                # the datagram count is only known for the whole file
+                r['datagrams_per_s'] = (
+                    datagrams / r['seconds']
+                    if r['bytes'] == file_size else None)
+                results['results'].append(r)
+                rss = (
+                    '{:.1f}'.format(r['peak_rss_mb'])
+                    if 'peak_rss_mb' in r else '-')
+                print(
+                    "{:<24} {:>12} {:>9.3f} s {:>9.1f} MB/s {:>8} MB RSS "
+                    "{:>8} read syscalls".format(
+                        benchmark, file_size, r['seconds'], r['mb_per_s'],
+                        rss, r.get('read_syscalls', '-')))
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print("Results written to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
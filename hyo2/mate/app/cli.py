@@ -2,8 +2,12 @@ import argparse
 import json
 import os
 
-from hyo2.mate.lib.check_runner import CheckRunner
-from hyo2.qax.lib.qa_json import QAJson
+from hyo2.mate.lib.metrics import Metrics, profile_hooks
+from hyo2.mate.lib.output_stream import OutputStream, assemble_output
+
+# the check runner (and with it numpy and the checks) and QAX are imported
+# once the arguments are parsed and only when needed, so that showing the
+# usage, assembling the output or reporting an invalid input is fast
 
 
 def main():
@@ -13,20 +17,75 @@ def main():
     parser.add_argument(
         "-o", "--output", help='Path to output QA JSON file. If not provided \
         will be printed to stdout.', required=False)
+    parser.add_argument(
+        "--no-validate", help='Do not validate the input QA JSON against \
+        the QA JSON schema', action='store_true')
+    parser.add_argument(
+        "--validation-cache", help='Keep the digests of the input QA JSON \
+        found valid, so that a QA JSON already validated by a previous run \
+        is not validated again', action='store_true')
+    parser.add_argument(
+        "--no-cache", help='Do not use the scan cache', action='store_true')
+    parser.add_argument(
+        "--refresh-cache", help='Scan all files again, replacing their \
+        results in the scan cache', action='store_true')
+    parser.add_argument(
+        "--follow", help='Check files that are still being logged, running \
+        the checks again as new data is written. Requires --output or \
+        --stream.', action='store_true')
+    parser.add_argument(
+        "--poll-interval", help='Seconds between two scans of the files in \
+        follow mode', type=float, default=5.0)
+    parser.add_argument(
+        "--idle-timeout", help='Seconds without new data after which follow \
+        mode ends', type=float, default=60.0)
+    parser.add_argument(
+        "--stream", help='Path to a JSON Lines file the output of each check \
+        is written to as soon as it completes. The output QA JSON is then \
+        assembled from it at the end of the run.', required=False)
+    parser.add_argument(
+        "--assemble", help='Path to a JSON Lines file written by --stream. \
+        No check is run, the output QA JSON is assembled from the input QA \
+        JSON and the outputs in this file.', required=False)
+    parser.add_argument(
+        "--metrics", help='Path to a JSON file the metrics of the run are \
+        written to: time of each phase, bytes and datagrams scanned and time \
+        of each check, in total and per file.', required=False)
+    parser.add_argument(
+        "--profile", help='Profile the scan and checks of each file',
+        choices=sorted(profile_hooks), required=False)
+    parser.add_argument(
+        "--profile-dir", help='Folder the profile of each file is written \
+        to', default='profiles')
     args = parser.parse_args()
+    if args.follow and args.output is None and args.stream is None:
+        # the output written on every update would be a sequence of QA JSON
+        # documents on stdout
+        parser.error("--follow requires --output or --stream")
 
     qajson_input = args.input
     if not os.path.isfile(qajson_input):
         raise RuntimeError(
             "QA JSON file does not exist {}".format(qajson_input))
 
-    # most recent schema
-    schema_path = QAJson.schema_paths()[0]
+    if not args.no_validate:
+        from hyo2.qax.lib.qa_json import QAJson
 
-    # validate the provided QA JSON file against the JSON schema definition
-    if not QAJson.validate_qa_json(qajson_input, schema_path):
-        raise RuntimeError(
-            "QA JSON is invalid {}".format(qajson_input))
+        # most recent schema
+        schema_path = QAJson.schema_paths()[0]
+
+        # validate the provided QA JSON file against the JSON schema
+        # definition
+        if args.validation_cache:
+            from hyo2.mate.lib.qa_json_validation import QaJsonValidator, \
+                default_cache_path
+            validator = QaJsonValidator(schema_path, default_cache_path())
+            valid = validator.validate_file(qajson_input)
+        else:
+            valid = QAJson.validate_qa_json(qajson_input, schema_path)
+        if not valid:
+            raise RuntimeError(
+                "QA JSON is invalid {}".format(qajson_input))
 
     rawdatachecks = None
     output = None
@@ -35,18 +94,69 @@ def main():
         output = qajson
         rawdatachecks = qajson['qa']['raw_data']['checks']
 
-    checkrunner = CheckRunner(rawdatachecks)
+    def write_output():
+        if args.output is None:
+            # If output not specified p[rint to std out
+            print(json.dumps(output, indent=4))
+        else:
+            # replaced at once, so a reader of the output written again in
+            # follow mode never sees a partial file
+            qajson_output = args.output
+            temp_output = '{}.{}.tmp'.format(qajson_output, os.getpid())
+            with open(temp_output, 'w') as jsonfileoutput:
+                json.dump(output, jsonfileoutput, indent=4)
+            os.replace(temp_output, qajson_output)
+
+    if args.assemble is not None:
+        assemble_output(rawdatachecks, args.assemble)
+        write_output()
+        return
+
+    stream = None
+    if args.stream is not None:
+        stream = OutputStream(args.stream)
+
+    metrics = Metrics() if args.metrics is not None else None
+    file_hook = None
+    if args.profile is not None:
+        file_hook = profile_hooks[args.profile](args.profile_dir)
+
+    from hyo2.mate.lib.check_runner import CheckRunner
+    checkrunner = CheckRunner(
+        rawdatachecks,
+        use_scan_cache=not args.no_cache,
+        refresh_scan_cache=args.refresh_cache,
+        output_callback=stream.write if stream is not None else None,
+        keep_output=stream is None,
+        metrics=metrics,
+        file_hook=file_hook)
     checkrunner.initialize()
-    checkrunner.run_checks()
 
-    output['qa']['raw_data']['checks'] = checkrunner.output
-    if args.output is None:
-        # If output not specified p[rint to std out
-        print(json.dumps(output, indent=4))
+    def update_output(filename=None):
+        output['qa']['raw_data']['checks'] = checkrunner.output
+        write_output()
+
+    try:
+        if args.follow:
+            # without a stream the output is written again every time a
+            # file has been checked
+            checkrunner.run_checks_follow(
+                poll_interval=args.poll_interval,
+                idle_timeout=args.idle_timeout,
+                update_callback=update_output if stream is None else None)
+        else:
+            checkrunner.run_checks()
+    finally:
+        if stream is not None:
+            stream.close()
+        if metrics is not None:
+            metrics.write(args.metrics)
+
+    if stream is not None:
+        assemble_output(rawdatachecks, args.stream)
+        write_output()
     else:
-        qajson_output = args.output
-        with open(qajson_output, 'w') as jsonfileoutput:
-            jsonfileoutput.write(json.dumps(output, indent=4))
+        update_output()
 
 
 if __name__ == '__main__':
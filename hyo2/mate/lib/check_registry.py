@@ -0,0 +1,198 @@
+from importlib import import_module
+import logging
+
+logger = logging.getLogger(__name__)
+
+# entry point group of the check plugins of other packages
+ENTRY_POINT_GROUP = 'hyo2.mate.checks'
+
+
+def _entry_points(group: str) -> list:
+    """ Returns the entry points of a group, or an empty list if the
+    installed packages cannot be queried (Python < 3.8 without the
+    `importlib_metadata` package).
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            return []
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=group))
+    return list(eps.get(group, []))
+
+
+def _import_target(target: str):
+    """ Imports the object given as `module:attribute` """
+    module_name, _, attribute = target.partition(':')
+    return getattr(import_module(module_name), attribute)
+
+
+class CheckRegistry:
+    """ The check implementations by (id, version), for constant time lookup
+    of the checks of a QA JSON definition.
+
+    A check is registered with its class, or lazily with the id, version and
+    `module:Class` path of its class, in which case its module is only
+    imported when the check is first looked up. A module can also be
+    registered, its check classes (those it defines with an `id` and a
+    `version`) are registered when a check is first not found. The checks of
+    other packages are registered by entry points of the `ENTRY_POINT_GROUP`
+    group, loaded when a check is not found among the registered ones. An
+    entry point named `<id>/<version>` is registered lazily, any other is
+    loaded at once and may give a check class or a list of check classes,
+    eg;
+
+        entry_points={
+            'hyo2.mate.checks': [
+                '1a2b.../1 = my_package.checks:MyCheck',
+                'my_checks = my_package.checks:all_checks',
+            ],
+        }
+
+    Registering two checks with the same id and version, or a class whose
+    id and version are not those it was registered with, raises a
+    `ValueError`.
+    """
+
+    def __init__(self, entry_point_group: str = ENTRY_POINT_GROUP):
+        self.entry_point_group = entry_point_group
+        # (id, version) to the check class, or to the `module:Class` path of
+        # the check class until it is imported
+        self._checks = {}
+        # names of the registered modules not imported yet
+        self._modules = []
+        self._entry_points_loaded = entry_point_group is None
+
+    def register(self, check_class: type) -> type:
+        """ Registers a check class. Returns it, so it can decorate the
+        class.
+        """
+        key = (check_class.id, check_class.version)
+        registered = self._checks.get(key)
+        if registered is not None and registered is not check_class and \
+                registered != _class_path(check_class):
+            raise ValueError(
+                "Check {} and {} share id {} and version {}".format(
+                    _class_path(check_class), _name(registered), *key))
+        self._checks[key] = check_class
+        return check_class
+
+    def register_lazy(self, id: str, version: str, target: str):
+        """ Registers the check class given by its `module:Class` path,
+        imported when the check is first looked up.
+        """
+        key = (id, version)
+        registered = self._checks.get(key)
+        if registered is not None and _name(registered) != target:
+            raise ValueError(
+                "Check {} and {} share id {} and version {}".format(
+                    target, _name(registered), id, version))
+        self._checks[key] = target
+
+    def register_module(self, module_name: str):
+        """ Registers the check classes of a module, imported when a check
+        is first not found among the registered ones.
+        """
+        self._modules.append(module_name)
+
+    def load_modules(self):
+        """ Imports the registered modules and registers their checks """
+        modules, self._modules = self._modules, []
+        for module_name in modules:
+            module = import_module(module_name)
+            for value in list(vars(module).values()):
+                if isinstance(value, type) and \
+                        value.__module__ == module_name and \
+                        getattr(value, 'id', None) is not None and \
+                        getattr(value, 'version', None) is not None:
+                    self.register(value)
+
+    def _load(self, key: tuple):
+        """ Loads the registered modules, then the entry points, until the
+        check of the (id, version) key is registered.
+        """
+        if key not in self._checks and self._modules:
+            self.load_modules()
+        if key not in self._checks and not self._entry_points_loaded:
+            self.load_entry_points()
+
+    def load_entry_points(self):
+        """ Registers the checks of the entry points of other packages. An
+        entry point that cannot be loaded, or whose checks collide with the
+        registered ones, is logged and ignored.
+        """
+        self._entry_points_loaded = True
+        for ep in _entry_points(self.entry_point_group):
+            try:
+                id, separator, version = ep.name.rpartition('/')
+                if separator:
+                    self.register_lazy(id, version, ep.value)
+                    continue
+                loaded = ep.load()
+                for check_class in (
+                        loaded if isinstance(loaded, (list, tuple))
+                        else [loaded]):
+                    self.register(check_class)
+            except Exception as e:
+                logger.error(
+                    "Checks of entry point {} were ignored: {}".format(
+                        ep.name, e))
+
+    def get(self, id: str, version: str) -> type:
+        """ Returns the check class for the given id and version, importing
+        its module if needed.
+
+        Raises:
+            NotImplementedError: if check with `id` and `version` is not
+                found
+        """
+        key = (id, version)
+        self._load(key)
+        check = self._checks.get(key)
+        if check is None:
+            raise NotImplementedError(
+                "Check with id {} and version {} could not be found".format(
+                    id, version
+                ))
+        if isinstance(check, str):
+            check = _import_target(check)
+            if (check.id, check.version) != key:
+                raise ValueError(
+                    "Check {} has id {} and version {}, not {} and {}".format(
+                        _class_path(check), check.id, check.version, *key))
+            self._checks[key] = check
+        return check
+
+    def __contains__(self, key: tuple) -> bool:
+        """ Indicates if a check is registered for the (id, version) key,
+        without importing it if it was registered lazily.
+        """
+        self._load(key)
+        return key in self._checks
+
+    def checks(self) -> list:
+        """ Returns all the check classes sorted by name, importing them """
+        self.load_modules()
+        if not self._entry_points_loaded:
+            self.load_entry_points()
+        return sorted(
+            (self.get(*key) for key in list(self._checks)),
+            key=lambda check: check.__name__)
+
+
+def _class_path(check_class: type) -> str:
+    return '{}:{}'.format(check_class.__module__, check_class.__qualname__)
+
+
+def _name(check) -> str:
+    return check if isinstance(check, str) else _class_path(check)
+
+
+# the registry of the checks used by `scan_utils` and the `CheckRunner`,
+# the checks of Mate are registered when first looked up
+registry = CheckRegistry()
+registry.register_module('hyo2.mate.lib.scan_check')
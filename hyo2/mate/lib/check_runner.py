@@ -1,13 +1,26 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+    wait, FIRST_COMPLETED
 import copy
 from datetime import datetime
+import json
 import logging
+import math
+import multiprocessing
 import os
-from typing import Callable
+import queue
+import time
+from typing import Callable, ContextManager
 
 from hyo2.qax.lib.qa_json import QaJsonParam, QaJsonOutputs, QaJsonExecution, \
     QaJsonInputs
 
-from hyo2.mate.lib.scan_utils import get_scan, get_check, is_check_supported
+from hyo2.mate.lib.metrics import Metrics, NULL_METRICS
+from hyo2.mate.lib.output_stream import build_check_index
+from hyo2.mate.lib.scan import Scan
+from hyo2.mate.lib.scan_cache import ScanCache
+from hyo2.mate.lib.scan_utils import get_scan, get_check, get_check_class, \
+    is_check_supported
 
 logger = logging.getLogger(__name__)
 
@@ -23,19 +36,76 @@ class CheckRunner:
     to the next file.
     """
 
-    def __init__(self, checks_def: list):
+    def __init__(
+            self, checks_def: list, max_workers: int = 1,
+            use_scan_cache: bool = True, refresh_scan_cache: bool = False,
+            output_callback: Callable = None, keep_output: bool = True,
+            metrics: Metrics = None,
+            file_hook: Callable[[str], ContextManager] = None,
+            batch_size: int = None):
         """ `CheckRunner` constructor
 
         Args:
             checks_def (dict): definition of checks. This should conform to
                 the checks block of the QA JSON schema.
+            max_workers (int): number of processes used to check files in
+                parallel. With 1 (default) files are checked one at a time
+                in this process, with None one process per CPU is used.
+            use_scan_cache (bool): reuse the results of previous scans of
+                unchanged files saved in the scan cache, and save the new
+                ones. Default True.
+            refresh_scan_cache (bool): scan all files again, replacing their
+                results in the scan cache. Default False.
+            output_callback (Callable): function reference that is passed
+                the check id, the file path and the outputs dict of each
+                check as soon as it has been run (eg; `OutputStream.write`).
+                Optional.
+            keep_output (bool): collect the outputs of all checks in
+                `output`. When False the outputs are only passed to
+                `output_callback` and `output` is the unchanged input, which
+                saves a copy of the checks definition. Default True.
+            metrics (Metrics): collects the time of each phase, the bytes
+                and datagrams scanned and the time of each check, in total
+                and per file. Optional, nothing is collected by default.
+            file_hook (Callable): function reference that is passed the
+                path of each file and returns a context manager wrapping
+                the scan and the checks of that file (eg; `CProfileHook`).
+                It must be picklable to be used by worker processes.
+                Optional.
+            batch_size (int): maximum number of files sharing the same
+                checks that are scanned before running each check on all of
+                them at once (see `ScanCheck.run_batch`). The scans of a
+                batch are held in memory until its checks are run, and the
+                execution start and end of a check output are those of the
+                check of the whole batch. With 1 the checks are run on each
+                file after its scan, as they are when a `file_hook` is
+                given. Default 64, or 1 with an `output_callback` so that
+                the outputs are passed as soon as the checks of each file
+                complete.
         """
         self._input = checks_def
+        self.output_callback = output_callback
+        self.keep_output = keep_output
         # The check runner output will based on its input but add new content
         # based on check execution and results. Clone the input to use as the
         # basis of the output.
-        self._output = copy.deepcopy(self._input)
+        self._output = (
+            copy.deepcopy(self._input) if keep_output else self._input)
         self._file_checks = None
+        # (check id, file path) to the check of _output the outputs go to
+        self._output_index = None
+        # number of outputs attached to _output and seconds spent doing so
+        self._attach_count = 0
+        self._attach_time = 0.0
+        self.max_workers = max_workers
+        self.scan_cache = ScanCache() if use_scan_cache else None
+        self.refresh_scan_cache = refresh_scan_cache
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.file_hook = file_hook
+        if batch_size is None:
+            batch_size = 64 if output_callback is None else 1
+        self.batch_size = batch_size
+        self._futures = None  # pending files when running in parallel
 
         self.stopped = False  # if true check runner should stop execution
 
@@ -79,45 +149,76 @@ class CheckRunner:
                     filechecks[filename] = checklistforfile
 
         self._file_checks = filechecks
+        if self.keep_output:
+            self._output_index = build_check_index(self._output)
 
     def _add_output(self, check_id, filename, output):
-        """ Adds the output to the appropriate location in the _output.
+        """ Adds the output to the appropriate location in the _output, and
+        passes it to the output callback.
         """
-        for check in self._output:
-            outputcheckid = check['info']['id']
+        output_dict = output.to_dict()
+        if self.output_callback is not None:
+            self.output_callback(check_id, filename, output_dict)
+        if not self.keep_output:
+            return
 
-            # does this check match the check fro which the output was
-            # generated for
-            if check_id != outputcheckid:
-                continue
+        start = time.perf_counter()
+        check = self._output_index.get((check_id, filename))
+        if check is None:
+            raise RuntimeError("Could not find check {} for file {}".format(
+                check_id, filename
+            ))
+        check['outputs'] = output_dict
+        self._attach_time += time.perf_counter() - start
+        self._attach_count += 1
+
+    def _batches(self, batch_size: int) -> list:
+        """ Groups the files sharing the same checks, with the same
+        parameters, in batches of up to `batch_size` files, or of a single
+        file if there is a `file_hook`. The checks of a batch are those of
+        the checklist of its first file.
 
-            # does this check have the file specified that the output was
-            # generated for. There may be duplicate checks, each with different
-            # files, this makes sure we only attach the output to the right
-            # one.
-            inputs = check['inputs']
-            has_file = False
-            for input in inputs['files']:
-                if input['path'] == filename:
-                    has_file = True
-                    break
-
-            if not has_file:
-                continue
-
-            check['outputs'] = output.to_dict()
+        Returns:
+            List of (list of file paths, checklist) tuples
+        """
+        if self.file_hook is not None:
+            batch_size = 1
+        # the files may share the check definitions, or have their own
+        # definitions of the same checks (as written by the QAX plugin)
+        groups = {}
+        for filename, checklist in self._file_checks.items():
+            key = tuple(
+                (checkdata['info']['id'], checkdata['info']['version'],
+                 json.dumps(
+                     checkdata['inputs'].get('params'), sort_keys=True))
+                for checkdata in checklist)
+            groups.setdefault(key, (checklist, []))[1].append(filename)
+        batches = []
+        for checklist, filenames in groups.values():
+            for start in range(0, len(filenames), max(batch_size, 1)):
+                batches.append(
+                    (filenames[start:start + batch_size], checklist))
+        return batches
+
+    def _log_attach_stats(self):
+        if self._attach_count == 0:
             return
-
-        raise RuntimeError("Could not find check {} for file {}".format(
-            check_id, filename
-        ))
+        logger.info(
+            "Attached {} outputs in {:.6f} s ({:.3f} us per output)".format(
+                self._attach_count, self._attach_time,
+                self._attach_time * 1e6 / self._attach_count))
 
     def stop(self):
         """ Stop execution of the check runner. Currently this will only stop
         execution are a file has been fully read. There may be a delay between
-        calling this and execution being stopped.
+        calling this and execution being stopped. When running in parallel
+        the files not yet started are cancelled.
         """
         self.stopped = True
+        futures = self._futures
+        if futures is not None:
+            for future in futures:
+                future.cancel()
 
     def run_checks(self, progress_callback: Callable = None):
         """ Excutes all checks on a file-by-file basis
@@ -133,63 +234,550 @@ class CheckRunner:
 
         # to support accurate progress reporting get size of all files
         total_file_size = 0
-        processed_files_size = 0
         for filename, checklist in self._file_checks.items():
             total_file_size += os.path.getsize(filename)
 
-        for filename, checklist in self._file_checks.items():
+        try:
+            with self.metrics.timer('run_checks'):
+                if self.max_workers != 1 and len(self._file_checks) > 1:
+                    self._run_checks_pool(total_file_size, progress_callback)
+                else:
+                    self._run_checks_serial(
+                        total_file_size, progress_callback)
+        finally:
+            self._log_attach_stats()
+
+    def _run_checks_serial(
+            self, total_file_size: int, progress_callback: Callable = None):
+        """ Executes the checks of each file, one file after the other.
+        """
+        processed_files_size = 0
+        for filenames, checklist in self._batches(self.batch_size):
+            scans = []
+            batch_outputs = []
+            for filename in filenames:
+                if self.stopped:
+                    break
+                file_size = os.path.getsize(filename)
+
+                def prog_cb(scan_progress):
+                    p = scan_progress * file_size + processed_files_size
+                    if progress_callback is not None:
+                        progress_callback(p / total_file_size)
+
+                file_metrics = Metrics() if self.metrics.enabled else None
+                if len(filenames) == 1:
+                    batch_outputs.append(_run_file_checks(
+                        filename, checklist, prog_cb,
+                        self.scan_cache, self.refresh_scan_cache,
+                        file_metrics, self.file_hook))
+                else:
+                    scans.append(_scan_file(
+                        filename, checklist, prog_cb, self.scan_cache,
+                        self.refresh_scan_cache, file_metrics))
+                if file_metrics is not None:
+                    self.metrics.merge(file_metrics.to_dict(), filename)
+
+                processed_files_size += file_size
+
+            # the files of the batch scanned before a stop are checked
+            if scans:
+                batch_outputs = _run_batch_checks(
+                    scans, checklist, self.metrics)
+            for filename, file_outputs in zip(filenames, batch_outputs):
+                for checkid, checkoutputs in file_outputs:
+                    self._add_output(checkid, filename, checkoutputs)
             if self.stopped:
                 return
-            file_size = os.path.getsize(filename)
-            file_size_fraction = file_size / total_file_size
-            _, extension = os.path.splitext(filename)
-            # remove the `.` char from extension
-            filetype = extension[1:]
 
-            # read metadata from header
-            scan = get_scan(filename, filetype)
+    async def run_checks_async(
+            self, progress_callback: Callable = None,
+            max_concurrency: int = 4,
+            buffer_size: int = 4 * 1024 * 1024):
+        """ Excutes all checks like `run_checks`, overlapping the I/O of up
+        to `max_concurrency` files. This suits files on network shares, where
+        each read has a high latency and a single file at a time leaves the
+        runner mostly waiting. Each file is scanned and checked in a thread,
+        reading the file through a buffer of `buffer_size` bytes so that the
+        datagram headers are read with few large sequential reads.
+
+        The outputs are the same as those of `run_checks`, and so is the
+        progress: the fraction of the bytes of all files that have been
+        scanned. `progress_callback` and `output_callback` are called in the
+        thread running the event loop.
+
+        A `file_hook` (eg; `CProfileHook`) may not support being active in
+        several threads at once, so with a `file_hook` the files are checked
+        one at a time.
+
+        :param progress_callback Callable: function reference that is passed
+            a float between the value of 0.0 and 1.0 to indicate progress
+            of the checks. Optional.
+        :param max_concurrency int: maximum number of files checked at once.
+        :param buffer_size int: size in bytes of the read buffer of each
+            file.
+        """
+        self.stopped = False
+
+        if self._file_checks is None:
+            raise RuntimeError("CheckRunner is not initialized")
+
+        if self.file_hook is not None:
+            max_concurrency = 1
+        loop = asyncio.get_running_loop()
+        file_sizes = {
+            filename: os.path.getsize(filename)
+            for filename in self._file_checks
+        }
+        total_file_size = sum(file_sizes.values())
+        # bytes scanned so far for each file
+        scanned = dict.fromkeys(self._file_checks, 0)
+        finished = set()
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        def report_progress(filename, fraction):
+            if filename in finished:
+                # late message from a file that has been completed
+                return
+            scanned[filename] = fraction * file_sizes[filename]
+            if progress_callback is not None and total_file_size > 0:
+                progress_callback(sum(scanned.values()) / total_file_size)
+
+        async def check_file(executor, filename, checklist):
+            async with semaphore:
+                if self.stopped:
+                    return
+                # only report each percent, not each datagram, to the loop
+                last_progress = [0.0]
+
+                def prog_cb(scan_progress):
+                    if scan_progress - last_progress[0] >= 0.01:
+                        last_progress[0] = scan_progress
+                        loop.call_soon_threadsafe(
+                            report_progress, filename, scan_progress)
+
+                file_metrics = Metrics() if self.metrics.enabled else None
+                file_outputs = await loop.run_in_executor(
+                    executor, _run_file_checks, filename, checklist,
+                    prog_cb, self.scan_cache, self.refresh_scan_cache,
+                    file_metrics, self.file_hook, buffer_size)
+            if file_metrics is not None:
+                self.metrics.merge(file_metrics.to_dict(), filename)
+            report_progress(filename, 1.0)
+            finished.add(filename)
+            for checkid, checkoutputs in file_outputs:
+                self._add_output(checkid, filename, checkoutputs)
+
+        try:
+            with self.metrics.timer('run_checks'):
+                with ThreadPoolExecutor(
+                        max_workers=max_concurrency) as executor:
+                    await asyncio.gather(*[
+                        check_file(executor, filename, checklist)
+                        for filename, checklist in self._file_checks.items()
+                    ])
+        finally:
+            self._log_attach_stats()
+
+    def run_checks_follow(
+            self, poll_interval: float = 5.0, idle_timeout: float = 60.0,
+            update_callback: Callable = None):
+        """ Executes all checks on files that are still being logged, as new
+        data is written to them. Every `poll_interval` seconds the datagrams
+        appended to each file since the previous scan are scanned and, if
+        there are any, the checks of that file are run again. Files that do
+        not exist yet are checked once they appear.
+
+        Execution ends when no file has grown for `idle_timeout` seconds (or
+        never if None), or when `stop` is called.
+
+        :param poll_interval float: seconds between two scans of the files.
+        :param idle_timeout float: seconds without new data after which the
+            execution ends. Optional.
+        :param update_callback Callable: function reference that is passed
+            the path of a file once the outputs of its checks have been
+            updated. Optional.
+        """
+        self.stopped = False
 
-            def prog_cb(scan_progress):
-                p = scan_progress * file_size + processed_files_size
-                if progress_callback is not None:
-                    progress_callback(p / total_file_size)
+        if self._file_checks is None:
+            raise RuntimeError("CheckRunner is not initialized")
 
-            scan.scan_datagram(prog_cb)
+        scans = {}
+        last_update = time.monotonic()
+        while not self.stopped:
+            for filename, checklist in self._file_checks.items():
+                if self.stopped:
+                    return
+                if filename not in scans:
+                    if not os.path.isfile(filename):
+                        continue
+                    _, extension = os.path.splitext(filename)
+                    scans[filename] = get_scan(
+                        filename, extension[1:],
+                        time_series=_needs_time_series(checklist))
+                    scans[filename].metrics = self.metrics
+                scan = scans[filename]
+                with self.metrics.timer('scan'):
+                    if scan.scan_new_data() == 0:
+                        continue
+                last_update = time.monotonic()
+                for checkid, checkoutputs in _run_scan_checks(
+                        scan, checklist, self.metrics):
+                    self._add_output(checkid, filename, checkoutputs)
+                if update_callback is not None:
+                    update_callback(filename)
+
+            if idle_timeout is not None and \
+                    time.monotonic() - last_update >= idle_timeout:
+                return
+            time.sleep(poll_interval)
+
+    def _run_checks_pool(
+            self, total_file_size: int, progress_callback: Callable = None):
+        """ Executes the checks of each file in a pool of worker processes.
+        Progress is the fraction of the bytes of all files that have been
+        scanned, summed across the workers. The files sharing a checklist
+        are sent to the workers in batches, small enough to keep all the
+        workers busy.
+        """
+        context = multiprocessing.get_context()
+        progress_queue = context.Queue()
+        # bytes scanned so far for each file
+        scanned = dict.fromkeys(self._file_checks, 0)
+        finished = set()
+
+        def report_progress():
+            while True:
+                try:
+                    filename, fraction = progress_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if filename in finished:
+                    # late message from a file that has been completed
+                    continue
+                scanned[filename] = fraction * os.path.getsize(filename)
+            if progress_callback is not None and total_file_size > 0:
+                progress_callback(
+                    sum(scanned.values()) / total_file_size)
+
+        workers = self.max_workers or os.cpu_count() or 1
+        batch_size = min(
+            self.batch_size, math.ceil(len(self._file_checks) / workers))
+        with ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(progress_queue,)) as executor:
+            self._futures = {
+                executor.submit(
+                    _run_worker_file_checks, filenames, checklist,
+                    self.scan_cache, self.refresh_scan_cache,
+                    self.metrics.enabled, self.file_hook):
+                filenames
+                for filenames, checklist in self._batches(batch_size)
+            }
+            pending = set(self._futures)
+            try:
+                while pending:
+                    done, pending = wait(
+                        pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.cancelled():
+                            continue
+                        filenames = self._futures[future]
+                        batch_outputs, files_metrics, checks_metrics = \
+                            future.result()
+                        if checks_metrics is not None:
+                            self.metrics.merge(checks_metrics)
+                        for filename, file_outputs, file_metrics in zip(
+                                filenames, batch_outputs, files_metrics):
+                            if file_metrics is not None:
+                                self.metrics.merge(file_metrics, filename)
+                            finished.add(filename)
+                            scanned[filename] = os.path.getsize(filename)
+                            for checkid, checkoutputs in file_outputs:
+                                self._add_output(
+                                    checkid, filename, checkoutputs)
+                    report_progress()
+            finally:
+                self._futures = None
+                progress_queue.close()
+
+
+# queue used by the worker processes of the `CheckRunner` to report
+# (filename, scan progress) back to the runner
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    """ Initializes a worker process of the `CheckRunner` pool. """
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_worker_file_checks(
+        filenames: list, checklist: list, scan_cache: ScanCache = None,
+        refresh_scan_cache: bool = False, collect_metrics: bool = False,
+        file_hook: Callable[[str], ContextManager] = None) -> tuple:
+    """ Runs `_run_file_checks` in a worker process on a single file, or
+    scans a batch of files sharing a checklist and runs `_run_batch_checks`
+    on them.
+
+    Returns:
+        Tuple of the lists of (check id, `QaJsonOutputs`) tuples of each
+        file, the `Metrics.to_dict` of each file and the `Metrics.to_dict`
+        of the checks of a batch (in the metrics of the file for a single
+        file). The metrics are None if `collect_metrics` is False.
+    """
+    files_metrics = [
+        Metrics() if collect_metrics else None for _ in filenames]
+    checks_metrics = None
+    if len(filenames) == 1:
+        batch_outputs = [_run_file_checks(
+            filenames[0], checklist, None, scan_cache, refresh_scan_cache,
+            files_metrics[0], file_hook)]
+    else:
+        scans = [
+            _scan_file(
+                filename, checklist, None, scan_cache, refresh_scan_cache,
+                metrics)
+            for filename, metrics in zip(filenames, files_metrics)
+        ]
+        checks_metrics = Metrics() if collect_metrics else NULL_METRICS
+        batch_outputs = _run_batch_checks(scans, checklist, checks_metrics)
+        checks_metrics = checks_metrics.to_dict() if collect_metrics \
+            else None
+    return batch_outputs, [
+        m.to_dict() if collect_metrics else None for m in files_metrics
+    ], checks_metrics
+
+
+def _run_file_checks(
+        filename: str, checklist: list, progress_callback: Callable = None,
+        scan_cache: ScanCache = None, refresh_scan_cache: bool = False,
+        metrics: Metrics = None,
+        file_hook: Callable[[str], ContextManager] = None,
+        buffer_size: int = None) -> list:
+    """ Scans a file and runs all the checks of its checklist. This is a
+    module level function so it can be run by worker processes.
+
+    Args:
+        filename (str): path of the file to check
+        checklist (list): QA JSON check definitions to run on the file
+        progress_callback (Callable): passed the scan progress of the file,
+            a float between 0.0 and 1.0. Optional, in a worker process the
+            progress is sent to the runner instead.
+        scan_cache (ScanCache): cache of the scan results. Optional.
+        refresh_scan_cache (bool): scan the file even if its results are in
+            `scan_cache`.
+        metrics (Metrics): collects the metrics of the file. Optional.
+        file_hook (Callable): returns a context manager wrapping the scan
+            and checks of the file when passed its path. Optional.
+        buffer_size (int): size in bytes of the buffer the file is read
+            through. Optional.
+
+    Returns:
+        List of (check id, `QaJsonOutputs`) tuples, one for each check
+    """
+    if file_hook is not None:
+        with file_hook(filename):
+            return _run_file_checks(
+                filename, checklist, progress_callback, scan_cache,
+                refresh_scan_cache, metrics, buffer_size=buffer_size)
+    if metrics is None:
+        metrics = NULL_METRICS
+
+    scan = _scan_file(
+        filename, checklist, progress_callback, scan_cache,
+        refresh_scan_cache, metrics, buffer_size)
+    return _run_scan_checks(scan, checklist, metrics)
+
+
+def _scan_file(
+        filename: str, checklist: list, progress_callback: Callable = None,
+        scan_cache: ScanCache = None, refresh_scan_cache: bool = False,
+        metrics: Metrics = None, buffer_size: int = None) -> Scan:
+    """ Scans a file, or loads its scan from the scan cache, as needed by
+    the checks of its checklist. The arguments are those of
+    `_run_file_checks`.
+
+    Returns:
+        The `Scan` of the file
+    """
+    if metrics is None:
+        metrics = NULL_METRICS
+
+    _, extension = os.path.splitext(filename)
+    # remove the `.` char from extension
+    filetype = extension[1:]
+
+    if progress_callback is None and _progress_queue is not None:
+        # only report each percent, not each datagram, to the runner
+        last_progress = [0.0]
+
+        def progress_callback(scan_progress):
+            if scan_progress - last_progress[0] >= 0.01:
+                last_progress[0] = scan_progress
+                _progress_queue.put((filename, scan_progress))
+
+    # read metadata from header, recording the time series only for the
+    # checks reading them
+    time_series = _needs_time_series(checklist)
+    scan = get_scan(
+        filename, filetype, buffer_size=buffer_size, time_series=time_series)
+    scan.metrics = metrics
+    # the time series are not kept in the scan cache
+    with metrics.timer('cache_load'):
+        cached = (
+            scan_cache is not None and not refresh_scan_cache and
+            not time_series and scan_cache.load(scan))
+    if cached:
+        metrics.count('cache_hits')
+        if progress_callback is not None:
+            progress_callback(1.0)
+    else:
+        # stop the scan early if all checks only need a few datagrams
+        scan.scan_datagram(
+            progress_callback, _required_datagrams(checklist))
+        if scan_cache is not None:
+            with metrics.timer('cache_save'):
+                scan_cache.save(scan)
+    return scan
+
+
+def _required_datagrams(checklist: list) -> list:
+    """ Returns the datagram types read by all the checks of the checklist,
+    or None if any of the checks needs the whole file to be scanned.
+    """
+    required = set()
+    for checkdata in checklist:
+        check_class = get_check_class(
+            checkdata['info']['id'], checkdata['info']['version'])
+        if check_class.required_datagrams is None:
+            return None
+        required.update(check_class.required_datagrams)
+    return sorted(required)
+
+
+def _needs_time_series(checklist: list) -> bool:
+    """ Returns True if any of the checks of the checklist reads the time
+    series recorded by the scan.
+    """
+    return any(
+        get_check_class(
+            checkdata['info']['id'], checkdata['info']['version']).time_series
+        for checkdata in checklist)
 
-            processed_files_size += file_size
 
-            for checkdata in checklist:
-                checkid = checkdata['info']['id']
-                checkversion = checkdata['info']['version']
+def _run_scan_checks(
+        scan: Scan, checklist: list, metrics: Metrics = NULL_METRICS) -> list:
+    """ Runs all the checks of a checklist on a scanned file.
 
-                checkparams = []
-                if 'params' in checkdata['inputs']:
-                    checkparams = (
-                        QaJsonInputs.from_dict(checkdata['inputs']).params)
+    Args:
+        scan (Scan): scan of the file to check
+        checklist (list): QA JSON check definitions to run on the file
+        metrics (Metrics): collects the time taken by each check. Optional.
 
+    Returns:
+        List of (check id, `QaJsonOutputs`) tuples, one for each check
+    """
+    file_outputs = []
+    for checkdata in checklist:
+        checkid = checkdata['info']['id']
+        checkversion = checkdata['info']['version']
+
+        checkparams = []
+        if 'params' in checkdata['inputs']:
+            checkparams = (
+                QaJsonInputs.from_dict(checkdata['inputs']).params)
+
+        checkoutputs = QaJsonOutputs()
+        checkstatus = None
+        checkerrormessage = None
+        checkstart = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        # get check based on id and version
+        check = get_check(checkid, checkversion, scan, checkparams)
+        start = time.perf_counter()
+        try:
+            check.run_check()
+            checkstatus = "completed"
+            # merge two dicts; checkoutputs and check.output
+            checkoutputs = check.output
+        except Exception as e:
+            checkstatus = "failed"
+            checkerrormessage = str(e)
+        checkseconds = time.perf_counter() - start
+        metrics.add_time('checks', checkseconds)
+        metrics.add_check(checkid, checkdata['info'].get('name'), checkseconds)
+        checkend = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+        execution = {}
+        execution['start'] = checkstart
+        execution['end'] = checkend
+        execution['status'] = checkstatus
+        if checkerrormessage is not None:
+            execution['error'] = checkerrormessage
+
+        checkoutputs.execution = QaJsonExecution.from_dict(execution)
+
+        file_outputs.append((checkid, checkoutputs))
+    return file_outputs
+
+
+def _run_batch_checks(
+        scans: list, checklist: list, metrics: Metrics = NULL_METRICS) -> list:
+    """ Runs all the checks of a checklist on the scans of several files
+    sharing it, each check on all the scans at once (see
+    `ScanCheck.run_batch`). The execution of a check spans the whole batch,
+    and a check raising an exception fails for all the files of the batch.
+
+    Args:
+        scans (list): scans of the files to check
+        checklist (list): QA JSON check definitions to run on the files
+        metrics (Metrics): collects the time taken by each check. Optional.
+
+    Returns:
+        List of the lists of (check id, `QaJsonOutputs`) tuples of each scan,
+        one for each check
+    """
+    batch_outputs = [[] for _ in scans]
+    for checkdata in checklist:
+        checkid = checkdata['info']['id']
+        checkversion = checkdata['info']['version']
+
+        checkparams = []
+        if 'params' in checkdata['inputs']:
+            checkparams = (
+                QaJsonInputs.from_dict(checkdata['inputs']).params)
+
+        checkstart = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        check_class = get_check_class(checkid, checkversion)
+        start = time.perf_counter()
+        try:
+            outputs = check_class.run_batch(scans, checkparams)
+        except Exception as e:
+            # the check failed for every file of the batch, as it does for a
+            # single file
+            outputs = [e] * len(scans)
+        checkseconds = time.perf_counter() - start
+        metrics.add_time('checks', checkseconds)
+        metrics.add_check(
+            checkid, checkdata['info'].get('name'), checkseconds, len(scans))
+        checkend = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+        for file_outputs, checkoutputs in zip(batch_outputs, outputs):
+            execution = {}
+            execution['start'] = checkstart
+            execution['end'] = checkend
+            if isinstance(checkoutputs, Exception):
+                execution['status'] = "failed"
+                execution['error'] = str(checkoutputs)
                 checkoutputs = QaJsonOutputs()
-                checkstatus = None
-                checkerrormessage = None
-                checkstart = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
-                # get check based on id and version
-                check = get_check(checkid, checkversion, scan, checkparams)
-                try:
-                    check.run_check()
-                    checkstatus = "completed"
-                    # merge two dicts; checkoutputs and check.output
-                    checkoutputs = check.output
-                except Exception as e:
-                    checkstatus = "failed"
-                    checkerrormessage = str(e)
-                checkend = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
-
-                execution = {}
-                execution['start'] = checkstart
-                execution['end'] = checkend
-                execution['status'] = checkstatus
-                if checkerrormessage is not None:
-                    execution['error'] = checkerrormessage
-
-                checkoutputs.execution = QaJsonExecution.from_dict(execution)
+            else:
+                execution['status'] = "completed"
 
-                self._add_output(checkid, filename, checkoutputs)
+            checkoutputs.execution = QaJsonExecution.from_dict(execution)
+
+            file_outputs.append((checkid, checkoutputs))
+    return batch_outputs
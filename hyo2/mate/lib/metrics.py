@@ -0,0 +1,238 @@
+import cProfile
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import ContextManager
+
+
+class Metrics:
+    """ Collects where the time of a QA run goes: seconds per phase (eg;
+    `scan`, `read`, `checks`), counters (eg; `bytes_scanned`), datagrams per
+    type and the time taken by each check. The metrics of each file can
+    also be kept in `files`.
+
+    Pass an instance to `CheckRunner` (or set it as the `metrics` of a
+    `Scan`) to enable the collection. The default is `NULL_METRICS`, which
+    records nothing.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self.datagrams = {}
+        self.checks = {}
+        self.files = {}
+
+    @contextmanager
+    def timer(self, phase: str):
+        """ Context manager adding the time spent in its block to `phase` """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def add_time(self, phase: str, seconds: float):
+        self.timers[phase] = self.timers.get(phase, 0.0) + seconds
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_check(
+            self, check_id: str, name: str, seconds: float, count: int = 1):
+        """ Adds `count` executions of a check that took `seconds` in
+        total, more than one when run on a batch of files at once.
+        """
+        check = self.checks.setdefault(
+            check_id, {'name': name, 'count': 0, 'seconds': 0.0})
+        check['count'] += count
+        check['seconds'] += seconds
+
+    def record_scan(self, scan):
+        """ Counts the bytes and the datagrams per type of a completed scan
+        """
+        self.count('files_scanned')
+        result = scan.result
+        for dg_type in result.types():
+            self.datagrams[dg_type] = self.datagrams.get(dg_type, 0) + \
+                result.get(dg_type)['recordCount']
+        self.count('bytes_scanned', sum(result.byte_count))
+
+    def merge(self, metrics: dict, filename: str = None):
+        """ Adds the metrics of a `to_dict` result, eg; the metrics of a
+        file collected in a worker process. If `filename` is given they are
+        also kept in `files`.
+        """
+        for phase, seconds in metrics['timers'].items():
+            self.add_time(phase, seconds)
+        for name, value in metrics['counters'].items():
+            self.count(name, value)
+        for dg_type, value in metrics['datagrams'].items():
+            self.datagrams[dg_type] = self.datagrams.get(dg_type, 0) + value
+        for check_id, check in metrics['checks'].items():
+            total = self.checks.setdefault(
+                check_id, {'name': check['name'], 'count': 0, 'seconds': 0.0})
+            total['count'] += check['count']
+            total['seconds'] += check['seconds']
+        if filename is not None:
+            self.files[filename] = metrics
+
+    def to_dict(self) -> dict:
+        d = {
+            'timers': dict(self.timers),
+            'counters': dict(self.counters),
+            'datagrams': dict(self.datagrams),
+            'checks': {k: dict(v) for k, v in self.checks.items()},
+        }
+        if self.files:
+            d['files'] = dict(self.files)
+        return d
+
+    def write(self, path: str):
+        """ Writes the metrics to a JSON file, eg; a sidecar of the output
+        QA JSON.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class NullMetrics(Metrics):
+    """ Metrics that record nothing, the default of `Scan` and `CheckRunner`
+    so that instrumented code costs next to nothing when not enabled.
+    """
+
+    enabled = False
+    _null_timer = _NullTimer()
+
+    def timer(self, phase: str) -> ContextManager:
+        return self._null_timer
+
+    def add_time(self, phase: str, seconds: float):
+        pass
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def add_check(
+            self, check_id: str, name: str, seconds: float, count: int = 1):
+        pass
+
+    def record_scan(self, scan):
+        pass
+
+    def merge(self, metrics: dict, filename: str = None):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class TimedReader:
+    """ Wraps a binary file object to add the time spent in its `read`,
+    `readinto` and `seek` calls to the `read` phase of a `Metrics`, and the
+    number of reads to the `read_calls` counter.
+    """
+
+    def __init__(self, reader, metrics: Metrics):
+        self._reader = reader
+        self._metrics = metrics
+
+    def read(self, size: int = -1) -> bytes:
+        start = time.perf_counter()
+        data = self._reader.read(size)
+        self._metrics.add_time('read', time.perf_counter() - start)
+        self._metrics.count('read_calls')
+        return data
+
+    def readinto(self, buffer) -> int:
+        start = time.perf_counter()
+        size = self._reader.readinto(buffer)
+        self._metrics.add_time('read', time.perf_counter() - start)
+        self._metrics.count('read_calls')
+        return size
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        start = time.perf_counter()
+        position = self._reader.seek(offset, whence)
+        self._metrics.add_time('read', time.perf_counter() - start)
+        return position
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+
+def profile_path(output_dir: str, filename: str, extension: str) -> str:
+    """ Path in `output_dir` of the profile of a file, named
+    `<file name>.<path hash>.<extension>`: the hash of the absolute path of
+    the file tells apart the files of the same name in different folders.
+    """
+    path_hash = hashlib.sha1(
+        os.path.abspath(filename).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(output_dir, '{}.{}.{}'.format(
+        os.path.basename(filename), path_hash, extension))
+
+
+class CProfileHook:
+    """ Per file profiling hook of the `CheckRunner` writing the `cProfile`
+    statistics of the scan and checks of each file to `output_dir`, as
+    `<file name>.<path hash>.prof` (see `profile_path`).
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+
+    @contextmanager
+    def __call__(self, filename: str):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(self.output_dir, exist_ok=True)
+            profiler.dump_stats(
+                profile_path(self.output_dir, filename, 'prof'))
+
+
+class PyinstrumentHook:
+    """ Per file profiling hook of the `CheckRunner` writing a `pyinstrument`
+    HTML report of the scan and checks of each file to `output_dir`, as
+    `<file name>.<path hash>.html` (see `profile_path`). Requires the
+    `pyinstrument` package.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+
+    @contextmanager
+    def __call__(self, filename: str):
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = profile_path(self.output_dir, filename, 'html')
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+
+
+profile_hooks = {
+    'cprofile': CProfileHook,
+    'pyinstrument': PyinstrumentHook,
+}
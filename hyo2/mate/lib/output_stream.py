@@ -0,0 +1,127 @@
+import json
+from typing import Iterator
+
+
+def find_check(checks: list, check_id: str, filename: str) -> dict:
+    """ Finds the check definition an output belongs to.
+
+    Args:
+        checks (list): checks block of a QA JSON definition
+        check_id (str): UUID of the check that generated the output
+        filename (str): path of the file the output was generated for
+
+    Returns:
+        The first check with the given id that has the file as input, or
+        None if there is no such check.
+    """
+    for check in checks:
+        # does this check match the check fro which the output was
+        # generated for
+        if check_id != check['info']['id']:
+            continue
+
+        # does this check have the file specified that the output was
+        # generated for. There may be duplicate checks, each with different
+        # files, this makes sure we only attach the output to the right
+        # one.
+        for input in check['inputs']['files']:
+            if input['path'] == filename:
+                return check
+    return None
+
+
+def build_check_index(checks: list) -> dict:
+    """ Builds the index of the check definitions outputs belong to, so they
+    can be found in constant time rather than with `find_check`.
+
+    Args:
+        checks (list): checks block of a QA JSON definition
+
+    Returns:
+        Dict mapping each (check id, file path) to the first check with that
+        id having the file as input, the one returned by `find_check`.
+    """
+    index = {}
+    for check in checks:
+        check_id = check['info']['id']
+        for input in check['inputs']['files']:
+            index.setdefault((check_id, input['path']), check)
+    return index
+
+
+class OutputStream:
+    """ Writes the outputs of the checks to a JSON Lines file as soon as they
+    are generated, one line per output. Each line holds the check id, the
+    path of the checked file and the outputs block of the check.
+
+    Outputs are flushed to disk line by line, so the file shows the progress
+    of a run and keeps all the outputs completed before a crash. The QA JSON
+    can then be assembled from the lines with `assemble_output`.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        """ `OutputStream` constructor
+
+        Args:
+            path (str): path of the JSON Lines file
+            append (bool): append to an existing file rather than replace it
+        """
+        self.path = path
+        self._file = open(path, 'a' if append else 'w')
+
+    def write(self, check_id: str, filename: str, outputs: dict):
+        """ Writes one output. Matches the `CheckRunner` output callback.
+        """
+        line = {'id': check_id, 'file': filename, 'outputs': outputs}
+        self._file.write(json.dumps(line) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_output_stream(path: str) -> Iterator[dict]:
+    """ Reads the lines written by an `OutputStream`. A last line only
+    partially written (eg; by an interrupted run) is ignored.
+    """
+    with open(path) as stream:
+        for line in stream:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                if line.endswith('\n'):
+                    raise
+                return
+
+
+def assemble_output(checks: list, path: str) -> list:
+    """ Attaches the outputs read from an output stream to the checks of a
+    QA JSON definition. When a check has several outputs for the same file
+    the last one is kept.
+
+    Args:
+        checks (list): checks block of the QA JSON definition that was run,
+            updated in place.
+        path (str): path of the JSON Lines file written by `OutputStream`
+
+    Returns:
+        The updated checks
+
+    Raises:
+        RuntimeError: if an output does not belong to any of the checks
+    """
+    index = build_check_index(checks)
+    for line in read_output_stream(path):
+        check = index.get((line['id'], line['file']))
+        if check is None:
+            raise RuntimeError("Could not find check {} for file {}".format(
+                line['id'], line['file']
+            ))
+        check['outputs'] = line['outputs']
+    return checks
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# environment variable that overrides the default location of the cache
+CACHE_PATH_ENV = 'HYO2_MATE_VALIDATION_CACHE'
+
+
+def default_cache_path() -> str:
+    """ Location of the validation cache used when none is given. This is the
+    path set by the `HYO2_MATE_VALIDATION_CACHE` environment variable, if
+    any, otherwise a file in the `.hyo2_mate` folder of the user home.
+    """
+    path = os.environ.get(CACHE_PATH_ENV)
+    if path:
+        return path
+    return os.path.join(
+        os.path.expanduser('~'), '.hyo2_mate', 'validation_cache.json')
+
+
+class QaJsonValidator:
+    """ Validates QA JSON files against a JSON schema. Requires the
+    `jsonschema` package.
+
+    The validator of the schema is built once, on the first validation, and
+    the schema itself is not checked against its meta-schema as
+    `jsonschema.validate` does on each call.
+
+    With a `cache_path`, the digests of the (schema, QA JSON) contents found
+    valid are kept in that file, so a QA JSON already validated, eg; by the
+    previous run of a batch scheduler invoking the CLI once per file, is
+    only read and hashed. At most `max_entries` digests are kept, the
+    oldest are dropped first.
+    """
+
+    max_entries = 1024
+
+    def __init__(self, schema_path: str, cache_path: str = None):
+        """ `QaJsonValidator` constructor
+
+        Args:
+            schema_path (str): path of the JSON schema file
+            cache_path (str): path of the file the digests of the valid
+                QA JSON are kept in. Optional, no cache if not given.
+        """
+        self.schema_path = schema_path
+        self.cache_path = cache_path
+        self._schema = None
+        self._schema_hash = None
+        self._validator = None
+
+    def _load_schema(self):
+        with open(self.schema_path, 'rb') as f:
+            content = f.read()
+        self._schema_hash = hashlib.blake2b(content, digest_size=20)
+        self._schema = json.loads(content)
+
+    @property
+    def validator(self):
+        """ The `jsonschema` validator of the schema """
+        if self._validator is None:
+            from jsonschema.validators import validator_for
+            if self._schema is None:
+                self._load_schema()
+            self._validator = validator_for(self._schema)(self._schema)
+        return self._validator
+
+    def errors(self, qajson: dict) -> list:
+        """ Returns the messages of the errors of a QA JSON document, empty
+        if it is valid.
+        """
+        return [
+            '{}: {}'.format(
+                '/'.join(str(p) for p in error.absolute_path), error.message)
+            for error in sorted(
+                self.validator.iter_errors(qajson),
+                key=lambda error: list(map(str, error.absolute_path)))
+        ]
+
+    def _digest(self, content: bytes) -> str:
+        if self._schema_hash is None:
+            self._load_schema()
+        digest = self._schema_hash.copy()
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _read_cache(self) -> list:
+        try:
+            with open(self.cache_path) as f:
+                digests = json.load(f)
+        except (OSError, ValueError):
+            return []
+        return digests if isinstance(digests, list) else []
+
+    def _write_cache(self, digests: list):
+        # replaced at once so concurrent runs never read a partial file, a
+        # digest lost to a concurrent write is only validated again
+        temp_path = '{}.{}.tmp'.format(self.cache_path, os.getpid())
+        try:
+            folder = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(folder, exist_ok=True)
+            with open(temp_path, 'w') as f:
+                json.dump(digests[-self.max_entries:], f)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            # the cache only saves validating the file again
+            logger.warning(
+                "Validation cache {} could not be written: {}".format(
+                    self.cache_path, e))
+            if os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def validate_file(self, path: str) -> bool:
+        """ Validates a QA JSON file, logging its errors.
+
+        Args:
+            path (str): path of the QA JSON file
+
+        Returns:
+            True if the QA JSON file is valid, otherwise False
+        """
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = None
+        if self.cache_path is not None:
+            digest = self._digest(content)
+            digests = self._read_cache()
+            if digest in digests:
+                return True
+        errors = self.errors(json.loads(content))
+        for error in errors:
+            logger.error("{} is invalid at {}".format(path, error))
+        if errors:
+            return False
+        if digest is not None:
+            digests.append(digest)
+            self._write_cache(digests)
+        return True
@@ -1,5 +1,11 @@
 import os
-from datetime import datetime
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+
+from hyo2.mate.lib.metrics import NULL_METRICS
+from hyo2.mate.lib.scan_result import ScanResult, type_code
 
 A_NONE = 'None'
 A_PARTIAL = 'Partial'
@@ -7,6 +13,45 @@ A_FULL = 'Full'
 A_FAIL = 'Fail'
 A_PASS = 'Pass'
 
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# mean radius of the Earth in metres
+EARTH_RADIUS = 6371008.8
+
+
+@lru_cache(maxsize=None)
+def date_to_epoch(record_date):
+    '''
+    return the seconds from the UNIX epoch to the start of the day given
+    as a YYYYMMDD integer. A survey line only covers a few days, hence the
+    result is cached.
+    '''
+    year, month_day = divmod(record_date, 10000)
+    month, day = divmod(month_day, 100)
+    return (date(year, month, day).toordinal() - _EPOCH_ORDINAL) * 86400
+
+
+def record_time_to_epoch(record_date, record_time):
+    '''
+    return the time-stamp (seconds from the UNIX epoch) of a record given
+    its YYYYMMDD date and its milliseconds since midnight
+    '''
+    return (date_to_epoch(record_date) * 1000 + record_time) / 1000
+
+
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    '''
+    return the great circle distances in metres between the points given by
+    their latitudes and longitudes in decimal degrees, element by element
+    for NumPy arrays
+    '''
+    phi1 = np.radians(latitude1)
+    phi2 = np.radians(latitude2)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(np.asarray(longitude2) - longitude1)
+    a = np.sin(d_phi / 2) ** 2 + \
+        np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
 
 class Scan:
     '''abstract class to scan a raw data file'''
@@ -15,67 +60,212 @@ class Scan:
     file_size = None
     reader = None
     progress = 0       # completed percentage (0 - 100)
-    scan_result = {}
-
-    default_info = {
-        'byteCount': 0,
-        'recordCount': 0,
-        'pingCount': 0,
-        'missedPings': 0,
-        'startTime': None,
-        'stopTime': None,
-        'other': None,
-    }
+    result = None      # ScanResult, the statistics of the scanned datagrams
+    scan_complete = False  # False if the scan stopped before the end
+    # to be increased whenever a change to the scanner changes scan_result,
+    # it invalidates the results saved in the scan cache
+    scanner_version = '1'
+
+    # collects the time spent scanning, the bytes and the datagrams read.
+    # Set it to a `Metrics` instance to enable the collection.
+    metrics = NULL_METRICS
+
+    # multibeam datagram types counted as pings
+    _ping_datagrams = []
+
+    # datagram types whose time-stamps are recorded while scanning with
+    # record_time_series, for the checks on the time series
+    time_series_datagrams = []
+    # record the time series and the position fixes while scanning. They
+    # grow with the number of datagrams, so they are off unless set on the
+    # scan, before scan_datagram(), for checks reading them (see
+    # `ScanCheck.time_series`).
+    record_time_series = False
+    record_positions = False
 
     def __init__(self, file_path):
         self.file_path = file_path
         self.file_size = os.path.getsize(file_path)
+        self.result = ScanResult()
+
+    def _new_result(self):
+        '''return an empty ScanResult for a scan of this file'''
+        return ScanResult()
+
+    @property
+    def scan_result(self) -> dict:
+        '''
+        the statistics of each type of datagram scanned, as a dict of per
+        type dicts (see `ScanResult.to_dict`). Setting it replaces `result`.
+        '''
+        return self.result.to_dict()
+
+    @scan_result.setter
+    def scan_result(self, value: dict):
+        self.result = ScanResult.from_dict(value)
 
     def _time_str(self, unix_time):
         '''return time string in ISO format'''
         return datetime.utcfromtimestamp(unix_time)\
             .isoformat(timespec='milliseconds')
 
-    def scan_datagram(self):
+    def scan_datagram(self, progress_callback=None, required_datagrams=None):
         '''
         scan data to extract basic information for each type of datagram
-        and save to scan_result
+        and save to scan_result. If `required_datagrams` lists datagram
+        types, the scan may stop once a datagram of each type has been read.
         '''
 
+    def scan_new_data(self, progress_callback=None):
+        '''
+        scan the data appended to the file since the last scan and update
+        scan_result. Returns the number of bytes scanned.
+        '''
+        raise NotImplementedError(
+            "Incremental scan is not supported by {}".format(
+                type(self).__name__))
+
     def get_datagram_info(self, datagram_type):
         '''return info about a specific type of datagrame'''
-        if datagram_type in self.scan_result.keys():
-            return self.scan_result[datagram_type]
-        return None
+        return self.result.get(datagram_type)
 
     def get_total_pings(self, datagram_type=None):
         '''return the nuber of pings'''
         if datagram_type is not None:
-            if datagram_type not in self.scan_result.keys():
+            if datagram_type not in self.result:
                 return 0
-            return self.scan_result[datagram_type]['pingCount']
-        total = 0
-        for datagram_type in self.scan_result.keys():
-            total += self.scan_result[datagram_type]['pingCount']
-        return total
+            return self.result.ping_count[type_code(datagram_type)]
+        return sum(self.result.ping_count)
 
     def get_missed_pings(self, datagram_type=None):
         '''return the nuber of missed pings'''
         if datagram_type is not None:
-            if datagram_type not in self.scan_result.keys():
+            if datagram_type not in self.result:
                 return 0
-            return self.scan_result[datagram_type]['missedPings']
-        total = 0
-        for datagram_type in self.scan_result.keys():
-            total += self.scan_result[datagram_type]['missedPings']
-        return total
+            return self.result.missed_pings[type_code(datagram_type)]
+        return sum(self.result.missed_pings)
+
+    def get_time_stamps(self, datagram_type):
+        '''
+        return the time-stamps of the datagrams of a type as a NumPy array
+        (empty if there are none), or None if the scan did not record them
+        '''
+        times = self.result.times
+        if times is None or times[type_code(datagram_type)] is None:
+            return None
+        series = times[type_code(datagram_type)]
+        if len(series) == 0:
+            return np.zeros(0)
+        # a copy, so the array of the scan can still grow
+        return np.frombuffer(series, dtype=np.float64).copy()
+
+    def get_time_gaps(self, datagram_type, max_gap):
+        '''
+        return the gaps of more than `max_gap` seconds between consecutive
+        datagrams of a type, as a NumPy array of (time-stamp before the gap,
+        gap length) rows, or None if the scan did not record the time-stamps
+        '''
+        times = self.get_time_stamps(datagram_type)
+        if times is None:
+            return None
+        gaps = np.diff(times)
+        selected = gaps > max_gap
+        return np.column_stack((times[:-1][selected], gaps[selected]))
+
+    def get_ping_dropouts(self, max_interval_ratio=2.0):
+        '''
+        return, for each multibeam datagram type found, the number of
+        intervals between pings and the number of drop-outs: the intervals
+        longer than `max_interval_ratio` times the median interval. The
+        datagrams sharing a time-stamp are a single ping. None if the scan
+        did not record the time-stamps.
+        '''
+        if self.result.times is None:
+            return None
+        dropouts = {}
+        for d_type in self._ping_datagrams:
+            times = self.get_time_stamps(d_type)
+            if times is None:
+                continue
+            intervals = np.diff(times)
+            intervals = intervals[intervals > 0]
+            if len(intervals) == 0:
+                continue
+            limit = max_interval_ratio * np.median(intervals)
+            dropouts[d_type] = (
+                len(intervals), int(np.count_nonzero(intervals > limit)))
+        return dropouts
+
+    def get_positions(self):
+        '''
+        return the position fixes recorded by the scan as a NumPy array of
+        (time-stamp, latitude, longitude, speed) rows, or None if the scan
+        did not record them
+        '''
+        positions = self.result.positions
+        if positions is None:
+            return None
+        if len(positions) == 0:
+            return np.zeros((0, 4))
+        return np.frombuffer(positions, dtype=np.float64).reshape(-1, 4)
+
+    def get_track_summary(self, speed_interval=1.0):
+        '''
+        return the track of the position fixes recorded by the scan: the
+        number of fixes, the track length and the distance between the first
+        and last fixes in metres, the bounding box of the positions, the
+        largest speed in m/s between a fix and the first one at least
+        `speed_interval` seconds later (so that the noise of fixes logged at
+        a high rate does not read as speed) and the largest speed over
+        ground logged with the fixes. None if the scan did not record the
+        positions.
+        '''
+        positions = self.get_positions()
+        if positions is None:
+            return None
+        times, latitudes, longitudes = positions[:, 0], positions[:, 1], \
+            positions[:, 2]
+        summary = {
+            'positionCount': len(positions),
+            'trackLength': 0.0,
+            'lineExtent': 0.0,
+            'minLatitude': None,
+            'maxLatitude': None,
+            'minLongitude': None,
+            'maxLongitude': None,
+            'maxSpeed': None,
+            'maxLoggedSpeed': None,
+        }
+        if len(positions) == 0:
+            return summary
+        distances = haversine(
+            latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+        # the fixes paired with the first one at least speed_interval later
+        later = np.searchsorted(times, times + speed_interval)
+        paired = np.flatnonzero(later < len(times))
+        later = later[paired]
+        intervals = times[later] - times[paired]
+        summary.update({
+            'trackLength': float(np.sum(distances)),
+            'lineExtent': float(haversine(
+                latitudes[0], longitudes[0], latitudes[-1], longitudes[-1])),
+            'minLatitude': float(latitudes.min()),
+            'maxLatitude': float(latitudes.max()),
+            'minLongitude': float(longitudes.min()),
+            'maxLongitude': float(longitudes.max()),
+        })
+        speeds = positions[:, 3][~np.isnan(positions[:, 3])]
+        if len(speeds) > 0:
+            summary['maxLoggedSpeed'] = float(speeds.max())
+        if len(paired) > 0:
+            summary['maxSpeed'] = float(np.max(haversine(
+                latitudes[paired], longitudes[paired], latitudes[later],
+                longitudes[later]) / intervals))
+        return summary
 
     def total_datagram_bytes(self):
         '''return number of bytes of all datagrams'''
-        total_bytes = 0
-        for datagram_type in self.scan_result.keys():
-            total_bytes += self.scan_result[datagram_type]['byteCount']
-        return total_bytes
+        return sum(self.result.byte_count)
 
     def is_size_matched(self):
         '''check if number of bytes of all datagrams is equal to file size'''
@@ -1,13 +1,29 @@
-from copy import copy
+from concurrent.futures import ProcessPoolExecutor
 from datetime import *
+import mmap
 import os
 import struct
+from array import array
 
+import numpy as np
+
+from hyo2.mate.lib.metrics import TimedReader
 from hyo2.mate.lib.scan import Scan, A_NONE, A_PARTIAL, A_FULL, A_FAIL, A_PASS
+from hyo2.mate.lib.scan import date_to_epoch, record_time_to_epoch
+from hyo2.mate.lib.scan_result import ScanResult, type_code
+
+# engines available to walk the datagrams of a file
+ENGINE_FILE = 'file'    # buffered reads and seeks
+ENGINE_MMAP = 'mmap'    # memory-mapped, zero-copy
+ENGINE_INDEX = 'index'  # vectorized over the header index
+ENGINE_CHUNKED = 'chunked'  # byte ranges scanned by parallel processes
+ENGINE_BLOCK = 'block'  # large blocks read sequentially into a buffer
 
 
 class ScanALL(Scan):
     '''scan an ALL file and provide some indicators of the contents'''
+    engines = [
+        ENGINE_FILE, ENGINE_MMAP, ENGINE_INDEX, ENGINE_CHUNKED, ENGINE_BLOCK]
     _header_fmt = '<LBBHLLHH'
     _header_len = struct.calcsize(_header_fmt)
     _header_unpack = struct.Struct(_header_fmt).unpack_from
@@ -17,10 +33,102 @@ class ScanALL(Scan):
     _dh_data_fmt = '<lB'
     _dh_data_len = struct.calcsize(_dh_data_fmt)
     _dh_data_unpack = struct.Struct(_dh_data_fmt).unpack_from
+    # latitude, longitude, fix quality, speed, course, heading and position
+    # system descriptor of the position datagram
+    _dp_data_fmt = '<llHHHHB'
+    _dp_data_len = struct.calcsize(_dp_data_fmt)
+    _dp_data_unpack = struct.Struct(_dp_data_fmt).unpack_from
+    # the same fields as a NumPy type, to decode many positions at once
+    _dp_data_dtype = np.dtype([
+        ('latitude', '<i4'),
+        ('longitude', '<i4'),
+        ('fixQuality', '<u2'),
+        ('speed', '<u2'),
+        ('course', '<u2'),
+        ('heading', '<u2'),
+        ('descriptor', 'u1'),
+    ])
+    # bit of the position system descriptor set for the active system
+    _active_position_system = 0x80
+    # speed of a position datagram when it is not available
+    _invalid_speed = 65535
+    _length_unpack = struct.Struct('<L').unpack_from
+    # datagram types counted as pings, and their codes
+    _ping_datagrams = ['D', 'X', 'F', 'f', 'N', 'S', 'Y']
+    _ping_codes = frozenset(type_code(t) for t in _ping_datagrams)
+    # codes of the datagram types whose content is reported as 'other'
+    _codes = {'I': type_code('I'), '1': type_code('1'), 'h': type_code('h')}
+    _other_codes = frozenset(_codes.values())
+    _position_code = type_code('P')
+    # converts the date (YYYYMMDD) and time (milliseconds since midnight) of
+    # a datagram header to the time-stamp saved in scan_result. Replace it
+    # to plug in a different conversion for all the datagrams of a scan:
+    # any function on an instance, but wrapped in staticmethod on a subclass
+    # (a plain function would be bound to the scan). The scans of the byte
+    # ranges of the chunked engine use the converter of the class. Only the
+    # ALL and WCD scanners have it, the KMALL headers hold UNIX time-stamps.
+    time_converter = staticmethod(record_time_to_epoch)
+    # the common header as a NumPy type, field by field as in _header_fmt
+    _header_dtype = np.dtype([
+        ('numberOfBytes', '<u4'),
+        ('STX', 'u1'),
+        ('typeOfDatagram', 'u1'),
+        ('EMModel', '<u2'),
+        ('RecordDate', '<u4'),
+        ('RecordTime', '<u4'),
+        ('Counter', '<u2'),
+        ('SerialNumber', '<u2'),
+    ])
+    # one entry of the header index: the header with the position of the
+    # datagram in the file and its time-stamp
+    _index_dtype = np.dtype(
+        [('offset', '<u8')] + _header_dtype.descr + [('timeStamp', '<f8')])
+    # compact index of the datagrams, as saved in the sidecar index file
+    _datagram_index_dtype = np.dtype([
+        ('offset', '<u8'),
+        ('numberOfBytes', '<u4'),
+        ('typeOfDatagram', 'u1'),
+        ('Counter', '<u2'),
+        ('timeStamp', '<f8'),
+    ])
+    # the datagram index is saved next to the file, as <file><index_suffix>,
+    # by the index engine and reused by later scans if use_index_file is set
+    index_suffix = '.idx'
+    use_index_file = False
+    # number of headers gathered at once when building the header index
+    _index_chunk = 65536
+    # byte range scanned by each task of the chunked engine, and number of
+    # processes running them (None for one per CPU)
+    chunk_size = 64 * 1024 * 1024
+    max_workers = None
+    # bytes read at once by the block engine, and whether it advises the
+    # kernel that the file is read sequentially (so it reads ahead more)
+    block_size = 8 * 1024 * 1024
+    fadvise = True
+    # largest datagram accepted when looking for a datagram boundary
+    _max_datagram_len = 16 * 1024 * 1024
+    # record the offsets of the ping boundaries while scanning, so that
+    # get_size_n_pings() does not read the file again. Off by default as
+    # they grow with the number of pings.
+    record_ping_offsets = False
+    # time series of the position, attitude, clock and ping datagrams
+    time_series_datagrams = ['P', 'A', 'C'] + _ping_datagrams
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, engine=ENGINE_FILE, buffer_size=-1):
+        '''
+        `buffer_size` is the size in bytes of the read buffer of the file
+        engine, the default buffer size if -1. A buffer of a few MB serves
+        the header walk with few large sequential reads.
+        '''
         Scan.__init__(self, file_path)
-        self.reader = open(self.file_path, 'rb')
+        if engine not in self.engines:
+            raise NotImplementedError(
+                "Scan engine {} is not supported".format(engine))
+        self.engine = engine
+        self.reader = open(self.file_path, 'rb', buffering=buffer_size)
+        self._header_index = None
+        self._datagram_index = None
+        self.result = self._new_result()
 
     # the source code of _more_data() and _read_header()
     # are copied from pyall.py
@@ -38,39 +146,51 @@ class ScanALL(Scan):
             curr = self.reader.tell()
             data = self.reader.read(self._header_len)
             s = self._header_unpack(data)
-
-            numberOfBytes = s[0]
-            STX = s[1]
-            typeOfDatagram = chr(s[2])
-            EMModel = s[3]
-            RecordDate = s[4]
-            RecordTime = float(s[5]/1000.0)
-            Counter = s[6]
-            SerialNumber = s[7]
-            timeStamp = (datetime.strptime(str(RecordDate), '%Y%m%d')
-                         + timedelta(0, RecordTime)
-                         - datetime(1970, 1, 1)).total_seconds()
-
-            # now reset file pointer
-            # self.reader.seek(curr, 0)
-
-            # we need to add 4 bytes as the message does not contain
-            # the 4 bytes used to hold the size of the message
-            # trap corrupt datagrams at the end of a file.
-            # We see this in EM2040 systems.
-            if (curr + numberOfBytes + 4) > self.file_size:
-                numberOfBytes = self.file_size - curr - 4
-                typeOfDatagram = 'XXX'
-            return (numberOfBytes + 4, STX, typeOfDatagram,
-                    EMModel, timeStamp, Counter, SerialNumber, curr)
+            return self._decode_header(s, curr)
         except struct.error:
             return (0, 0, 0, 0, 0, 0, 0, curr)
 
+    def _decode_header(self, s, curr):
+        '''
+        convert the unpacked common header `s` of the datagram starting at
+        byte `curr` to the tuple returned by _read_header()
+        '''
+        numberOfBytes = s[0]
+        STX = s[1]
+        typeOfDatagram = chr(s[2])
+        EMModel = s[3]
+        RecordDate = s[4]
+        RecordTime = s[5]
+        Counter = s[6]
+        SerialNumber = s[7]
+        timeStamp = self.time_converter(RecordDate, RecordTime)
+
+        # we need to add 4 bytes as the message does not contain
+        # the 4 bytes used to hold the size of the message
+        # trap corrupt datagrams at the end of a file.
+        # We see this in EM2040 systems.
+        if (curr + numberOfBytes + 4) > self.file_size:
+            numberOfBytes = self.file_size - curr - 4
+            typeOfDatagram = 'XXX'
+        return (numberOfBytes + 4, STX, typeOfDatagram,
+                EMModel, timeStamp, Counter, SerialNumber, curr)
+
     def get_size_n_pings(self, pings):
         '''
         return bytes in the file which containg specified
-        number of pings
+        number of pings: the bytes up to the datagram at which one of the
+        ping datagram types has counted more than `pings` pings, or all the
+        bytes if none has. After a scan recording the ping offsets this is a
+        lookup, otherwise the headers of the file are read.
         '''
+        offsets = self.result.ping_offsets
+        if offsets is not None and len(self.result) > 0:
+            ends = [o[pings] for o in offsets.values() if len(o) > pings]
+            if ends:
+                return min(ends)
+            if self.scan_complete:
+                return self.total_datagram_bytes()
+
         c_bytes = 0
         result = {}
         self.reader.seek(0, 0)
@@ -79,9 +199,12 @@ class ScanALL(Scan):
             num_bytes, stx, dg_type, \
                 em_model, unix_time, _counter, serial_number, _curr = \
                 self._read_header()
+            if num_bytes == 0:
+                # less than a header left, nothing more can be read
+                break
             self.reader.seek(_curr + num_bytes, 0)
             c_bytes += num_bytes
-            if dg_type in ['D', 'X', 'F', 'f', 'N', 'S', 'Y']:
+            if dg_type in self._ping_datagrams:
                 if dg_type not in result.keys():
                     result[dg_type] = {
                         'seqNo': _counter,
@@ -94,10 +217,144 @@ class ScanALL(Scan):
                 result[dg_type]['seqNo'] = _counter
         return c_bytes
 
-    def scan_datagram(self, progress_callback=None):
-        '''scan data to extract basic information for each type of datagram'''
+    def _new_result(self):
+        '''return an empty ScanResult for a scan of this file'''
+        return ScanResult(
+            record_ping_offsets=self.record_ping_offsets,
+            time_series=[
+                type_code(t) for t in self.time_series_datagrams
+            ] if self.record_time_series else (),
+            record_positions=self.record_positions)
+
+    def _update_result(self, dg_type, num_bytes, time_stamp, _counter,
+                       data, offset, end=None):
+        '''
+        save the info of one datagram to result. `data` is a bytes-like
+        object holding the datagram body (what follows the common header)
+        from position `offset`; it is only used for the I, 1, h and P
+        datagrams. `end` is the offset of the end of the datagram in the
+        file.
+        '''
+        result = self.result
+        code = type_code(dg_type)
+        result.add(code, num_bytes, time_stamp, _counter)
+        if code in self._ping_codes:
+            result.add_ping(code, _counter, end)
+        elif code == self._position_code:
+            if result.positions is not None and \
+                    num_bytes >= self._header_len + self._dp_data_len:
+                position = self._decode_position(data, offset)
+                if position is not None:
+                    result.add_position(time_stamp, *position)
+        elif code in self._other_codes:
+            # only the first installation datagram is reported, the last
+            # one of the others
+            if code != self._codes['I'] or result.other[code] is None:
+                result.other[code] = \
+                    self._decode_other(dg_type, num_bytes, data, offset)
+
+    def _decode_position(self, data, offset):
+        '''
+        decode the latitude and longitude (decimal degrees) and the speed
+        over ground (m/s, NaN if not available) of the P datagram body held
+        by `data` from position `offset`. None if the fix is not from the
+        active positioning system, as the fixes of all the systems are
+        logged.
+        '''
+        s = self._dp_data_unpack(data, offset)
+        if not s[6] & self._active_position_system:
+            return None
+        speed = float('nan') if s[3] == self._invalid_speed else s[3] / 100
+        return s[0] / 2e7, s[1] / 1e7, speed
 
-        self.scan_result = {}
+    def _decode_positions(self, data, records):
+        '''
+        decode the position fixes of the active positioning system of the P
+        datagrams of the `records` of the datagram index at once from the
+        file bytes `data`, as an array('d') of (time-stamp, latitude,
+        longitude, speed) values
+        '''
+        records = records[records['numberOfBytes'].astype(np.int64) + 4 >=
+                          self._header_len + self._dp_data_len]
+        starts = records['offset'].astype(np.int64) + self._header_len
+        rows = starts[:, None] + np.arange(self._dp_data_len, dtype=np.int64)
+        fields = data[rows].view(self._dp_data_dtype).ravel()
+        active = (fields['descriptor'] & self._active_position_system) != 0
+        records, fields = records[active], fields[active]
+        speed = fields['speed'] / 100
+        speed[fields['speed'] == self._invalid_speed] = np.nan
+        positions = np.column_stack((
+            records['timeStamp'], fields['latitude'] / 2e7,
+            fields['longitude'] / 1e7, speed))
+        return array('d', positions.astype('=f8').tobytes())
+
+    def _decode_other(self, dg_type, num_bytes, data, offset):
+        '''
+        decode the 'other' info reported for the I, 1 and h datagrams from
+        the datagram body held by `data` from position `offset`
+        '''
+        if dg_type == 'I':
+            with self.metrics.timer('decode_I'):
+                ascii_end = offset + num_bytes - self._header_len
+                text = str(data[offset + 2:ascii_end], 'utf-8', 'ignore')
+                parameters = {}
+                for p in text.split(","):
+                    parts = p.split('=')
+                    if len(parts) > 1:
+                        parameters[parts[0]] = parts[1].strip()
+            return parameters
+        elif dg_type == '1':
+            s = self._d1_data_unpack(data, offset)
+            return s[-5:]
+        elif dg_type == 'h':
+            s = self._dh_data_unpack(data, offset)
+            return s[1]
+        return None
+
+    def scan_datagram(self, progress_callback=None, required_datagrams=None):
+        '''
+        scan data to extract basic information for each type of datagram.
+        If `required_datagrams` lists datagram types, the scan stops as soon
+        as a datagram of each of these types has been read.
+        '''
+
+        self.result = self._new_result()
+        self.scan_complete = True
+        reader = self.reader
+        if self.metrics.enabled:
+            # time the reads of the file engine apart from the parsing
+            self.reader = TimedReader(reader, self.metrics)
+        try:
+            with self.metrics.timer('scan'):
+                if required_datagrams is not None:
+                    # only the walkers can stop early
+                    if self.engine == ENGINE_FILE:
+                        self._scan_file(progress_callback, required_datagrams)
+                    elif self.engine == ENGINE_BLOCK:
+                        self._scan_block(
+                            progress_callback, required_datagrams)
+                    else:
+                        self._scan_mmap(progress_callback, required_datagrams)
+                elif self.engine == ENGINE_MMAP:
+                    self._scan_mmap(progress_callback)
+                elif self.engine == ENGINE_INDEX:
+                    self._scan_index(progress_callback)
+                elif self.engine == ENGINE_CHUNKED:
+                    self._scan_chunked(progress_callback)
+                elif self.engine == ENGINE_BLOCK:
+                    self._scan_block(progress_callback)
+                else:
+                    self._scan_file(progress_callback)
+        finally:
+            self.reader = reader
+        self.metrics.record_scan(self)
+        return
+
+    def _scan_file(self, progress_callback=None, required_datagrams=None):
+        '''walk the datagrams with buffered reads and seeks of the reader'''
+        missing = None
+        if required_datagrams is not None:
+            missing = set(required_datagrams)
         self.reader.seek(0, 0)
         while self._more_data():
             # update progress
@@ -109,58 +366,595 @@ class ScanALL(Scan):
             num_bytes, stx, dg_type, \
                 em_model, time_stamp, _counter, serial_number, _curr = \
                 self._read_header()
+            if num_bytes == 0:
+                # less than a header left, nothing more can be read
+                break
 
-            if dg_type not in self.scan_result.keys():
-                self.scan_result[dg_type] = copy(self.default_info)
-                self.scan_result[dg_type]['_seqNo'] = None
-
-            # save datagram info
-            self.scan_result[dg_type]['byteCount'] += num_bytes
-            self.scan_result[dg_type]['recordCount'] += 1
-            if self.scan_result[dg_type]['startTime'] is None:
-                self.scan_result[dg_type]['startTime'] = time_stamp
-            self.scan_result[dg_type]['stopTime'] = time_stamp
+            data = None
             if dg_type == 'I':
-                # self.reader.seek(_curr + self._header_len, 0)
-                ascii_bytes = num_bytes - self._header_len - 2
-                data = self.reader.read(2 + ascii_bytes)
-                parameters = {}
-                for p in data[2:].decode('utf-8', errors="ignore").split(","):
-                    parts = p.split('=')
-                    if len(parts) > 1:
-                        parameters[parts[0]] = parts[1].strip()
-                if self.scan_result[dg_type]['other'] is None:
-                    self.scan_result[dg_type]['other'] = parameters
+                data = self.reader.read(num_bytes - self._header_len)
             elif dg_type == '1':
-                # self.reader.seek(_curr + self._header_len, 0)
                 data = self.reader.read(self._d1_data_len)
-                s = self._d1_data_unpack(data)
-                self.scan_result[dg_type]['other'] = s[-5:]
             elif dg_type == 'h':
-                # self.reader.seek(_curr + self._header_len, 0)
                 data = self.reader.read(self._dh_data_len)
-                s = self._dh_data_unpack(data)
-                self.scan_result[dg_type]['other'] = s[1]
-            elif dg_type in ['D', 'X', 'F', 'f', 'N', 'S', 'Y']:
-                this_count = _counter
-                last_count = self.scan_result[dg_type]['_seqNo']
-                if last_count is None:
-                    last_count = this_count
-                if this_count - last_count >= 1:
-                    self.scan_result[dg_type]['missedPings'] += \
-                        this_count - last_count - 1
-                    self.scan_result[dg_type]['pingCount'] += 1
-                '''
-                elif this_count - last_count < 0:
-                    # in case Counter has rolled over
-                    self.scan_result[dg_type]['missedPings'] += \
-                        65535 - last_count + this_count
-                    self.scan_result[dg_type]['pingCount'] += 1
-                '''
-                self.scan_result[dg_type]['_seqNo'] = \
-                    this_count
+            elif dg_type == 'P':
+                data = self.reader.read(self._dp_data_len)
+            self._update_result(
+                dg_type, num_bytes, time_stamp, _counter, data, 0,
+                _curr + num_bytes)
             self.reader.seek(_curr + num_bytes, 0)
-        return
+
+            if missing is not None:
+                missing.discard(dg_type)
+                if not missing:
+                    self.scan_complete = not self._more_data()
+                    break
+
+    def _scan_mmap(self, progress_callback=None, required_datagrams=None):
+        '''
+        walk the datagrams of the memory-mapped file: headers are unpacked
+        in place at running offsets and the payloads are never copied
+        '''
+        if self.file_size == 0:
+            # an empty file cannot be mapped
+            return
+        with mmap.mmap(self.reader.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buf:
+            self._walk_buffer(
+                buf, 0, self.file_size, progress_callback,
+                required_datagrams=required_datagrams)
+
+    def _scan_block(self, progress_callback=None, required_datagrams=None):
+        '''
+        walk the datagrams of blocks of block_size bytes read one after the
+        other into a buffer. The datagrams of a block are parsed in place,
+        and the beginning of a datagram running past the end of a block is
+        carried over to the next one.
+        '''
+        header_unpack = self._header_unpack
+        header_len = self._header_len
+        # bytes of the datagrams whose content is decoded needed to do so
+        decoded_len = {
+            '1': header_len + self._d1_data_len,
+            'h': header_len + self._dh_data_len,
+            'P': header_len + self._dp_data_len,
+        }
+        missing = None
+        if required_datagrams is not None:
+            missing = set(required_datagrams)
+        if self.fadvise and hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(
+                    self.reader.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        self.reader.seek(0, 0)
+
+        buf = bytearray(self.block_size)
+        length = 0  # bytes of buf holding data of the file
+        base = 0    # offset in the file of buf[0]
+        offset = 0  # offset in buf of the next datagram
+        while True:
+            if offset + header_len > length:
+                base += offset
+                buf, length, read = self._read_block(
+                    buf, length, offset, header_len)
+                offset = 0
+                if read == 0:
+                    # less than a header left, nothing more can be read
+                    break
+                continue
+
+            # update progress
+            self.progress = (base + offset) / self.file_size
+            if progress_callback is not None:
+                progress_callback(self.progress)
+
+            s = header_unpack(buf, offset)
+            num_bytes, stx, dg_type, \
+                em_model, time_stamp, _counter, serial_number, _curr = \
+                self._decode_header(s, base + offset)
+            needed = num_bytes if dg_type == 'I' else \
+                decoded_len.get(dg_type, 0)
+            if offset + needed > length:
+                # the content to decode is not all in the block
+                base += offset
+                buf, length, read = self._read_block(
+                    buf, length, offset, needed)
+                offset = 0
+                if read == 0:
+                    break
+                continue
+
+            self._update_result(
+                dg_type, num_bytes, time_stamp, _counter,
+                buf, offset + header_len, base + offset + num_bytes)
+            offset += num_bytes
+
+            if missing is not None:
+                missing.discard(dg_type)
+                if not missing:
+                    self.scan_complete = base + offset >= self.file_size
+                    break
+
+    def _read_block(self, buf, length, offset, size):
+        '''
+        move the bytes of `buf` from `offset` to `length` to its beginning
+        and fill the rest of it with the following bytes of the file. If
+        `offset` is past `length` the bytes in between are skipped. `buf` is
+        replaced by a larger buffer if it holds less than `size` bytes.
+        Returns the buffer, the number of bytes of the file it holds and the
+        number of bytes read (0 at the end of the file).
+        '''
+        keep = max(length - offset, 0)
+        if offset > length:
+            self.reader.seek(offset - length, 1)
+        if size > len(buf):
+            grown = bytearray(size)
+            grown[:keep] = buf[offset:offset + keep]
+            buf = grown
+        elif keep > 0:
+            buf[:keep] = buf[offset:offset + keep]
+        with memoryview(buf) as view:
+            read = self.reader.readinto(view[keep:])
+        return buf, keep + read, read
+
+    def scan_new_data(self, progress_callback=None):
+        '''
+        scan the datagrams appended to the file since the last scan, as it
+        happens to a file that is still being logged, and update result
+        in place. The scan resumes after the last complete datagram scanned
+        (the sum of the datagram bytes) with the counters of the last pings
+        in result. A datagram not yet completely written is left for a
+        later call. Returns the number of bytes scanned.
+        '''
+        self.file_size = os.path.getsize(self.file_path)
+        # the indexes no longer cover the file
+        self._header_index = None
+        self._datagram_index = None
+        # the truncated datagram may have been completed since
+        self.result.remove('XXX')
+        start = self.total_datagram_bytes()
+        self.scan_complete = True
+        if self.file_size - start < self._header_len:
+            return 0
+        with mmap.mmap(self.reader.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buf:
+            end = self._walk_buffer(
+                buf, start, self.file_size, progress_callback,
+                complete_only=True)
+        return end - start
+
+    def _walk_buffer(self, buf, start, stop, progress_callback=None,
+                     complete_only=False, required_datagrams=None):
+        '''
+        update result with the datagrams of `buf` starting at byte
+        `start` and before byte `stop`. Returns the offset following the
+        last datagram read. With `complete_only` the walk stops before a
+        datagram truncated by the end of the file rather than reporting it.
+        With `required_datagrams` it stops once a datagram of each of the
+        listed types has been read.
+        '''
+        header_unpack = self._header_unpack
+        header_len = self._header_len
+        missing = None
+        if required_datagrams is not None:
+            missing = set(required_datagrams)
+        view = memoryview(buf)
+        offset = start
+        try:
+            while offset < stop:
+                # update progress
+                self.progress = offset / self.file_size
+                if progress_callback is not None:
+                    progress_callback(self.progress)
+
+                try:
+                    s = header_unpack(buf, offset)
+                except struct.error:
+                    # less than a header left, nothing more can be read
+                    break
+                num_bytes, stx, dg_type, \
+                    em_model, time_stamp, _counter, serial_number, _curr = \
+                    self._decode_header(s, offset)
+                if complete_only and dg_type == 'XXX':
+                    break
+                self._update_result(
+                    dg_type, num_bytes, time_stamp, _counter,
+                    view, offset + header_len, offset + num_bytes)
+                offset += num_bytes
+
+                if missing is not None:
+                    missing.discard(dg_type)
+                    if not missing:
+                        self.scan_complete = offset >= stop
+                        break
+        finally:
+            view.release()
+        return offset
+
+    @property
+    def header_index(self):
+        '''
+        NumPy structured array with one entry per datagram: its offset in the
+        file, the fields of the common header and its time-stamp. The index
+        is built on first access. A datagram truncated by the end of the file
+        is included with the number of bytes recorded in its header.
+        '''
+        if self._header_index is None:
+            with self.metrics.timer('header_index'):
+                self._build_header_index()
+        return self._header_index
+
+    def _build_header_index(self, progress_callback=None):
+        '''
+        build the header index in two passes: the first one follows the
+        length prefixes to locate the datagrams, the second one gathers all
+        the headers into a structured array
+        '''
+        index = np.zeros(0, dtype=self._index_dtype)
+        if self.file_size == 0:
+            # an empty file cannot be mapped
+            self._header_index = index
+            return index
+
+        with mmap.mmap(self.reader.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buf:
+            # first pass: the offsets
+            length_unpack = self._length_unpack
+            last_start = self.file_size - self._header_len
+            offsets = []
+            offset = 0
+            while offset <= last_start:
+                if progress_callback is not None and \
+                        len(offsets) % self._index_chunk == 0:
+                    self.progress = offset / self.file_size
+                    progress_callback(self.progress)
+                offsets.append(offset)
+                offset += length_unpack(buf, offset)[0] + 4
+            offsets = np.array(offsets, dtype=np.uint64)
+
+            # second pass: gather the headers
+            index = np.empty(len(offsets), dtype=self._index_dtype)
+            index['offset'] = offsets
+            data = np.frombuffer(buf, dtype=np.uint8)
+            header_bytes = np.arange(self._header_len, dtype=np.int64)
+            for start in range(0, len(offsets), self._index_chunk):
+                stop = start + self._index_chunk
+                rows = offsets[start:stop].astype(np.int64)[:, None] + \
+                    header_bytes
+                headers = data[rows].view(self._header_dtype).ravel()
+                for name in self._header_dtype.names:
+                    index[name][start:stop] = headers[name]
+            del data
+
+        # time-stamps
+        if self.time_converter is record_time_to_epoch:
+            # vectorized, converting every distinct date only once
+            dates, inverse = np.unique(
+                index['RecordDate'], return_inverse=True)
+            epoch = np.array(
+                [date_to_epoch(int(d)) for d in dates], dtype=np.int64)
+            index['timeStamp'] = (
+                epoch[inverse.ravel()] * 1000 +
+                index['RecordTime'].astype(np.int64)) / 1000
+        else:
+            index['timeStamp'] = [
+                self.time_converter(int(d), int(t))
+                for d, t in zip(index['RecordDate'], index['RecordTime'])]
+
+        self._header_index = index
+        return index
+
+    @property
+    def index_path(self):
+        '''path of the sidecar index file of the file'''
+        return self.file_path + self.index_suffix
+
+    @property
+    def datagram_index(self):
+        '''
+        compact NumPy structured array with the offset, number of bytes,
+        type, counter and time-stamp of each datagram. If use_index_file is
+        set it is loaded from the sidecar index file when that is up to
+        date, otherwise it is built from the header index and saved.
+        '''
+        if self._datagram_index is None:
+            self._get_datagram_index()
+        return self._datagram_index
+
+    def _get_datagram_index(self, progress_callback=None):
+        '''load or build the datagram index'''
+        if self.use_index_file:
+            with self.metrics.timer('index_load'):
+                if self.load_index():
+                    return self._datagram_index
+        with self.metrics.timer('header_index'):
+            header_index = self._build_header_index(progress_callback)
+        index = np.empty(len(header_index), dtype=self._datagram_index_dtype)
+        for name in self._datagram_index_dtype.names:
+            index[name] = header_index[name]
+        self._datagram_index = index
+        if self.use_index_file:
+            try:
+                self._write_index(index, self.index_path)
+            except OSError:
+                # eg; the folder of the file is read-only
+                pass
+        return index
+
+    def save_index(self, path=None):
+        '''
+        write the datagram index to the sidecar index file, or to `path`,
+        as a NumPy .npy file
+        '''
+        self._write_index(self.datagram_index, path or self.index_path)
+
+    def _write_index(self, index, path):
+        # written aside and renamed, so the index file is never partial
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.save(f, index, allow_pickle=False)
+        os.replace(temp_path, path)
+
+    def load_index(self, path=None):
+        '''
+        load the datagram index from the sidecar index file, or from `path`.
+        The index is memory-mapped, only the parts used are read. Returns
+        False, leaving the index unchanged, if the index file is missing,
+        older than the file or does not match its size.
+        '''
+        path = path or self.index_path
+        try:
+            if os.stat(path).st_mtime_ns < \
+                    os.stat(self.file_path).st_mtime_ns:
+                return False
+            index = np.load(path, mmap_mode='r', allow_pickle=False)
+        except (OSError, ValueError):
+            return False
+        if index.dtype != self._datagram_index_dtype:
+            return False
+        # the headers are indexed up to the last one that fits in the file
+        last_start = self.file_size - self._header_len
+        if len(index) == 0:
+            if last_start >= 0:
+                return False
+        elif not (int(index[-1]['offset']) <= last_start <
+                  int(index[-1]['offset']) +
+                  int(index[-1]['numberOfBytes']) + 4):
+            return False
+        self._datagram_index = index
+        return True
+
+    def find_datagrams(self, datagram_types=None, start_time=None,
+                       stop_time=None):
+        '''
+        return the entries of the datagram index of the datagrams of the
+        given types (all types if None) with a time-stamp between
+        `start_time` and `stop_time` included (either can be None), in file
+        order. Only the index is read, eg; the Nth X datagram is at
+        find_datagrams(['X'])[N].
+        '''
+        index = self.datagram_index
+        mask = np.ones(len(index), dtype=bool)
+        if datagram_types is not None:
+            codes = [type_code(t) for t in datagram_types]
+            mask &= np.isin(index['typeOfDatagram'], codes)
+        if start_time is not None:
+            mask &= index['timeStamp'] >= start_time
+        if stop_time is not None:
+            mask &= index['timeStamp'] <= stop_time
+        return index[mask]
+
+    def read_datagram(self, entry):
+        '''
+        return the bytes of the datagram of an entry of the datagram index,
+        including the length prefix
+        '''
+        self.reader.seek(int(entry['offset']), 0)
+        return self.reader.read(int(entry['numberOfBytes']) + 4)
+
+    def read_datagrams(self, datagram_types=None, start_time=None,
+                       stop_time=None):
+        '''
+        yield the index entry and the bytes of each datagram selected as by
+        find_datagrams(), reading only these datagrams from the file
+        '''
+        for entry in self.find_datagrams(
+                datagram_types, start_time, stop_time):
+            yield entry, self.read_datagram(entry)
+
+    def _scan_index(self, progress_callback=None):
+        '''
+        fill result with per type statistics computed by NumPy over
+        the datagram index, rather than datagram by datagram
+        '''
+        index = self._get_datagram_index(progress_callback)
+        if len(index) == 0:
+            return
+
+        # a datagram truncated by the end of the file is reported as 'XXX'
+        # like the other engines do, so keep it aside
+        tail = None
+        last = index[-1]
+        if int(last['offset']) + int(last['numberOfBytes']) + 4 > \
+                self.file_size:
+            tail = last
+            index = index[:-1]
+
+        types = index['typeOfDatagram']
+        order = np.argsort(types, kind='stable')
+        sorted_types = types[order]
+        codes, starts = np.unique(sorted_types, return_index=True)
+        stops = np.append(starts[1:], len(sorted_types))
+        byte_counts = np.add.reduceat(
+            index['numberOfBytes'][order].astype(np.int64) + 4, starts) \
+            if len(starts) > 0 else []
+
+        result = self.result
+        with mmap.mmap(self.reader.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buf:
+            view = memoryview(buf)
+            try:
+                for code, start, stop, byte_count in zip(
+                        codes, starts, stops, byte_counts):
+                    code = int(code)
+                    dg_type = chr(code)
+                    records = index[order[start:stop]]
+                    counters = records['Counter'].astype(np.int64)
+                    times = None
+                    if result.times is not None and \
+                            result.times[code] is not None:
+                        times = array('d', records['timeStamp'].astype(
+                            '=f8').tobytes())
+                    result.add_records(
+                        code, int(byte_count), int(stop - start),
+                        float(records['timeStamp'][0]),
+                        float(records['timeStamp'][-1]), int(counters[0]),
+                        times)
+                    if code in self._other_codes:
+                        # the first I but the last 1 and h are reported
+                        rec = records[0] if dg_type == 'I' else records[-1]
+                        result.other[code] = self._decode_other(
+                            dg_type, int(rec['numberOfBytes']) + 4, view,
+                            int(rec['offset']) + self._header_len)
+                    elif code == self._position_code and \
+                            result.positions is not None:
+                        data = np.frombuffer(view, dtype=np.uint8)
+                        result.positions.extend(
+                            self._decode_positions(data, records))
+                        del data
+                    elif code in self._ping_codes:
+                        steps = np.diff(counters)
+                        pings = steps >= 1
+                        ends = records['offset'] + \
+                            records['numberOfBytes'].astype(np.uint64) + 4
+                        ping_ends = ends[1:][pings].astype('=u8')
+                        result.add_pings(
+                            code, int(np.count_nonzero(pings)),
+                            int(np.sum(steps[pings] - 1)), int(counters[-1]),
+                            array('Q', ping_ends.tobytes()), int(ends[0]))
+            finally:
+                view.release()
+
+        if tail is not None:
+            num_bytes = self.file_size - int(tail['offset'])
+            self._update_result(
+                'XXX', num_bytes, float(tail['timeStamp']),
+                int(tail['Counter']), None, 0)
+
+    def _find_datagram(self, buf, start, stop):
+        '''
+        return the offset of the first datagram starting between bytes
+        `start` and `stop` of `buf`, or None. A datagram is recognised by the
+        STX after the length, a plausible length and the ETX before the
+        checksum, and so is the datagram that follows it.
+        '''
+        def is_datagram(offset):
+            if offset + self._header_len > self.file_size:
+                return False
+            length = self._length_unpack(buf, offset)[0]
+            end = offset + length + 4
+            return (
+                buf[offset + 4] == 0x02 and
+                self._header_len <= length + 4 <= self._max_datagram_len and
+                end <= self.file_size and
+                buf[end - 3] == 0x03)
+
+        position = buf.find(b'\x02', start + 4)
+        while position != -1 and position - 4 < stop:
+            offset = position - 4
+            if is_datagram(offset):
+                following = offset + self._length_unpack(buf, offset)[0] + 4
+                if following == self.file_size or is_datagram(following):
+                    return offset
+            position = buf.find(b'\x02', position + 1)
+        return None
+
+    def _scan_range(self, start, stop):
+        '''
+        scan the datagrams starting in the byte range [`start`, `stop`) of
+        the file, beginning from the first datagram boundary found in it.
+        Returns the offset of the first and after the last datagram read,
+        and the `ScanResult` of the datagrams read.
+        '''
+        self.result = self._new_result()
+        with mmap.mmap(self.reader.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buf:
+            first = start if start == 0 else \
+                self._find_datagram(buf, start, stop)
+            if first is None:
+                return None, None, self.result
+            end = self._walk_buffer(buf, first, stop)
+        return first, end, self.result
+
+    def _merge_result(self, result):
+        '''
+        merge into result the `ScanResult` of the datagrams following the
+        ones already scanned
+        '''
+        self.result.merge(result, first_other=[self._codes['I']])
+
+    def _recording(self):
+        '''
+        return the attributes selecting what the scan records, to be set on
+        the scans of the ranges of the chunked engine
+        '''
+        return {
+            name: getattr(self, name) for name in (
+                'record_ping_offsets', 'record_time_series',
+                'record_positions')
+        }
+
+    def _scan_chunked(self, progress_callback=None):
+        '''
+        split the file in byte ranges of chunk_size, scan them in parallel
+        processes and merge the partial results. The scan of a range that
+        does not start where the previous one ended (a false datagram
+        boundary was found) is repeated here from the right offset.
+        '''
+        ranges = [
+            (start, min(start + self.chunk_size, self.file_size))
+            for start in range(0, self.file_size, self.chunk_size)
+        ]
+        if len(ranges) < 2:
+            self._scan_mmap(progress_callback)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(
+                    _scan_file_range, type(self), self.file_path, start, stop,
+                    self._recording())
+                for start, stop in ranges
+            ]
+            end = 0
+            for (start, stop), future in zip(ranges, futures):
+                try:
+                    first, range_end, result = future.result()
+                except (ValueError, struct.error):
+                    # walking from a false datagram boundary read garbage
+                    first, range_end, result = None, None, ScanResult()
+                if end >= stop:
+                    # the last datagram read spans this whole range
+                    result = ScanResult()
+                elif first != end:
+                    # walk the range from the end of the last datagram read
+                    part = type(self)(self.file_path, ENGINE_MMAP)
+                    for name, value in self._recording().items():
+                        setattr(part, name, value)
+                    part.result = self._new_result()
+                    with mmap.mmap(part.reader.fileno(), 0,
+                                   access=mmap.ACCESS_READ) as buf:
+                        range_end = part._walk_buffer(buf, end, stop)
+                    result = part.result
+                if range_end is not None:
+                    end = max(end, range_end)
+                self._merge_result(result)
+
+                self.progress = stop / self.file_size
+                if progress_callback is not None:
+                    progress_callback(self.progress)
 
     def get_datagram_format_version(self):
         '''
@@ -212,7 +1006,7 @@ class ScanALL(Scan):
         (I, R, D or X, A, n, P, h, F or f or N, G, U)
         return: 'None'/'Partial'/'Full'
         '''
-        presence = self.scan_result.keys()
+        presence = self.result
         part1 = all(i in presence for i in ['I', 'R', 'A', 'n', 'P', 'G', 'U'])
         part2 = any(i in presence for i in ['D', 'X'])
         part3 = any(i in presence for i in ['F', 'f', 'N'])
@@ -230,7 +1024,7 @@ class ScanALL(Scan):
         (I, R, D or X, A, n, P, h, F or f or N, G, U, S or Y)
         return: 'None'/'Partial'/'Full'
         '''
-        presence = self.scan_result.keys()
+        presence = self.result
         result1 = self.bathymetry_availability()
         part4 = any(i in presence for i in ['S', 'Y'])
         if result1 == A_FULL and part4:
@@ -245,7 +1039,7 @@ class ScanALL(Scan):
         (I, R, A, n, P, F or f or N, G, U)
         return: True/False
         '''
-        presence = self.scan_result.keys()
+        presence = self.result
         part0 = all(i in presence for i in ['I', 'R', 'A', 'n', 'P',
                                             'G', 'U'])
         part3 = any(i in presence for i in ['F', 'f', 'N'])
@@ -258,9 +1052,9 @@ class ScanALL(Scan):
         (allow the difference <= 1%)
         return: True/False
         '''
-        for d_type in ['D', 'X', 'F', 'f', 'N', 'S', 'Y']:
-            if d_type in self.scan_result.keys():
-                rec = self.scan_result[d_type]
+        for d_type in self._ping_datagrams:
+            rec = self.result.get(d_type)
+            if rec is not None:
                 if rec['pingCount'] == 0:
                     continue
                 if rec['missedPings'] * 100.0 / rec['pingCount'] > thresh:
@@ -274,9 +1068,9 @@ class ScanALL(Scan):
         (minimum number is 10)
         return: True/False
         '''
-        for d_type in ['D', 'X', 'F', 'f', 'N', 'S', 'Y']:
-            if d_type in self.scan_result.keys():
-                rec = self.scan_result[d_type]
+        for d_type in self._ping_datagrams:
+            rec = self.result.get(d_type)
+            if rec is not None:
                 if rec['pingCount'] < thresh:
                     return False
         return True
@@ -309,3 +1103,15 @@ class ScanALL(Scan):
             if all(1 for i in rec['other']):
                 return A_PASS
         return A_FAIL
+
+
+def _scan_file_range(scan_class, file_path, start, stop, recording=None):
+    '''
+    scan the datagrams starting in the byte range [`start`, `stop`) of a file.
+    This is a module level function so it can be run by worker processes.
+    `recording` are the attributes selecting what the scan records.
+    '''
+    scan = scan_class(file_path, ENGINE_MMAP)
+    for name, value in (recording or {}).items():
+        setattr(scan, name, value)
+    return scan._scan_range(start, stop)
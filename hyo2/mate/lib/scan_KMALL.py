@@ -0,0 +1,534 @@
+from datetime import datetime
+import mmap
+import os
+import re
+import struct
+
+from hyo2.mate.lib.metrics import TimedReader
+from hyo2.mate.lib.scan import Scan, A_NONE, A_PARTIAL, A_FULL, A_FAIL, A_PASS
+from hyo2.mate.lib.scan_ALL import ENGINE_FILE, ENGINE_MMAP
+from hyo2.mate.lib.scan_result import ScanResult, TRUNCATED, type_code
+
+# value of the ellipsoid height of a #SPO datagram when it is not available
+UNAVAILABLE_ELLIPSOID_HEIGHT = -999.0
+# bit of the sensor status flagging invalid data
+SENSOR_STATUS_INVALID = 0x10
+
+
+class ScanKMALL(Scan):
+    '''scan a KMALL file and provide some indicators of the contents'''
+    engines = [ENGINE_FILE, ENGINE_MMAP]
+    # numBytesDgm, dgmType, dgmVersion, systemID, echoSounderID, time_sec,
+    # time_nanosec
+    _header_fmt = '<I4sBBHII'
+    _header_len = struct.calcsize(_header_fmt)
+    _header_unpack = struct.Struct(_header_fmt).unpack_from
+    # valid datagram type names, eg; '#MRZ'
+    _type_name_re = re.compile(b'#[A-Z]{3}')
+    # partition (numOfDgms, dgmNum) and start of the common part
+    # (numBytesCmnPart, pingCnt) of the #MRZ and #MWC datagrams
+    _ping_fmt = '<HHHH'
+    _ping_len = struct.calcsize(_ping_fmt)
+    _ping_unpack = struct.Struct(_ping_fmt).unpack_from
+    # numBytesCmnPart of the #IIP datagram, before the installation text
+    _iip_text_start = 6
+    # common part (numBytesCmnPart, sensorSystem, sensorStatus, padding)
+    # and data block of the #SPO datagram up to the ellipsoid height
+    _spo_fmt = '<HHHHIIfddfff'
+    _spo_len = struct.calcsize(_spo_fmt)
+    _spo_unpack = struct.Struct(_spo_fmt).unpack_from
+    # info part (numBytesInfoPart, sensorSystem, sensorStatus) of the #SKM
+    # datagram
+    _skm_fmt = '<HBB'
+    _skm_len = struct.calcsize(_skm_fmt)
+    _skm_unpack = struct.Struct(_skm_fmt).unpack_from
+
+    # multibeam datagram types counted as pings, and their codes
+    _ping_datagrams = ['#MRZ', '#MWC']
+    _ping_codes = frozenset(type_code(t) for t in _ping_datagrams)
+    # codes of the datagram types whose content is reported as 'other'
+    _codes = {
+        '#IIP': type_code('#IIP'),
+        '#SPO': type_code('#SPO'),
+        '#SKM': type_code('#SKM'),
+    }
+    _other_codes = frozenset(_codes.values())
+    # KMALL datagram types holding the data of the ALL datagram types, used
+    # to map the `required_datagrams` of the checks
+    _all_datagram_types = {
+        'I': '#IIP',
+        'R': '#IOP',
+        'A': '#SKM',
+        'n': '#SKM',
+        'P': '#SPO',
+        'h': '#SPO',
+        '1': '#SPO',
+        'D': '#MRZ',
+        'X': '#MRZ',
+        'F': '#MRZ',
+        'f': '#MRZ',
+        'N': '#MRZ',
+        'S': '#MRZ',
+        'Y': '#MRZ',
+        'G': '#SVT',
+        'U': '#SVP',
+        'C': '#SCL',
+    }
+    # time series of the position, attitude, clock and ping datagrams
+    time_series_datagrams = ['#SPO', '#SKM', '#SCL'] + _ping_datagrams
+    # record the offsets of the ping boundaries while scanning, so that
+    # get_size_n_pings() does not read the file again. Off by default as
+    # they grow with the number of pings.
+    record_ping_offsets = False
+
+    def __init__(self, file_path, engine=ENGINE_MMAP, buffer_size=-1):
+        '''
+        the mmap engine is the default one, the datagram headers are read
+        in place without copying the payloads. `buffer_size` is the size in
+        bytes of the read buffer of the file engine.
+        '''
+        Scan.__init__(self, file_path)
+        if engine not in self.engines:
+            # the index, chunked and block engines of ScanALL only read the
+            # ALL datagram format
+            raise NotImplementedError(
+                "Scan engine {} is not supported for KMALL files, the "
+                "supported engines are {}".format(
+                    engine, ', '.join(self.engines)))
+        self.engine = engine
+        self.reader = open(self.file_path, 'rb', buffering=buffer_size)
+        # datagram type names by the bytes of the header
+        self._type_names = {}
+        self.result = self._new_result()
+
+    def _new_result(self):
+        '''return an empty ScanResult for a scan of this file'''
+        return ScanResult(
+            record_ping_offsets=self.record_ping_offsets,
+            time_series=[
+                type_code(t) for t in self.time_series_datagrams
+            ] if self.record_time_series else (),
+            record_positions=self.record_positions)
+
+    def _decode_header(self, s, curr):
+        '''
+        convert the unpacked header `s` of the datagram starting at byte
+        `curr` to the tuple (number of bytes, datagram type, time-stamp).
+        A datagram running past the end of the file, or whose length is
+        less than a header, is reported as truncated up to the end of the
+        file. So is a datagram whose type is not a valid name, or whose
+        length is less than the part of its body read by _update_result, as
+        found in a corrupt region of the file.
+        '''
+        num_bytes = s[0]
+        try:
+            dg_type = self._type_names[s[1]]
+        except KeyError:
+            dg_type = self._type_names[s[1]] = self._type_name(s[1])
+        time_stamp = s[5] + s[6] / 1e9
+        if dg_type is None or curr + num_bytes > self.file_size or \
+                num_bytes < self._header_len + \
+                self._body_len(dg_type, num_bytes):
+            num_bytes = self.file_size - curr
+            dg_type = TRUNCATED
+        return num_bytes, dg_type, time_stamp
+
+    def _type_name(self, dg_type):
+        '''
+        return the datagram type name of the `dg_type` bytes of a header,
+        or None if they are not '#' followed by three uppercase letters. The
+        type codes of the names are shared by all the scans of the process,
+        so a name that cannot be given a code is also rejected.
+        '''
+        if self._type_name_re.fullmatch(dg_type) is None:
+            return None
+        name = dg_type.decode('ascii')
+        try:
+            type_code(name)
+        except ValueError:
+            return None
+        return name
+
+    def _update_result(self, dg_type, num_bytes, time_stamp, data, offset,
+                       end):
+        '''
+        save the info of one datagram to result. `data` is a bytes-like
+        object holding the datagram body (what follows the header) from
+        position `offset`; it is only read for the ping datagrams and the
+        datagrams reporting 'other'. `end` is the offset of the end of the
+        datagram in the file.
+        '''
+        result = self.result
+        code = type_code(dg_type)
+        if code in self._ping_codes:
+            num_of_dgms, dgm_num, num_bytes_cmn, ping_cnt = \
+                self._ping_unpack(data, offset)
+            result.add(code, num_bytes, time_stamp, ping_cnt)
+            # the common part, with the ping counter, is only in the first
+            # partition of a datagram split in several ones
+            if dgm_num == 1:
+                result.add_ping(code, ping_cnt, end)
+            return
+        result.add(code, num_bytes, time_stamp, None)
+        if code in self._other_codes:
+            # only the first installation datagram is reported, the last
+            # one of the others
+            if code != self._codes['#IIP'] or result.other[code] is None:
+                result.other[code] = \
+                    self._decode_other(dg_type, num_bytes, data, offset)
+            if code == self._codes['#SPO'] and result.positions is not None:
+                s = self._spo_unpack(data, offset)
+                # corrected latitude and longitude, speed over ground
+                result.add_position(time_stamp, s[7], s[8], s[9])
+
+    def _decode_other(self, dg_type, num_bytes, data, offset):
+        '''
+        decode the 'other' info reported for the #IIP, #SPO and #SKM
+        datagrams from the datagram body held by `data` from position
+        `offset`
+        '''
+        if dg_type == '#IIP':
+            with self.metrics.timer('decode_IIP'):
+                # the text is followed by the repeated datagram length
+                text_end = offset + num_bytes - self._header_len - 4
+                text = str(
+                    data[offset + self._iip_text_start:text_end],
+                    'utf-8', 'ignore')
+                parameters = {}
+                for p in text.replace('\n', ',').split(','):
+                    # the parameters are written as key=value or key:value
+                    for separator in '=:':
+                        if separator in p:
+                            key, value = p.split(separator, 1)
+                            parameters[key.strip()] = value.strip('\x00 ')
+                            break
+            return parameters
+        elif dg_type == '#SPO':
+            s = self._spo_unpack(data, offset)
+            return {'sensorStatus': s[2], 'ellipsoidHeight': s[11]}
+        elif dg_type == '#SKM':
+            s = self._skm_unpack(data, offset)
+            return {'sensorStatus': s[2]}
+        return None
+
+    def _body_len(self, dg_type, num_bytes):
+        '''bytes of the body of a datagram read by _update_result'''
+        if dg_type in self._ping_datagrams:
+            return self._ping_len
+        elif dg_type == '#IIP':
+            return num_bytes - self._header_len
+        elif dg_type == '#SPO':
+            return self._spo_len
+        elif dg_type == '#SKM':
+            return self._skm_len
+        return 0
+
+    def scan_datagram(self, progress_callback=None, required_datagrams=None):
+        '''
+        scan data to extract basic information for each type of datagram.
+        If `required_datagrams` lists datagram types, the scan stops as soon
+        as a datagram of each of these types has been read. The ALL datagram
+        types are mapped to the KMALL datagram types holding the same data.
+        '''
+        if required_datagrams is not None:
+            required_datagrams = sorted({
+                self._all_datagram_types.get(t, t)
+                for t in required_datagrams})
+
+        self.result = self._new_result()
+        self.scan_complete = True
+        reader = self.reader
+        if self.metrics.enabled:
+            # time the reads of the file engine apart from the parsing
+            self.reader = TimedReader(reader, self.metrics)
+        try:
+            with self.metrics.timer('scan'):
+                if self.engine == ENGINE_MMAP:
+                    self._scan_mmap(progress_callback, required_datagrams)
+                else:
+                    self._scan_file(progress_callback, required_datagrams)
+        finally:
+            self.reader = reader
+        self.metrics.record_scan(self)
+
+    def _scan_file(self, progress_callback=None, required_datagrams=None):
+        '''walk the datagrams with buffered reads and seeks of the reader'''
+        missing = None
+        if required_datagrams is not None:
+            missing = set(required_datagrams)
+        offset = 0
+        self.reader.seek(0, 0)
+        while offset < self.file_size:
+            # update progress
+            self.progress = offset / self.file_size
+            if progress_callback is not None:
+                progress_callback(self.progress)
+
+            try:
+                s = self._header_unpack(self.reader.read(self._header_len))
+            except struct.error:
+                # less than a header left, nothing more can be read
+                break
+            num_bytes, dg_type, time_stamp = self._decode_header(s, offset)
+            body_len = self._body_len(dg_type, num_bytes)
+            data = self.reader.read(body_len)
+            if len(data) < body_len:
+                # the file is shorter than when the scan started
+                num_bytes = self.file_size - offset
+                dg_type = TRUNCATED
+            self._update_result(
+                dg_type, num_bytes, time_stamp, data, 0, offset + num_bytes)
+            offset += num_bytes
+            self.reader.seek(offset, 0)
+
+            if missing is not None:
+                missing.discard(dg_type)
+                if not missing:
+                    self.scan_complete = offset >= self.file_size
+                    break
+
+    def _scan_mmap(self, progress_callback=None, required_datagrams=None):
+        '''
+        walk the datagrams of the memory-mapped file: headers are unpacked
+        in place at running offsets and the payloads are never copied
+        '''
+        if self.file_size == 0:
+            # an empty file cannot be mapped
+            return
+        with mmap.mmap(self.reader.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buf:
+            self._walk_buffer(
+                buf, 0, self.file_size, progress_callback,
+                required_datagrams=required_datagrams)
+
+    def scan_new_data(self, progress_callback=None):
+        '''
+        scan the datagrams appended to the file since the last scan, as it
+        happens to a file that is still being logged, and update result
+        in place. A datagram not yet completely written is left for a later
+        call. Returns the number of bytes scanned.
+        '''
+        self.file_size = os.path.getsize(self.file_path)
+        # the truncated datagram may have been completed since
+        self.result.remove(TRUNCATED)
+        start = self.total_datagram_bytes()
+        self.scan_complete = True
+        if self.file_size - start < self._header_len:
+            return 0
+        with mmap.mmap(self.reader.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buf:
+            end = self._walk_buffer(
+                buf, start, self.file_size, progress_callback,
+                complete_only=True)
+        return end - start
+
+    def _walk_buffer(self, buf, start, stop, progress_callback=None,
+                     complete_only=False, required_datagrams=None):
+        '''
+        update result with the datagrams of `buf` starting at byte
+        `start` and before byte `stop`. Returns the offset following the
+        last datagram read. With `complete_only` the walk stops before a
+        datagram truncated by the end of the file rather than reporting it.
+        With `required_datagrams` it stops once a datagram of each of the
+        listed types has been read.
+        '''
+        header_unpack = self._header_unpack
+        header_len = self._header_len
+        missing = None
+        if required_datagrams is not None:
+            missing = set(required_datagrams)
+        view = memoryview(buf)
+        offset = start
+        try:
+            while offset < stop:
+                # update progress
+                self.progress = offset / self.file_size
+                if progress_callback is not None:
+                    progress_callback(self.progress)
+
+                try:
+                    s = header_unpack(buf, offset)
+                except struct.error:
+                    # less than a header left, nothing more can be read
+                    break
+                num_bytes, dg_type, time_stamp = \
+                    self._decode_header(s, offset)
+                if dg_type == TRUNCATED:
+                    if complete_only:
+                        break
+                    self._update_result(
+                        dg_type, num_bytes, time_stamp, None, 0,
+                        offset + num_bytes)
+                else:
+                    self._update_result(
+                        dg_type, num_bytes, time_stamp, view,
+                        offset + header_len, offset + num_bytes)
+                offset += num_bytes
+
+                if missing is not None:
+                    missing.discard(dg_type)
+                    if not missing:
+                        self.scan_complete = offset >= stop
+                        break
+        finally:
+            view.release()
+        return offset
+
+    def get_size_n_pings(self, pings):
+        '''
+        return bytes in the file which contain the specified number of pings:
+        the bytes up to the datagram at which one of the ping datagram types
+        has counted more than `pings` pings, or all the bytes if none has.
+        After a scan recording the ping offsets this is a lookup, otherwise
+        the headers of the file are walked again recording them.
+        '''
+        offsets = self.result.ping_offsets
+        if offsets is not None and len(self.result) > 0:
+            ends = [o[pings] for o in offsets.values() if len(o) > pings]
+            if ends:
+                return min(ends)
+            if self.scan_complete:
+                return self.total_datagram_bytes()
+
+        # walk the headers into a result recording the ping offsets
+        scan_result, progress = self.result, self.progress
+        self.result = ScanResult(record_ping_offsets=True)
+        try:
+            self._scan_mmap()
+            offsets = self.result.ping_offsets
+            total = self.total_datagram_bytes()
+        finally:
+            self.result, self.progress = scan_result, progress
+        ends = [o[pings] for o in offsets.values() if len(o) > pings]
+        return min(ends) if ends else total
+
+    def get_installation_parameters(self):
+        '''
+        the installation parameters of the first #IIP datagram as a dict,
+        or None if there is none
+        '''
+        rec = self.get_datagram_info('#IIP')
+        if rec is None:
+            return None
+        return rec['other']
+
+    def get_time_stamps(self, datagram_type):
+        '''
+        return the time-stamps of the datagrams of a type as a NumPy array,
+        or None if the scan did not record them. The ALL datagram types are
+        mapped to the KMALL datagram types holding the same data.
+        '''
+        return Scan.get_time_stamps(
+            self, self._all_datagram_types.get(datagram_type, datagram_type))
+
+    def is_filename_changed(self):
+        '''
+        check if the filename is different from what recorded in the file.
+        KMALL files do not record their file name, so a change cannot be
+        detected
+        return: False
+        '''
+        return False
+
+    def is_date_match(self):
+        '''
+        compare the date of the #IIP datagram and the date as written in the
+        filename
+        return: True/False
+        '''
+        dt = 'unknown'
+        rec = self.get_datagram_info('#IIP')
+        if rec is not None:
+            dt = datetime.utcfromtimestamp(rec['startTime']).strftime('%Y%m%d')
+        return dt in os.path.basename(self.file_path)
+
+    def bathymetry_availability(self):
+        '''
+        check the presence of all required datagrams for bathymetry processing
+        (#IIP, #IOP, #SKM, #SPO, #SVP, #MRZ). The surface sound speed is part
+        of the #MRZ datagrams.
+        return: 'None'/'Partial'/'Full'
+        '''
+        presence = self.result
+        if all(i in presence
+               for i in ['#IIP', '#IOP', '#SKM', '#SPO', '#SVP', '#MRZ']):
+            return A_FULL
+        if any(i in presence for i in ['#SKM', '#SPO', '#MRZ']):
+            return A_PARTIAL
+        return A_NONE
+
+    def backscatter_availability(self):
+        '''
+        check the presence of all required datagrams for backscatter
+        processing, the same as for bathymetry as the seabed image is part
+        of the #MRZ datagrams
+        return: 'None'/'Partial'/'Full'
+        '''
+        return self.bathymetry_availability()
+
+    def ray_tracing_availability(self):
+        '''
+        check the presence of required datagrams for ray tracing
+        (#IIP, #IOP, #SKM, #SPO, #SVP, #MRZ)
+        return: True/False
+        '''
+        presence = self.result
+        return all(i in presence
+                   for i in ['#IIP', '#IOP', '#SKM', '#SPO', '#SVP', '#MRZ'])
+
+    def is_missing_pings_tolerable(self, thresh=1.0):
+        '''
+        check for the number of missing pings in all multibeam
+        data datagrams (#MRZ, #MWC)
+        (allow the difference <= 1%)
+        return: True/False
+        '''
+        for d_type in self._ping_datagrams:
+            rec = self.result.get(d_type)
+            if rec is not None:
+                if rec['pingCount'] == 0:
+                    continue
+                if rec['missedPings'] * 100.0 / rec['pingCount'] > thresh:
+                    return False
+        return True
+
+    def has_minimum_pings(self, thresh=10):
+        '''
+        check if we have minimum number of requied pings in all multibeam
+        data datagrams (#MRZ, #MWC)
+        (minimum number is 10)
+        return: True/False
+        '''
+        for d_type in self._ping_datagrams:
+            rec = self.result.get(d_type)
+            if rec is not None:
+                if rec['pingCount'] < thresh:
+                    return False
+        return True
+
+    def ellipsoid_height_availability(self):
+        '''
+        check that the last #SPO datagram has an ellipsoid height
+        return: True/False
+        '''
+        rec = self.get_datagram_info('#SPO')
+        if rec is not None:
+            return rec['other']['ellipsoidHeight'] != \
+                UNAVAILABLE_ELLIPSOID_HEIGHT
+        return False
+
+    def PU_status(self):
+        '''
+        check the sensor status of the last position (#SPO) and attitude
+        (#SKM) datagrams, failing if any flags invalid data
+        return: 'Fail'/'Pass'
+        '''
+        statuses = [
+            rec['other']['sensorStatus']
+            for rec in (self.get_datagram_info(t) for t in ['#SPO', '#SKM'])
+            if rec is not None
+        ]
+        if statuses and \
+                all(s & SENSOR_STATUS_INVALID == 0 for s in statuses):
+            return A_PASS
+        return A_FAIL
@@ -0,0 +1,20 @@
+from hyo2.mate.lib.scan_ALL import ScanALL, ENGINE_FILE, ENGINE_MMAP, \
+    ENGINE_INDEX
+from hyo2.mate.lib.scan_result import type_code
+
+
+class ScanWCD(ScanALL):
+    '''
+    scan a WCD (water-column) file and provide some indicators of the
+    contents. The datagrams share the format of the ALL files, but most of
+    the file is the payload of the water-column datagrams, so only the
+    engines reading the headers alone are supported: the file engine seeks
+    over the payloads, the mmap and index engines only touch the pages of
+    the headers.
+    '''
+    engines = [ENGINE_FILE, ENGINE_MMAP, ENGINE_INDEX]
+    # a ping is made of one or more water-column datagrams sharing its
+    # counter
+    _ping_datagrams = ['k']
+    _ping_codes = frozenset(type_code(t) for t in _ping_datagrams)
+    time_series_datagrams = ['P', 'A', 'C'] + _ping_datagrams
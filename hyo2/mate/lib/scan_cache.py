@@ -0,0 +1,181 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from hyo2.mate.lib.scan import Scan
+
+logger = logging.getLogger(__name__)
+
+# environment variable that overrides the default location of the cache
+CACHE_PATH_ENV = 'HYO2_MATE_SCAN_CACHE'
+
+
+def default_cache_path() -> str:
+    """ Location of the scan cache used when none is given. This is the path
+    set by the `HYO2_MATE_SCAN_CACHE` environment variable, if any, otherwise
+    a file in the `.hyo2_mate` folder of the user home.
+    """
+    path = os.environ.get(CACHE_PATH_ENV)
+    if path:
+        return path
+    return os.path.join(
+        os.path.expanduser('~'), '.hyo2_mate', 'scan_cache.sqlite')
+
+
+class ScanCache:
+    """ Persistent cache of the `scan_result` of the scanned files, stored in
+    a SQLite database.
+
+    Entries are keyed on the identity of the file (absolute path, size and
+    modification time, and optionally a hash of its content) and on the
+    scanner class and its `scanner_version`, so any change to the file or
+    to the scanner results in a new scan. When the stored results exceed
+    `max_size` bytes the least recently used entries are evicted.
+
+    A connection is opened for each operation, hence the cache can be
+    passed to (and shared by) worker processes.
+    """
+
+    def __init__(
+            self, path: str = None, max_size: int = 256 * 1024 * 1024,
+            hash_content: bool = False):
+        """ `ScanCache` constructor
+
+        Args:
+            path (str): path of the SQLite database file, created if
+                missing. Optional, defaults to `default_cache_path()`.
+            max_size (int): maximum size in bytes of the cached results.
+            hash_content (bool): include a hash of the file content in the
+                key. Safer but the whole file is read to compute it.
+        """
+        self.path = path if path is not None else default_cache_path()
+        self.max_size = max_size
+        self.hash_content = hash_content
+
+    @contextmanager
+    def _connect(self) -> sqlite3.Connection:
+        """ Opens a connection to the database for a single transaction """
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS scans ("
+                    "key TEXT PRIMARY KEY, "
+                    "path TEXT NOT NULL, "
+                    "last_access REAL NOT NULL, "
+                    "result TEXT NOT NULL)")
+                yield connection
+        finally:
+            connection.close()
+
+    def _content_hash(self, file_path: str) -> str:
+        content_hash = hashlib.blake2b(digest_size=20)
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                content_hash.update(block)
+        return content_hash.hexdigest()
+
+    def key(self, scan: Scan) -> str:
+        """ Returns the key of the cache entry for the file read by `scan`
+        """
+        file_path = os.path.abspath(scan.file_path)
+        stat = os.stat(file_path)
+        parts = [
+            file_path,
+            str(stat.st_size),
+            str(stat.st_mtime_ns),
+            self._content_hash(file_path) if self.hash_content else '',
+            type(scan).__name__,
+            str(scan.scanner_version),
+        ]
+        return '|'.join(parts)
+
+    def load(self, scan: Scan) -> bool:
+        """ Sets the `scan_result` of `scan` from the cache. A cache that
+        cannot be read (eg; a path that cannot be created, a locked or
+        corrupt database) is logged and reported as a miss, so the file is
+        scanned.
+
+        Returns:
+            True if the file was found in the cache, otherwise False and
+            `scan` is left untouched.
+        """
+        try:
+            key = self.key(scan)
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT result FROM scans WHERE key = ?",
+                    (key,)).fetchone()
+                if row is None:
+                    return False
+                connection.execute(
+                    "UPDATE scans SET last_access = ? WHERE key = ?",
+                    (time.time(), key))
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(
+                "Scan cache {} could not be read: {}".format(self.path, e))
+            return False
+        scan.scan_result = json.loads(row[0])
+        scan.scan_complete = True
+        return True
+
+    def save(self, scan: Scan):
+        """ Stores the `scan_result` of `scan`, replacing any previous entry
+        of the same file, and evicts the least recently used entries that do
+        not fit in `max_size`. A scan that stopped before the end of the file
+        is not stored, nor is a scan that the cache cannot be written with,
+        which is logged.
+        """
+        if not scan.scan_complete:
+            return
+        result = json.dumps(scan.scan_result)
+        file_path = os.path.abspath(scan.file_path)
+        try:
+            key = self.key(scan)
+            with self._connect() as connection:
+                connection.execute(
+                    "DELETE FROM scans WHERE path = ?", (file_path,))
+                connection.execute(
+                    "INSERT INTO scans (key, path, last_access, result) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, file_path, time.time(), result))
+                self._evict(connection)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(
+                "Scan cache {} could not be written: {}".format(
+                    self.path, e))
+
+    def _evict(self, connection: sqlite3.Connection):
+        total = connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(result)), 0) FROM scans").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = connection.execute(
+            "SELECT key, LENGTH(result) FROM scans "
+            "ORDER BY last_access ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            evicted.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM scans WHERE key = ?", evicted)
+        logger.debug("Evicted {} scans from cache".format(len(evicted)))
+
+    def invalidate(self, file_path: str = None):
+        """ Removes the cached results of a file, or of all files if
+        `file_path` is not given.
+        """
+        with self._connect() as connection:
+            if file_path is None:
+                connection.execute("DELETE FROM scans")
+            else:
+                connection.execute(
+                    "DELETE FROM scans WHERE path = ?",
+                    (os.path.abspath(file_path),))
@@ -1,7 +1,10 @@
 from typing import List
 
+import numpy as np
+
 from hyo2.mate.lib.scan import Scan
 from hyo2.mate.lib.scan import A_NONE, A_PARTIAL, A_FULL, A_FAIL, A_PASS
+from hyo2.mate.lib.scan_result import result_columns
 from hyo2.qax.lib.qa_json import QaJsonParam, QaJsonOutputs
 
 
@@ -9,6 +12,15 @@ class ScanCheck:
     # list including default params to be used for the check
     # objects included in list will have a `name` and `value` attribute
     default_params = []
+    # datagram types the check reads. None if the check needs the whole file
+    # to be scanned, otherwise the scan may stop as soon as a datagram of
+    # each of these types has been read
+    required_datagrams = None
+    # True if the check reads the time series or the positions recorded by
+    # the scan (see `Scan.get_time_stamps`). The scan only records them for
+    # the checklists including such a check, and they are not kept in the
+    # scan cache
+    time_series = False
 
     def __init__(self, scan: Scan, params: List[QaJsonParam]):
         self.scan = scan
@@ -42,6 +54,27 @@ class ScanCheck:
         """
         raise NotImplementedError("run_check must be overwritten")
 
+    @classmethod
+    def run_batch(cls, scans: List[Scan], params: List[QaJsonParam]) -> list:
+        """Executes the check on many scans at once, with the same params.
+        By default the check is run on each scan in turn; concrete classes
+        may override this to evaluate all the scans together, eg; over the
+        `result_columns` of their results.
+
+        Returns:
+            List with the output of the check of each scan, or the exception
+            raised by the check of that scan.
+        """
+        outputs = []
+        for scan in scans:
+            check = cls(scan, params)
+            try:
+                check.run_check()
+                outputs.append(check.output)
+            except Exception as e:
+                outputs.append(e)
+        return outputs
+
 
 class FilenameChangedCheck(ScanCheck):
     """Checks if the name of the file matches that recorded in the metadata/
@@ -50,6 +83,7 @@ class FilenameChangedCheck(ScanCheck):
     id = '7761e08b-1380-46fa-a7eb-f1f41db38541'
     name = "Filename checked"
     version = '1'
+    required_datagrams = ['I']
 
     def __init__(self, scan: Scan, params):
         ScanCheck.__init__(self, scan, params)
@@ -82,6 +116,7 @@ class DateChangedCheck(ScanCheck):
     id = '4a3f3371-3a21-44f2-93cf-d9ed19d0c002'
     name = "Date checked"
     version = '1'
+    required_datagrams = ['I']
 
     def __init__(self, scan: Scan, params):
         ScanCheck.__init__(self, scan, params)
@@ -237,6 +272,37 @@ class MinimumPingCheck(ScanCheck):
         else:
             passed = self.scan.has_minimum_pings()
 
+        self._output = self._make_output(passed, threshold_param)
+
+    @classmethod
+    def run_batch(cls, scans: List[Scan], params: List[QaJsonParam]) -> list:
+        """Executes the check on many scans at once, comparing the ping
+        counts of the ping datagram types of all the scans of a scanner
+        class together.
+        """
+        threshold_param = next(
+            (p for p in params if p.name == 'threshold'), None)
+        # the default of has_minimum_pings
+        threshold = 10 if threshold_param is None else threshold_param.value
+
+        outputs = [None] * len(scans)
+        scanners = {}
+        for i, scan in enumerate(scans):
+            scanners.setdefault(type(scan), []).append(i)
+        for scanner, indexes in scanners.items():
+            results = [scans[i].result for i in indexes]
+            ping_types = scanner._ping_datagrams
+            records = result_columns(results, 'record_count', ping_types)
+            pings = result_columns(results, 'ping_count', ping_types)
+            # the ping types found must all have enough pings
+            passed = np.all((records == 0) | (pings >= threshold), axis=1)
+            for i, scan_passed in zip(indexes, passed):
+                outputs[i] = cls._make_output(
+                    bool(scan_passed), threshold_param)
+        return outputs
+
+    @staticmethod
+    def _make_output(passed: bool, threshold_param: QaJsonParam):
         msg = (
             None
             if passed
@@ -251,7 +317,7 @@ class MinimumPingCheck(ScanCheck):
 
         qa_pass = "yes" if passed else "no"
 
-        self._output = QaJsonOutputs(
+        return QaJsonOutputs(
             execution=None,
             files=None,
             count=None,
@@ -264,7 +330,7 @@ class MinimumPingCheck(ScanCheck):
 class EllipsoidHeightAvailableCheck(ScanCheck):
     """Checks Ellipsoid Height is available.
     """
-    id = 'bbce47c0-54c9-4c60-8de8-b174a8905091'
+    id = '0d2155da-3244-455c-a403-89319156bd9a'
     name = "Ellipsoid Height Available"
     version = '1'
 
@@ -276,7 +342,7 @@ class EllipsoidHeightAvailableCheck(ScanCheck):
 
         msg = (
             None
-            if rt_avail
+            if eh_avail
             else "Ellipsoid height is not available"
         )
 
@@ -326,3 +392,186 @@ class PuStatusCheck(ScanCheck):
             message=msg,
             qa_pass=qa_pass
         )
+
+
+class MaximumTimeGapCheck(ScanCheck):
+    """Checks the time-stamps of consecutive datagrams of each of the given
+    types (by default position, attitude and clock) are no more than
+    `max_gap` seconds apart. The gaps are found over the time series recorded
+    by the scan, without reading the file again.
+    """
+    id = '467f9403-feba-48d7-8b29-4abc94d83a97'
+    name = "Maximum Time Gap"
+    version = '1'
+    default_params = [
+        QaJsonParam(name='datagram_types', value=['P', 'A', 'C']),
+        QaJsonParam(name='max_gap', value=5.0)
+    ]
+    time_series = True
+
+    def __init__(self, scan: Scan, params):
+        ScanCheck.__init__(self, scan, params)
+
+    def run_check(self):
+        types_param = self.get_param('datagram_types')
+        gap_param = self.get_param('max_gap')
+        datagram_types = (
+            self.default_params[0].value if types_param is None
+            else types_param.value)
+        max_gap = (
+            self.default_params[1].value if gap_param is None
+            else gap_param.value)
+
+        gap_count = 0
+        messages = []
+        for datagram_type in datagram_types:
+            gaps = self.scan.get_time_gaps(datagram_type, max_gap)
+            if gaps is None:
+                raise RuntimeError(
+                    "Time series of datagram type {} was not recorded by the "
+                    "scan".format(datagram_type))
+            if len(gaps) > 0:
+                gap_count += len(gaps)
+                messages.append(
+                    "{} gaps of more than {} s in {} datagrams (longest "
+                    "{:.1f} s)".format(
+                        len(gaps), max_gap, datagram_type, gaps[:, 1].max()))
+            elif len(self.scan.get_time_stamps(datagram_type)) == 0:
+                messages.append(
+                    "No {} datagrams found".format(datagram_type))
+
+        self._output = QaJsonOutputs(
+            execution=None,
+            files=None,
+            count=gap_count,
+            percentage=None,
+            message="; ".join(messages) if messages else None,
+            qa_pass="yes" if gap_count == 0 else "no"
+        )
+
+
+class PingRateStabilityCheck(ScanCheck):
+    """Checks the ping rate is stable: the percentage of the intervals between
+    pings that are longer than `max_interval_ratio` times the median interval
+    (drop-outs) must not exceed `max_dropout_percentage`. Computed over the
+    time series recorded by the scan, without reading the file again.
+    """
+    id = '8491e960-8988-4332-8c05-c1e5b30f4eb6'
+    name = "Ping Rate Stability"
+    version = '1'
+    default_params = [
+        QaJsonParam(name='max_interval_ratio', value=2.0),
+        QaJsonParam(name='max_dropout_percentage', value=1.0)
+    ]
+    time_series = True
+
+    def __init__(self, scan: Scan, params):
+        ScanCheck.__init__(self, scan, params)
+
+    def run_check(self):
+        ratio_param = self.get_param('max_interval_ratio')
+        percentage_param = self.get_param('max_dropout_percentage')
+        max_interval_ratio = (
+            self.default_params[0].value if ratio_param is None
+            else ratio_param.value)
+        max_dropout_percentage = (
+            self.default_params[1].value if percentage_param is None
+            else percentage_param.value)
+
+        dropouts = self.scan.get_ping_dropouts(max_interval_ratio)
+        if dropouts is None:
+            raise RuntimeError("Time series was not recorded by the scan")
+
+        interval_count = sum(d[0] for d in dropouts.values())
+        dropout_count = sum(d[1] for d in dropouts.values())
+        percentage = (
+            None if interval_count == 0
+            else 100.0 * dropout_count / interval_count)
+
+        msg = None
+        if percentage is None:
+            passed = False
+            msg = "Not enough pings to compute the ping rate"
+        else:
+            passed = percentage <= max_dropout_percentage
+            if not passed:
+                msg = (
+                    "{} of {} ping intervals are more than {} times the "
+                    "median interval".format(
+                        dropout_count, interval_count, max_interval_ratio))
+
+        self._output = QaJsonOutputs(
+            execution=None,
+            files=None,
+            count=dropout_count,
+            percentage=percentage,
+            message=msg,
+            qa_pass="yes" if passed else "no"
+        )
+
+
+class TrackCheck(ScanCheck):
+    """Checks the track of the position fixes: the vessel must have covered
+    at least `min_track_length` metres, and never gone faster than
+    `max_speed` m/s between two fixes, which reveals position jumps. The
+    track is computed over the positions decoded by the scan, without
+    parsing the file again.
+    """
+    id = '511ffa72-d5ba-4a3e-81ff-a5d2218bd08f'
+    name = "Track"
+    version = '1'
+    default_params = [
+        QaJsonParam(name='min_track_length', value=100.0),
+        QaJsonParam(name='max_speed', value=10.0)
+    ]
+    time_series = True
+
+    def __init__(self, scan: Scan, params):
+        ScanCheck.__init__(self, scan, params)
+
+    def run_check(self):
+        length_param = self.get_param('min_track_length')
+        speed_param = self.get_param('max_speed')
+        min_track_length = (
+            self.default_params[0].value if length_param is None
+            else length_param.value)
+        max_speed = (
+            self.default_params[1].value if speed_param is None
+            else speed_param.value)
+
+        track = self.scan.get_track_summary()
+        if track is None:
+            raise RuntimeError("Positions were not recorded by the scan")
+
+        messages = []
+        if track['positionCount'] == 0:
+            messages.append("No positions found")
+        else:
+            messages.append(
+                "Track length {:.1f} m, line extent {:.1f} m, latitude "
+                "{:.6f} to {:.6f}, longitude {:.6f} to {:.6f}".format(
+                    track['trackLength'], track['lineExtent'],
+                    track['minLatitude'], track['maxLatitude'],
+                    track['minLongitude'], track['maxLongitude']))
+            if track['maxLoggedSpeed'] is not None:
+                messages[-1] += ", logged speed up to {:.1f} m/s".format(
+                    track['maxLoggedSpeed'])
+            if track['trackLength'] < min_track_length:
+                messages.append(
+                    "Track length is less than {} m".format(
+                        min_track_length))
+            if track['maxSpeed'] is not None and \
+                    track['maxSpeed'] > max_speed:
+                messages.append(
+                    "Speed of {:.1f} m/s between positions is more than "
+                    "{} m/s".format(track['maxSpeed'], max_speed))
+        passed = len(messages) == 1 and track['positionCount'] > 0
+
+        self._output = QaJsonOutputs(
+            execution=None,
+            files=None,
+            count=track['positionCount'],
+            percentage=None,
+            message="; ".join(messages),
+            qa_pass="yes" if passed else "no"
+        )
@@ -0,0 +1,350 @@
+from array import array
+from typing import Iterable, List
+
+import numpy as np
+
+# type reported for a datagram truncated by the end of the file
+TRUNCATED = 'XXX'
+# datagram type codes are the type byte of the datagrams (0 - 255), plus one
+# code for the truncated datagrams, plus NAMED_CODES codes for the types
+# named by more than one character (eg; the KMALL '#MRZ'), given in the
+# order they are first seen
+TRUNCATED_CODE = 256
+NAMED_CODES = 256
+TYPE_CODES = TRUNCATED_CODE + 1 + NAMED_CODES
+
+_named_types = []
+_named_codes = {}
+
+
+def type_code(dg_type: str) -> int:
+    """ Returns the code of a datagram type: the value of its type byte,
+    `TRUNCATED_CODE` for a truncated datagram, or the code given to a named
+    type.
+
+    Raises:
+        ValueError: if there are more than `NAMED_CODES` named types
+    """
+    if len(dg_type) == 1:
+        return ord(dg_type)
+    if dg_type == TRUNCATED:
+        return TRUNCATED_CODE
+    code = _named_codes.get(dg_type)
+    if code is None:
+        if len(_named_types) == NAMED_CODES:
+            raise ValueError(
+                "Too many datagram types, {} not supported".format(dg_type))
+        code = TRUNCATED_CODE + 1 + len(_named_types)
+        _named_types.append(dg_type)
+        _named_codes[dg_type] = code
+    return code
+
+
+def type_name(code: int) -> str:
+    """ Returns the datagram type of a type code """
+    if code < TRUNCATED_CODE:
+        return chr(code)
+    if code == TRUNCATED_CODE:
+        return TRUNCATED
+    return _named_types[code - TRUNCATED_CODE - 1]
+
+
+class ScanResult:
+    """ Statistics of the datagrams of a scan, per datagram type.
+
+    Each statistic is a list indexed by the datagram type code (see
+    `type_code`), hence accumulating a datagram only indexes lists rather
+    than looking up nested dicts by strings. `to_dict` gives the dict of
+    per type dicts that used to be the `scan_result` of a `Scan`, and
+    `from_dict` reads it back.
+
+    With `record_ping_offsets` the offset of the end of the datagram at
+    which each ping is counted is also recorded, per ping type, in
+    `ping_offsets`. The pings of a type being in file order, the bytes of a
+    file containing a number of pings are then found without reading it
+    again (see `ScanALL.get_size_n_pings`).
+
+    The time-stamps of every datagram of the types of the `time_series`
+    codes are recorded in `times`, an `array('d')` per type, for the checks
+    on the time series (eg; the time gaps between position datagrams).
+    With `record_positions` the position fixes decoded from the position
+    datagrams are recorded in `positions`, for the checks on the track.
+    """
+
+    __slots__ = (
+        'byte_count', 'record_count', 'ping_count', 'missed_pings',
+        'start_time', 'stop_time', 'other', 'seq_no', 'first_counter',
+        'order', 'ping_offsets', 'first_ping_end', 'times', 'positions')
+
+    def __init__(
+            self, record_ping_offsets: bool = False,
+            time_series: Iterable[int] = (), record_positions: bool = False):
+        self.byte_count = [0] * TYPE_CODES
+        self.record_count = [0] * TYPE_CODES
+        self.ping_count = [0] * TYPE_CODES
+        self.missed_pings = [0] * TYPE_CODES
+        self.start_time = [None] * TYPE_CODES
+        self.stop_time = [None] * TYPE_CODES
+        # decoded content reported for some datagram types
+        self.other = [None] * TYPE_CODES
+        # counter of the last ping, None for types that are not pings
+        self.seq_no = [None] * TYPE_CODES
+        # counter of the first datagram of each type
+        self.first_counter = [None] * TYPE_CODES
+        # codes of the types found, in the order they were first found
+        self.order = []
+        # per ping type code, the end offsets of the datagrams at which the
+        # pings were counted (an array of unsigned 64 bit integers), and the
+        # end offset of the first datagram of the type. None if they are not
+        # recorded or unknown.
+        self.ping_offsets = {} if record_ping_offsets else None
+        self.first_ping_end = {} if record_ping_offsets else None
+        # per type code, the time-stamps of the datagrams of the types whose
+        # time series is recorded, otherwise None. None if no time series is
+        # recorded or they are unknown.
+        self.times = None
+        for code in time_series:
+            if self.times is None:
+                self.times = [None] * TYPE_CODES
+            self.times[code] = array('d')
+        # the position fixes in file order, as consecutive (time-stamp,
+        # latitude, longitude, speed) values. None if they are not recorded
+        # or unknown.
+        self.positions = array('d') if record_positions else None
+
+    def add(self, code: int, num_bytes: int, time_stamp: float,
+            counter: int):
+        """ Accumulates one datagram of type `code` """
+        if self.record_count[code] == 0:
+            self.order.append(code)
+            self.start_time[code] = time_stamp
+            self.first_counter[code] = counter
+        self.byte_count[code] += num_bytes
+        self.record_count[code] += 1
+        self.stop_time[code] = time_stamp
+        if self.times is not None:
+            times = self.times[code]
+            if times is not None:
+                times.append(time_stamp)
+
+    def add_ping(self, code: int, counter: int, end: int = None):
+        """ Accumulates the counter of one ping datagram of type `code`
+        ending at offset `end` of the file. A ping is counted when the
+        counter increases, and the counters skipped are counted as missed
+        pings.
+        """
+        last = self.seq_no[code]
+        if last is None:
+            if self.ping_offsets is not None:
+                self.ping_offsets[code] = array('Q')
+                self.first_ping_end[code] = end
+        elif counter - last >= 1:
+            self.missed_pings[code] += counter - last - 1
+            self.ping_count[code] += 1
+            if self.ping_offsets is not None:
+                self.ping_offsets[code].append(end)
+        self.seq_no[code] = counter
+
+    def add_position(
+            self, time_stamp: float, latitude: float, longitude: float,
+            speed: float):
+        """ Accumulates one position fix, in decimal degrees and metres per
+        second (NaN if not known).
+        """
+        self.positions.extend((time_stamp, latitude, longitude, speed))
+
+    def add_records(
+            self, code: int, num_bytes: int, record_count: int,
+            start_time: float, stop_time: float, first_counter: int,
+            times: array = None):
+        """ Accumulates `record_count` datagrams of type `code` at once.
+        `times` are their time-stamps, used if the time series of the type
+        is recorded.
+        """
+        if record_count == 0:
+            return
+        if self.times is not None and self.times[code] is not None:
+            self.times[code].extend(times)
+        if self.record_count[code] == 0:
+            self.order.append(code)
+            self.start_time[code] = start_time
+            self.first_counter[code] = first_counter
+        self.byte_count[code] += num_bytes
+        self.record_count[code] += record_count
+        self.stop_time[code] = stop_time
+
+    def add_pings(
+            self, code: int, ping_count: int, missed_pings: int,
+            last_counter: int, ping_ends: array = None,
+            first_end: int = None):
+        """ Accumulates the pings counted over several datagrams of type
+        `code`, the last one having counter `last_counter`. `ping_ends` are
+        the end offsets of the datagrams at which the pings were counted and
+        `first_end` the one of the first datagram, when offsets are recorded.
+        """
+        if self.ping_offsets is not None:
+            if self.seq_no[code] is None:
+                self.ping_offsets[code] = array('Q')
+                self.first_ping_end[code] = first_end
+            self.ping_offsets[code].extend(ping_ends)
+        self.ping_count[code] += ping_count
+        self.missed_pings[code] += missed_pings
+        self.seq_no[code] = last_counter
+
+    def merge(self, result: 'ScanResult', first_other: Iterable[int] = ()):
+        """ Accumulates the result of the datagrams following the ones of
+        this result, eg; the result of the next byte range of a file.
+
+        Args:
+            result (ScanResult): result of the following datagrams
+            first_other (iterable): codes of the types for which the first
+                `other` is reported, for the others the last one is.
+        """
+        if result.ping_offsets is None and len(result) > 0:
+            # the pings of the following datagrams are not located
+            self.ping_offsets = None
+            self.first_ping_end = None
+        if result.times is None and len(result) > 0:
+            # nor are their time-stamps known
+            self.times = None
+        if result.positions is None:
+            if len(result) > 0:
+                self.positions = None
+        elif self.positions is not None:
+            self.positions.extend(result.positions)
+        offsets = self.ping_offsets
+        for code in result.order:
+            if self.times is not None and self.times[code] is not None:
+                self.times[code].extend(result.times[code])
+            if self.record_count[code] == 0:
+                self.order.append(code)
+                self.byte_count[code] = result.byte_count[code]
+                self.record_count[code] = result.record_count[code]
+                self.ping_count[code] = result.ping_count[code]
+                self.missed_pings[code] = result.missed_pings[code]
+                self.start_time[code] = result.start_time[code]
+                self.stop_time[code] = result.stop_time[code]
+                self.other[code] = result.other[code]
+                self.seq_no[code] = result.seq_no[code]
+                self.first_counter[code] = result.first_counter[code]
+                if offsets is not None and code in result.ping_offsets:
+                    offsets[code] = array('Q', result.ping_offsets[code])
+                    self.first_ping_end[code] = result.first_ping_end[code]
+                continue
+            self.byte_count[code] += result.byte_count[code]
+            self.record_count[code] += result.record_count[code]
+            self.ping_count[code] += result.ping_count[code]
+            self.missed_pings[code] += result.missed_pings[code]
+            self.stop_time[code] = result.stop_time[code]
+            if code not in first_other:
+                self.other[code] = result.other[code]
+            if self.seq_no[code] is not None:
+                # the pings across the boundary between the two results
+                self.add_ping(
+                    code, result.first_counter[code],
+                    None if offsets is None else result.first_ping_end[code])
+                self.seq_no[code] = result.seq_no[code]
+                if offsets is not None:
+                    offsets[code].extend(result.ping_offsets[code])
+
+    def remove(self, dg_type: str):
+        """ Removes the statistics of a datagram type """
+        code = type_code(dg_type)
+        if self.record_count[code] == 0:
+            return
+        self.order.remove(code)
+        self.byte_count[code] = 0
+        self.record_count[code] = 0
+        self.ping_count[code] = 0
+        self.missed_pings[code] = 0
+        self.start_time[code] = None
+        self.stop_time[code] = None
+        self.other[code] = None
+        self.seq_no[code] = None
+        self.first_counter[code] = None
+        if self.ping_offsets is not None:
+            self.ping_offsets.pop(code, None)
+            self.first_ping_end.pop(code, None)
+        if self.times is not None and self.times[code] is not None:
+            self.times[code] = array('d')
+
+    def types(self) -> List[str]:
+        """ Returns the datagram types found, in the order they were found """
+        return [type_name(code) for code in self.order]
+
+    def __contains__(self, dg_type: str) -> bool:
+        return self.record_count[type_code(dg_type)] > 0
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def get(self, dg_type: str) -> dict:
+        """ Returns the statistics of a datagram type as a dict, in the
+        shape of the `scan_result` entries, or None if there is none.
+        """
+        code = type_code(dg_type)
+        if self.record_count[code] == 0:
+            return None
+        return self._info(code)
+
+    def _info(self, code: int) -> dict:
+        return {
+            'byteCount': self.byte_count[code],
+            'recordCount': self.record_count[code],
+            'pingCount': self.ping_count[code],
+            'missedPings': self.missed_pings[code],
+            'startTime': self.start_time[code],
+            'stopTime': self.stop_time[code],
+            'other': self.other[code],
+            '_seqNo': self.seq_no[code],
+        }
+
+    def to_dict(self) -> dict:
+        """ Returns the statistics of all the datagram types as a dict of
+        per type dicts, the `scan_result` of a `Scan`.
+        """
+        return {type_name(code): self._info(code) for code in self.order}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'ScanResult':
+        """ Reads back the result of `to_dict`. The counters of the first
+        datagrams, the ping offsets, the time series and the positions are
+        not part of the dict and are left unknown.
+        """
+        result = cls()
+        for dg_type, info in d.items():
+            code = type_code(dg_type)
+            result.order.append(code)
+            result.byte_count[code] = info['byteCount']
+            result.record_count[code] = info['recordCount']
+            result.ping_count[code] = info['pingCount']
+            result.missed_pings[code] = info['missedPings']
+            result.start_time[code] = info['startTime']
+            result.stop_time[code] = info['stopTime']
+            result.other[code] = info['other']
+            result.seq_no[code] = info.get('_seqNo')
+        return result
+
+
+def result_columns(
+        results: List[ScanResult], statistic: str,
+        dg_types: Iterable[str]) -> np.ndarray:
+    """ Gathers a statistic of several datagram types across many results,
+    column by column, eg; the `ping_count` of each type of ping datagram
+    across the scans of a survey.
+
+    Args:
+        results (list): results to gather the statistic of
+        statistic (str): name of the per type statistic, one of
+            `byte_count`, `record_count`, `ping_count` and `missed_pings`
+        dg_types (iterable): datagram types to gather the statistic of
+
+    Returns:
+        NumPy array with a row per result and a column per datagram type
+    """
+    codes = [type_code(dg_type) for dg_type in dg_types]
+    columns = np.empty((len(results), len(codes)), dtype=np.int64)
+    for row, result in enumerate(results):
+        values = getattr(result, statistic)
+        columns[row] = [values[code] for code in codes]
+    return columns
@@ -1,31 +1,41 @@
+from typing import TYPE_CHECKING
+
+from hyo2.mate.lib.check_registry import registry
 from hyo2.mate.lib.scan import Scan
-from hyo2.mate.lib.scan_check import ScanCheck, FilenameChangedCheck, \
-    DateChangedCheck, BathymetryAvailableCheck, BackscatterAvailableCheck, \
-    RayTracingCheck, MinimumPingCheck, EllipsoidHeightAvailableCheck, \
-    PuStatusCheck
 from hyo2.mate.lib.scan_ALL import ScanALL
+from hyo2.mate.lib.scan_KMALL import ScanKMALL
+from hyo2.mate.lib.scan_WCD import ScanWCD
+
+if TYPE_CHECKING:
+    from hyo2.mate.lib.scan_check import ScanCheck
 
 
-# List of all check implementations
-all_checks = [
-    BackscatterAvailableCheck,
-    BathymetryAvailableCheck,
-    DateChangedCheck,
-    EllipsoidHeightAvailableCheck,
-    FilenameChangedCheck,
-    MinimumPingCheck,
-    PuStatusCheck,
-    RayTracingCheck,
-]
+def __getattr__(name):
+    # the list of all check implementations, imported on first use (module
+    # __getattr__ requires Python 3.7)
+    if name == 'all_checks':
+        return registry.checks()
+    raise AttributeError(
+        "module {} has no attribute {}".format(__name__, name))
 
 
-def get_scan(path: str, file_type: str) -> Scan:
+def get_scan(
+        path: str, file_type: str, engine: str = None,
+        buffer_size: int = None, time_series: bool = False) -> Scan:
     """Factory method to return a new Scan instance for the given file type.
 
     Args:
         path (str): Path to the file that will be read by the `Scan`
-        file_type (str): Type of file to scan. Currently only `all` files are
-            supported.
+        file_type (str): Type of file to scan. Currently `all`, `wcd` and
+            `kmall` files are supported.
+        engine (str): Engine used by the `Scan` to walk the datagrams of the
+            file (eg; `file` or `mmap`). Optional, the scanner default is
+            used if not given.
+        buffer_size (int): Size in bytes of the buffer the file is read
+            through. Optional, the default buffer size is used if not given.
+        time_series (bool): Record the time series and the position fixes
+            of the file while scanning, for the checks reading them (see
+            `ScanCheck.time_series`). Optional, not recorded by default.
 
     Returns:
         New `Scan` instance
@@ -33,16 +43,44 @@ def get_scan(path: str, file_type: str) -> Scan:
     Raises:
         NotImplementedError: if `file_type` is not supported
     """
-    if (file_type.lower() == 'all'):
-        return ScanALL(path)
+    scan_classes = {'all': ScanALL, 'wcd': ScanWCD, 'kmall': ScanKMALL}
+    scan_class = scan_classes.get(file_type.lower())
+    if scan_class is not None:
+        kwargs = {}
+        if engine is not None:
+            kwargs['engine'] = engine
+        if buffer_size is not None:
+            kwargs['buffer_size'] = buffer_size
+        scan = scan_class(path, **kwargs)
+        if time_series:
+            scan.record_time_series = True
+            scan.record_positions = True
+            scan.result = scan._new_result()
+        return scan
     else:
         raise NotImplementedError(
             "File type {} is not supported".format(file_type))
 
 
+def get_check_class(id: str, version: str) -> type:
+    """Returns the ScanCheck class for the given id and version.
+
+    Args:
+        id (str): UUID for the check
+        version (str): Version of the check to return
+
+    Returns:
+        `ScanCheck` subclass
+
+    Raises:
+        NotImplementedError: if check with `id` and `version` is not found
+    """
+    return registry.get(id, version)
+
+
 def get_check(
     id: str, version: str, scan: Scan, params: list
-) -> ScanCheck:
+) -> 'ScanCheck':
     """Factory method to return a new ScanCheck instance for the given id and
     version.
 
@@ -59,14 +97,7 @@ def get_check(
     Raises:
         NotImplementedError: if check with `id` and `version` is not found
     """
-    for check in all_checks:
-        if id == check.id and version == check.version:
-            return check(scan, params)
-
-    raise NotImplementedError(
-        "Check with id {} and version {} could not be found".format(
-            id, version
-        ))
+    return get_check_class(id, version)(scan, params)
 
 
 def is_check_supported(id: str, version: str) -> bool:
@@ -79,7 +110,4 @@ def is_check_supported(id: str, version: str) -> bool:
     Returns:
         True if the check is supported (eg; it exists), otherwise false.
     """
-    for check in all_checks:
-        if id == check.id and version == check.version:
-            return True
-    return False
+    return (id, version) in registry
@@ -0,0 +1,375 @@
+from functools import lru_cache
+import struct
+import time
+from datetime import datetime, timezone
+from typing import Iterable, List, Tuple, Union
+
+# datagram types counted as pings by ScanALL and ScanWCD
+PING_DATAGRAMS = ['D', 'X', 'F', 'f', 'N', 'S', 'Y', 'k']
+
+# (datagram type, body size in bytes, written every n pings). The bodies of
+# the I, P, h and 1 datagrams are encoded (and padded to the body size if
+# shorter), the others are zeroed.
+DEFAULT_MIX = [
+    ('X', 6000, 1),     # XYZ 88
+    ('N', 3500, 1),     # raw range and angle 78
+    ('Y', 10000, 1),    # seabed image 89
+    ('A', 1200, 1),     # attitude
+    ('n', 600, 1),      # network attitude velocity
+    ('P', 100, 1),      # position
+    ('h', 20, 1),       # height
+    ('1', 80, 10),      # PU status
+    ('G', 2000, 10),    # surface sound speed
+    ('R', 100, 50),     # runtime parameters
+    ('U', 3000, 500),   # sound speed profile
+]
+
+# mix of the datagrams found in older files: depth, raw range and seabed
+# image datagrams of the first generation
+LEGACY_MIX = [
+    ('D', 4000, 1),
+    ('F', 3000, 1),
+    ('f', 3000, 1),
+    ('S', 8000, 1),
+    ('A', 1200, 1),
+    ('P', 100, 1),
+    ('h', 20, 1),
+    ('1', 80, 10),
+    ('R', 100, 50),
+]
+
+# mix of a water-column (.wcd) file: a large water-column datagram per ping
+WCD_MIX = [
+    ('k', 200000, 1),
+    ('R', 100, 50),
+]
+
+_header = struct.Struct('<LBBHLLHH')
+_header_fields = struct.Struct('<BHLLHH')
+_position = struct.Struct('<llHHHHBB')
+_pu_status = struct.Struct('<2H6L5bBH3h')
+_height = struct.Struct('<lB')
+
+STX = 0x02
+ETX = 0x03
+
+# kinds of damage of a corrupt datagram: wrong STX and ETX, a length that
+# spans the following datagram too (the walk of the datagrams skips it) or
+# two fake datagrams overlapping the body (a false datagram boundary when
+# looking for one)
+CORRUPT_MARKERS = 'markers'
+CORRUPT_LENGTH = 'length'
+CORRUPT_FAKE_HEADERS = 'fake_headers'
+CORRUPTIONS = [CORRUPT_MARKERS, CORRUPT_LENGTH, CORRUPT_FAKE_HEADERS]
+
+
+@lru_cache(maxsize=None)
+def _record_date(days: int) -> int:
+    day = time.gmtime(days * 86400)
+    return day.tm_year * 10000 + day.tm_mon * 100 + day.tm_mday
+
+
+def record_date_time(time_stamp: float) -> Tuple[int, int]:
+    """ Converts a time-stamp (seconds from the UNIX epoch) to the YYYYMMDD
+    date and milliseconds since midnight of a datagram header.
+    """
+    days, ms = divmod(int(round(time_stamp * 1000)), 86400000)
+    return _record_date(days), ms
+
+
+def installation_body(parameters: dict, serial: int = 0) -> bytes:
+    """ Body of an installation (I) datagram: the serial number of the second
+    sonar head followed by the comma separated parameters.
+    """
+    text = ''.join(
+        '{}={},'.format(name, value) for name, value in parameters.items())
+    return struct.pack('<H', serial) + text.encode('ascii') + b'\x00'
+
+
+def position_body(
+        latitude: float, longitude: float, speed: float = 0.0,
+        course: float = 0.0, heading: float = 0.0,
+        descriptor: int = 0x81) -> bytes:
+    """ Body of a position (P) datagram, without input datagram. The
+    position system `descriptor` defaults to the active system 1.
+    """
+    return _position.pack(
+        int(round(latitude * 2e7)), int(round(longitude * 1e7)),
+        0, int(round(speed * 100)), int(round(course * 100)) % 36000,
+        int(round(heading * 100)) % 36000, descriptor, 0)
+
+
+def pu_status_body(sensor_status: Iterable[int] = (1, 0, 0, 0, 0)) -> bytes:
+    """ Body of a PU status (1) datagram; `sensor_status` are the last five
+    fields, the ones ScanALL reports.
+    """
+    return _pu_status.pack(*([0] * 13 + list(sensor_status)))
+
+
+def height_body(height: float, height_type: int = 0) -> bytes:
+    """ Body of a height (h) datagram, the height in metres """
+    return _height.pack(int(round(height * 100)), height_type)
+
+
+class SynthALLWriter:
+    """ Writes datagrams to a .all file through a buffer that is written to
+    disk in chunks of `chunk_size` bytes.
+
+    Each datagram is encoded into a template per datagram type and body, so
+    only the fields of the header that change (date, time and counter) and
+    the checksum are packed for every datagram.
+    """
+
+    chunk_size = 8 * 1024 * 1024
+
+    def __init__(self, path: str, model: int = 122, serial: int = 100):
+        """ `SynthALLWriter` constructor
+
+        Args:
+            path (str): path of the file, replaced if it exists
+            model (int): EM model number written in the headers
+            serial (int): system serial number written in the headers
+        """
+        self.path = path
+        self.model = model
+        self.serial = serial
+        self.bytes_written = 0
+        # datagrams a scanner walking the file finds, a datagram spanned by
+        # a `CORRUPT_LENGTH` one is not counted
+        self.datagram_count = 0
+        self._file = open(path, 'wb', buffering=0)
+        self._buffer = bytearray()
+        self._templates = {}
+        # offset in the buffer of the datagram whose length spans the next
+        # datagram, see `write`
+        self._spanning_length = None
+
+    def _template(self, dg_type: str, body: bytes) -> Tuple[bytearray, int]:
+        """ Returns the datagram bytes with the given type and body, to be
+        completed with the header fields and checksum, and the sum of the
+        bytes of the body. The last template of each type is reused.
+        """
+        template = self._templates.get(dg_type)
+        if template is None or template[0] != body:
+            # the length excludes its own 4 bytes and includes the ETX and
+            # checksum
+            length = _header.size - 4 + len(body) + 3
+            data = bytearray(_header.pack(
+                length, STX, ord(dg_type), self.model, 0, 0, 0, self.serial))
+            data += body + bytes([ETX, 0, 0])
+            template = (body, data, sum(body))
+            self._templates[dg_type] = template
+        return template[1], template[2]
+
+    def write(
+            self, dg_type: str, body: bytes, counter: int, time_stamp: float,
+            corrupt: Union[bool, str] = False):
+        """ Writes one datagram.
+
+        Args:
+            dg_type (str): datagram type
+            body (bytes): datagram body, what follows the common header
+            counter (int): ping or datagram counter
+            time_stamp (float): seconds from the UNIX epoch
+            corrupt (bool or str): write the datagram damaged, keeping its
+                size in the file, in one of the `CORRUPTIONS` ways. True is
+                `CORRUPT_MARKERS`: a wrong STX and ETX.
+                `CORRUPT_LENGTH` writes a length spanning the next datagram
+                written as well, `CORRUPT_FAKE_HEADERS` two datagrams in
+                the middle of the body, which must hold them (46 bytes).
+        """
+        data, body_sum = self._template(dg_type, body)
+        record_date, record_time = record_date_time(time_stamp)
+        _header_fields.pack_into(
+            data, 5, ord(dg_type), self.model, record_date, record_time,
+            counter & 0xFFFF, self.serial)
+        # the checksum is the sum of the bytes between the STX and ETX
+        checksum = (sum(data[5:_header.size]) + body_sum) & 0xFFFF
+        struct.pack_into('<H', data, len(data) - 2, checksum)
+        if corrupt:
+            data = self._corrupt(
+                bytearray(data), dg_type,
+                CORRUPT_MARKERS if corrupt is True else corrupt)
+        # a datagram spanned by the length of the previous one is part of it
+        # for a scanner walking the datagrams
+        if self._spanning_length is None:
+            self.datagram_count += 1
+        self._append(data, spanning=corrupt == CORRUPT_LENGTH)
+
+    def _corrupt(
+            self, data: bytearray, dg_type: str, corruption: str) -> bytes:
+        """ Returns the bytes of a datagram damaged as `write` does """
+        if corruption == CORRUPT_MARKERS:
+            data[4] = 0
+            data[-3] = 0
+        elif corruption == CORRUPT_LENGTH:
+            # the length is extended when the next datagram is written
+            pass
+        elif corruption == CORRUPT_FAKE_HEADERS:
+            fake = bytearray(_header.pack(
+                _header.size - 1, STX, ord(dg_type), self.model, 0, 0, 0,
+                self.serial)) + bytes([ETX, 0, 0])
+            fakes = fake + fake
+            start = (len(data) - len(fakes)) // 2
+            if start < _header.size:
+                raise ValueError(
+                    "Body of {} bytes too small for the fake datagrams"
+                    .format(len(data) - _header.size - 3))
+            data[start:start + len(fakes)] = fakes
+        else:
+            raise ValueError("Unknown corruption {}".format(corruption))
+        return data
+
+    def _append(self, data: bytes, spanning: bool = False):
+        """ Appends bytes to the buffer. With `spanning`, the length of the
+        datagram of `data` is extended to span the bytes appended next.
+        """
+        if self._spanning_length is not None:
+            length = struct.unpack_from(
+                '<L', self._buffer, self._spanning_length)[0]
+            struct.pack_into(
+                '<L', self._buffer, self._spanning_length,
+                length + len(data))
+            self._spanning_length = None
+        if spanning:
+            self._spanning_length = len(self._buffer)
+        self._buffer += data
+        self.bytes_written += len(data)
+        # the buffer is kept until the spanning length is known
+        if len(self._buffer) >= self.chunk_size and \
+                self._spanning_length is None:
+            self.flush()
+
+    def flush(self):
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_synthetic_all(
+        path: str,
+        size: int = None,
+        pings: int = None,
+        mix: List[Tuple[str, int, int]] = None,
+        start: datetime = None,
+        ping_rate: float = 1.0,
+        missed_pings: Iterable[int] = (),
+        corrupt_pings: Iterable[int] = (),
+        corruption: str = CORRUPT_MARKERS,
+        truncate: int = 0,
+        file_name: str = None,
+        start_latitude: float = -42.0,
+        start_longitude: float = 147.0,
+        model: int = 122,
+        serial: int = 100) -> dict:
+    """ Writes a synthetic .all file: an installation datagram followed by
+    ping cycles, each cycle writing the datagrams of the mix due for that
+    ping, and a closing installation datagram.
+
+    Args:
+        path (str): path of the file to write
+        size (int): approximate size of the file in bytes, the generation
+            stops after the first ping cycle reaching it
+        pings (int): number of ping cycles, used if `size` is not given
+        mix (list): (datagram type, body size, every n pings) tuples,
+            defaults to `DEFAULT_MIX`
+        start (datetime): time of the first ping, defaults to the time of
+            the bundled test file 0243
+        ping_rate (float): ping cycles per second
+        missed_pings (iterable): ping cycles for which the ping datagrams
+            are not written, while their counter still advances
+        corrupt_pings (iterable): ping cycles for which the first datagram
+            is written damaged
+        corruption (str): how the datagrams of `corrupt_pings` are
+            damaged, one of `CORRUPTIONS` (see `SynthALLWriter.write`)
+        truncate (int): number of bytes removed from the end of the last
+            datagram
+        file_name (str): RFN parameter of the installation datagrams,
+            defaults to the name of `path`
+        start_latitude (float): latitude of the first position, the vessel
+            heads north at about 5 knots
+        start_longitude (float): longitude of all the positions
+        model (int): EM model number
+        serial (int): system serial number
+
+    Returns:
+        Dict with the number of `datagrams` a scan of the file finds (a
+        datagram spanned by a `CORRUPT_LENGTH` one is not counted), the
+        `pings` cycles written, the `bytes` of the file, and the ping cycles
+        `missed` and `corrupted`.
+    """
+    if size is None and pings is None:
+        raise ValueError("Either size or pings must be given")
+    mix = DEFAULT_MIX if mix is None else mix
+    if start is None:
+        start = datetime(2015, 2, 7, 4, 43, 56, tzinfo=timezone.utc)
+    elif start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    start_time = start.timestamp()
+    if file_name is None:
+        file_name = path.replace('\\', '/').split('/')[-1]
+    missed_pings = set(missed_pings)
+    corrupt_pings = set(corrupt_pings)
+
+    installation = installation_body({
+        'WLZ': '0.500', 'SMH': str(model), 'DSV': '3.1.4 120508',
+        'OSV': 'SIS 3.9.2', 'RFN': file_name,
+    })
+    bodies = {dg_type: bytes(body_size) for dg_type, body_size, _ in mix}
+    counters = {dg_type: 0 for dg_type, _, _ in mix}
+
+    def body(dg_type, ping, time_stamp):
+        if dg_type == 'P':
+            encoded = position_body(
+                start_latitude + ping * 2.5 / 111120.0 / ping_rate,
+                start_longitude, speed=2.5, course=0.0, heading=0.0)
+        elif dg_type == 'h':
+            encoded = height_body(20.0 + (ping % 100) / 100.0)
+        elif dg_type == '1':
+            encoded = pu_status_body()
+        else:
+            return bodies[dg_type]
+        padding = len(bodies[dg_type]) - len(encoded)
+        return encoded + bytes(padding) if padding > 0 else encoded
+
+    ping = 0
+    with SynthALLWriter(path, model=model, serial=serial) as writer:
+        writer.write('I', installation, 0, start_time)
+        while ((size is not None and writer.bytes_written < size) or
+               (size is None and ping < pings)):
+            time_stamp = start_time + ping / ping_rate
+            corrupt = corruption if ping in corrupt_pings else False
+            for dg_type, _, every in mix:
+                if ping % every != 0:
+                    continue
+                counter = counters[dg_type]
+                counters[dg_type] += 1
+                if dg_type in PING_DATAGRAMS and ping in missed_pings:
+                    continue
+                writer.write(
+                    dg_type, body(dg_type, ping, time_stamp), counter,
+                    time_stamp, corrupt=corrupt)
+                corrupt = False
+            ping += 1
+        writer.write('I', installation, 1, start_time + ping / ping_rate)
+        writer.flush()
+        if truncate > 0:
+            writer._file.truncate(writer.bytes_written - truncate)
+            writer.bytes_written -= truncate
+
+    return {
+        'datagrams': writer.datagram_count,
+        'pings': ping,
+        'bytes': writer.bytes_written,
+        'missed': sorted(p for p in missed_pings if p < ping),
+        'corrupted': sorted(p for p in corrupt_pings if p < ping),
+    }
@@ -19,12 +19,18 @@ class MateQaxPlugin(QaxCheckToolPlugin):
             group="Raw Files",
             icon="kng.png"
         ),
-        # QaxFileType(
-        #     name="Kongsberg raw sonar files",
-        #     extension="wcd",
-        #     group="Raw Files",
-        #     icon="kng.png"
-        # )
+        QaxFileType(
+            name="Kongsberg raw sonar files",
+            extension="wcd",
+            group="Raw Files",
+            icon="kng.png"
+        ),
+        QaxFileType(
+            name="Kongsberg raw sonar files",
+            extension="kmall",
+            group="Raw Files",
+            icon="kng.png"
+        ),
     ]
 
     def __init__(self):
@@ -34,6 +40,10 @@ class MateQaxPlugin(QaxCheckToolPlugin):
         self._check_references = self._build_check_references()
         self.stopped = False
         self.check_runner = None
+        # reuse the scan results of unchanged files from previous runs,
+        # set refresh_scan_cache to scan them again
+        self.use_scan_cache = True
+        self.refresh_scan_cache = False
 
     def _build_check_references(self) -> List[QaxCheckReference]:
         data_level = "raw_data"
@@ -74,7 +84,10 @@ class MateQaxPlugin(QaxCheckToolPlugin):
         # to_dict function to generate it.
         rawdatachecks = qajson.qa.raw_data.to_dict()['checks']
 
-        self.check_runner = CheckRunner(rawdatachecks)
+        self.check_runner = CheckRunner(
+            rawdatachecks,
+            use_scan_cache=self.use_scan_cache,
+            refresh_scan_cache=self.refresh_scan_cache)
         self.check_runner.initialize()
 
         # the check_runner callback accepts only a float, whereas the qax
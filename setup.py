@@ -52,8 +52,10 @@ setup(
     ],
     install_requires=[
         "hyo2.abc",
+        "jsonschema",
+        "numpy",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     entry_points={
         "gui_scripts": [
             # 'mate = hyo2.mate.gui:gui',
@@ -79,8 +81,8 @@ setup(
         'Operating System :: OS Independent',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
         'Topic :: Scientific/Engineering :: GIS',
         'Topic :: Office/Business :: Office Suites',
     ],
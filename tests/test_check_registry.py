@@ -0,0 +1,129 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import pytest
+
+from hyo2.mate.lib.check_registry import CheckRegistry, registry, \
+    _import_target
+from hyo2.mate.lib.scan_check import ScanCheck, BackscatterAvailableCheck
+
+
+class PluginCheck(ScanCheck):
+    id = '6f1c3d2e-0b5a-4c8e-9d7f-1a2b3c4d5e6f'
+    name = "Plugin check"
+    version = '2'
+
+
+class OtherPluginCheck(ScanCheck):
+    id = '6f1c3d2e-0b5a-4c8e-9d7f-1a2b3c4d5e6f'
+    name = "Other plugin check"
+    version = '3'
+
+
+class CollidingCheck(ScanCheck):
+    id = BackscatterAvailableCheck.id
+    name = "Colliding check"
+    version = BackscatterAvailableCheck.version
+
+
+plugin_checks = [PluginCheck, OtherPluginCheck]
+
+
+def entry_point(name, value):
+    # stands for an `importlib.metadata.EntryPoint`, which needs Python 3.8
+    ep = mock.Mock(value=value, load=lambda: _import_target(value))
+    # `name` is an argument of the Mock constructor, not an attribute
+    ep.name = name
+    return ep
+
+
+class TestMateCheckRegistry(unittest.TestCase):
+
+    def test_mate_checks(self):
+        # all the checks are imported and match the ids they are registered
+        # with, which are all different
+        keys = [(c.id, c.version) for c in registry.checks()]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(len(keys), 11)
+
+    def test_lazy(self):
+        checks = CheckRegistry(None)
+        checks.register_lazy('abc', '2', __name__ + ':PluginCheck')
+        self.assertIn(('abc', '2'), checks)
+        # the class does not have the id it was registered with
+        with pytest.raises(ValueError):
+            checks.get('abc', '2')
+        with pytest.raises(NotImplementedError):
+            checks.get('abc', '1')
+
+    def test_collision(self):
+        checks = CheckRegistry(None)
+        checks.register(BackscatterAvailableCheck)
+        checks.register(BackscatterAvailableCheck)
+        with pytest.raises(ValueError):
+            checks.register(CollidingCheck)
+        with pytest.raises(ValueError):
+            checks.register_lazy(
+                CollidingCheck.id, CollidingCheck.version,
+                __name__ + ':CollidingCheck')
+
+    def test_entry_points(self):
+        entry_points = [
+            entry_point(
+                '{}/{}'.format(PluginCheck.id, PluginCheck.version),
+                __name__ + ':PluginCheck'),
+            entry_point('list', __name__ + ':plugin_checks'),
+            entry_point('colliding', __name__ + ':CollidingCheck'),
+            entry_point('missing', __name__ + ':MissingCheck'),
+        ]
+        with mock.patch(
+                'hyo2.mate.lib.check_registry._entry_points',
+                return_value=entry_points):
+            checks = CheckRegistry()
+            checks.register(BackscatterAvailableCheck)
+            # the entry points are only loaded when a check is not found
+            self.assertIs(
+                checks.get(
+                    BackscatterAvailableCheck.id,
+                    BackscatterAvailableCheck.version),
+                BackscatterAvailableCheck)
+            self.assertFalse(checks._entry_points_loaded)
+            self.assertIs(checks.get(PluginCheck.id, '2'), PluginCheck)
+            self.assertIs(checks.get(PluginCheck.id, '3'), OtherPluginCheck)
+            # the colliding and missing checks are ignored
+            self.assertEqual(
+                checks.checks(),
+                [BackscatterAvailableCheck, OtherPluginCheck, PluginCheck])
+
+    def test_register_module(self):
+        checks = CheckRegistry(None)
+        checks.register_module(__name__)
+        self.assertIn((PluginCheck.id, '2'), checks)
+        self.assertIs(checks.get(PluginCheck.id, '3'), OtherPluginCheck)
+        # the checks imported by the module, eg; BackscatterAvailableCheck,
+        # are not its checks
+        self.assertEqual(
+            checks.checks(), [CollidingCheck, OtherPluginCheck, PluginCheck])
+
+    def test_lazy_import(self):
+        # the checks are only imported when one is first looked up
+        code = (
+            "import sys\n"
+            "from hyo2.mate.lib.scan_utils import is_check_supported\n"
+            "print('hyo2.mate.lib.scan_check' in sys.modules)\n"
+            "assert is_check_supported("
+            "'7761e08b-1380-46fa-a7eb-f1f41db38541', '1')\n")
+        output = subprocess.run(
+            [sys.executable, '-c', code], check=True, stdout=subprocess.PIPE,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        self.assertEqual(output.stdout.strip(), b'False')
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(TestMateCheckRegistry))
+    return s
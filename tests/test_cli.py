@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# modules the CLI only imports once it needs them
+lazy_modules = ['hyo2.mate.lib.check_runner', 'hyo2.mate.lib.scan_check',
+                'hyo2.qax', 'numpy']
+
+
+def imported_modules(code: str) -> list:
+    """ Runs `code` in a new interpreter and returns the names of the modules
+    imported by the end of it.
+    """
+    output = subprocess.run(
+        [sys.executable, '-c',
+         code + "\nimport json, sys\nprint(json.dumps(list(sys.modules)))"],
+        check=True, stdout=subprocess.PIPE,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    return json.loads(output.stdout.decode().splitlines()[-1])
+
+
+class TestMateCli(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_import(self):
+        # the import time is reported by benchmarks/bench_cli_startup.py, the
+        # test checks the modules the import time is saved on, which does
+        # not depend on the speed of the machine
+        modules = imported_modules('import hyo2.mate.app.cli')
+        self.assertIn('hyo2.mate.app.cli', modules)
+        for module in lazy_modules:
+            self.assertNotIn(module, modules)
+
+    def test_no_validate(self):
+        # assembling the output without validation imports neither the
+        # checks nor QAX
+        input_path = os.path.join(self.temp_dir, 'input.json')
+        with open(input_path, 'w') as f:
+            json.dump({"qa": {"raw_data": {"checks": []}}}, f)
+        stream_path = os.path.join(self.temp_dir, 'outputs.jsonl')
+        open(stream_path, 'w').close()
+        output_path = os.path.join(self.temp_dir, 'output.json')
+        modules = imported_modules(
+            "import sys\n"
+            "from hyo2.mate.app import cli\n"
+            "sys.argv = ['cli', '-i', {!r}, '-o', {!r}, '--no-validate', "
+            "'--assemble', {!r}]\n"
+            "cli.main()\n".format(input_path, output_path, stream_path))
+        for module in lazy_modules:
+            self.assertNotIn(module, modules)
+        with open(output_path) as f:
+            self.assertEqual(
+                json.load(f), {"qa": {"raw_data": {"checks": []}}})
+
+    def test_follow_output(self):
+        # the output of follow mode must go to a file
+        input_path = os.path.join(self.temp_dir, 'input.json')
+        with open(input_path, 'w') as f:
+            json.dump({"qa": {"raw_data": {"checks": []}}}, f)
+        process = subprocess.run(
+            [sys.executable, '-m', 'hyo2.mate.app.cli', '-i', input_path,
+             '--no-validate', '--follow'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        self.assertEqual(process.returncode, 2)
+        self.assertIn(b'--follow requires', process.stderr)
+        self.assertEqual(process.stdout, b'')
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateCli))
+    return s
@@ -0,0 +1,111 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from hyo2.mate.lib.metrics import Metrics, NULL_METRICS, TimedReader, \
+    CProfileHook, profile_path
+from hyo2.mate.lib.scan_ALL import ScanALL, ENGINE_MMAP
+
+TEST_FILE = "0243_P007_MBES_EM122_20150207_044356_Supporter_GA4430.all"
+
+
+class TestMateMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.test_file = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "test_data", TEST_FILE))
+
+    def test_merge(self):
+        metrics = Metrics()
+        metrics.add_time('scan', 1.0)
+        metrics.count('files_scanned')
+        metrics.add_check('id', 'check', 0.5)
+        total = Metrics()
+        total.merge(metrics.to_dict(), 'one.all')
+        total.merge(metrics.to_dict(), 'two.all')
+        self.assertEqual(total.timers['scan'], 2.0)
+        self.assertEqual(total.counters['files_scanned'], 2)
+        self.assertEqual(
+            total.checks['id'], {'name': 'check', 'count': 2, 'seconds': 1.0})
+        self.assertEqual(sorted(total.files), ['one.all', 'two.all'])
+
+    def test_null_metrics(self):
+        with NULL_METRICS.timer('scan'):
+            NULL_METRICS.count('files_scanned')
+            NULL_METRICS.add_check('id', 'check', 0.5)
+        self.assertEqual(NULL_METRICS.to_dict(), {
+            'timers': {}, 'counters': {}, 'datagrams': {}, 'checks': {}})
+
+    def test_timed_reader(self):
+        metrics = Metrics()
+        with open(self.test_file, 'rb') as f:
+            reader = TimedReader(f, metrics)
+            self.assertEqual(len(reader.read(16)), 16)
+            reader.seek(0)
+            self.assertEqual(reader.tell(), 0)
+        self.assertEqual(metrics.counters['read_calls'], 1)
+        self.assertIn('read', metrics.timers)
+
+    def test_scan(self):
+        reference = ScanALL(self.test_file)
+        reference.scan_datagram()
+        for engine in ScanALL.engines:
+            test = ScanALL(self.test_file, engine)
+            test.metrics = Metrics()
+            test.scan_datagram()
+            # the collection does not change the scan
+            self.assertEqual(test.scan_result, reference.scan_result)
+            self.assertEqual(
+                test.metrics.counters['bytes_scanned'], test.file_size)
+            self.assertEqual(
+                test.metrics.datagrams['Y'],
+                reference.scan_result['Y']['recordCount'])
+            self.assertIn('scan', test.metrics.timers)
+            self.assertIn('decode_I', test.metrics.timers)
+        # only the reads of the file engine are timed
+        test = ScanALL(self.test_file)
+        test.metrics = Metrics()
+        test.scan_datagram()
+        self.assertGreater(test.metrics.counters['read_calls'], 0)
+        self.assertIsInstance(test.reader, type(reference.reader))
+
+    def test_profile_hook(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # two files of the same name in different folders
+            filenames = [
+                os.path.join(temp_dir, folder, TEST_FILE)
+                for folder in ['a', 'b']]
+            hook = CProfileHook(os.path.join(temp_dir, 'profiles'))
+            for filename in filenames:
+                with hook(filename):
+                    pass
+            paths = [profile_path(hook.output_dir, f, 'prof')
+                     for f in filenames]
+            self.assertNotEqual(paths[0], paths[1])
+            for path in paths:
+                self.assertTrue(os.path.isfile(path))
+                self.assertTrue(
+                    os.path.basename(path).startswith(TEST_FILE + '.'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            test = ScanALL(self.test_file, ENGINE_MMAP)
+            test.metrics = Metrics()
+            test.scan_datagram()
+            path = os.path.join(temp_dir, 'metrics.json')
+            test.metrics.write(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), test.metrics.to_dict())
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateMetrics))
+    return s
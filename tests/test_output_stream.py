@@ -0,0 +1,92 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import pytest
+
+from hyo2.mate.lib.output_stream import OutputStream, assemble_output, \
+    build_check_index, find_check, read_output_stream
+
+checks = [
+    {
+        "info": {"id": "check-a", "name": "A", "version": "1"},
+        "inputs": {"files": [{"path": "one.all"}]}
+    },
+    {
+        "info": {"id": "check-a", "name": "A", "version": "1"},
+        "inputs": {"files": [{"path": "two.all"}]}
+    },
+    {
+        "info": {"id": "check-b", "name": "B", "version": "1"},
+        "inputs": {"files": [{"path": "one.all"}, {"path": "two.all"}]}
+    },
+]
+
+
+class TestMateOutputStream(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.stream_path = os.path.join(self.temp_dir, 'outputs.jsonl')
+        self.checks = copy.deepcopy(checks)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_find_check(self):
+        self.assertIs(
+            find_check(self.checks, 'check-a', 'two.all'), self.checks[1])
+        self.assertIs(
+            find_check(self.checks, 'check-b', 'two.all'), self.checks[2])
+        self.assertIsNone(find_check(self.checks, 'check-b', 'three.all'))
+
+    def test_build_check_index(self):
+        index = build_check_index(self.checks)
+        self.assertEqual(len(index), 4)
+        for (check_id, path), check in index.items():
+            self.assertIs(check, find_check(self.checks, check_id, path))
+
+    def test_write_read(self):
+        with OutputStream(self.stream_path) as stream:
+            stream.write('check-a', 'one.all', {'qa_pass': 'yes'})
+            # written to disk before the stream is closed
+            self.assertEqual(
+                len(list(read_output_stream(self.stream_path))), 1)
+            stream.write('check-b', 'one.all', {'qa_pass': 'no'})
+        lines = list(read_output_stream(self.stream_path))
+        self.assertEqual(
+            lines[1],
+            {'id': 'check-b', 'file': 'one.all', 'outputs': {'qa_pass': 'no'}})
+
+    def test_interrupted_stream(self):
+        with OutputStream(self.stream_path) as stream:
+            stream.write('check-a', 'one.all', {'qa_pass': 'yes'})
+        with open(self.stream_path, 'a') as f:
+            f.write('{"id": "check-a", "fi')
+        self.assertEqual(len(list(read_output_stream(self.stream_path))), 1)
+
+    def test_assemble_output(self):
+        with OutputStream(self.stream_path) as stream:
+            stream.write('check-a', 'two.all', {'qa_pass': 'no'})
+            stream.write('check-b', 'two.all', {'qa_pass': 'no'})
+            # last output of a check wins
+            stream.write('check-a', 'two.all', {'qa_pass': 'yes'})
+        assemble_output(self.checks, self.stream_path)
+        self.assertNotIn('outputs', self.checks[0])
+        self.assertEqual(self.checks[1]['outputs'], {'qa_pass': 'yes'})
+        self.assertEqual(self.checks[2]['outputs'], {'qa_pass': 'no'})
+
+    def test_assemble_unknown_check(self):
+        with OutputStream(self.stream_path) as stream:
+            stream.write('check-c', 'one.all', {'qa_pass': 'no'})
+        with pytest.raises(RuntimeError):
+            assemble_output(self.checks, self.stream_path)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(TestMateOutputStream))
+    return s
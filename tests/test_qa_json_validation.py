@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from hyo2.mate.lib.qa_json_validation import QaJsonValidator
+
+schema = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "type": "object",
+    "required": ["qa"],
+    "properties": {
+        "qa": {
+            "type": "object",
+            "required": ["version"],
+            "properties": {"version": {"type": "string"}}
+        }
+    }
+}
+
+
+class TestMateQaJsonValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.schema_path = self.write('schema.json', schema)
+        self.cache_path = os.path.join(self.temp_dir, 'cache', 'valid.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            json.dump(content, f)
+        return path
+
+    def test_validate_file(self):
+        validator = QaJsonValidator(self.schema_path)
+        valid = self.write('valid.json', {"qa": {"version": "0.1.3"}})
+        invalid = self.write('invalid.json', {"qa": {"version": 1}})
+        self.assertTrue(validator.validate_file(valid))
+        with self.assertLogs(level='ERROR'):
+            self.assertFalse(validator.validate_file(invalid))
+        self.assertEqual(
+            validator.errors({"qa": {}}),
+            ["qa: 'version' is a required property"])
+        # no cache is written without a path
+        self.assertFalse(os.path.exists(self.cache_path))
+
+    def test_cache(self):
+        valid = self.write('valid.json', {"qa": {"version": "0.1.3"}})
+        invalid = self.write('invalid.json', {"qa": {}})
+        validator = QaJsonValidator(self.schema_path, self.cache_path)
+        self.assertTrue(validator.validate_file(valid))
+        with self.assertLogs(level='ERROR'):
+            self.assertFalse(validator.validate_file(invalid))
+        # only the valid file is kept
+        with open(self.cache_path) as f:
+            self.assertEqual(len(json.load(f)), 1)
+
+        # a new validator finds the valid file in the cache, without
+        # building the validator of the schema
+        validator = QaJsonValidator(self.schema_path, self.cache_path)
+        with mock.patch.object(QaJsonValidator, 'errors') as errors:
+            self.assertTrue(validator.validate_file(valid))
+            errors.assert_not_called()
+        self.assertIsNone(validator._validator)
+        with self.assertLogs(level='ERROR'):
+            self.assertFalse(validator.validate_file(invalid))
+
+        # a change of the schema invalidates the cache
+        changed = dict(schema, required=["qa", "extra"])
+        self.write('schema.json', changed)
+        validator = QaJsonValidator(self.schema_path, self.cache_path)
+        with self.assertLogs(level='ERROR'):
+            self.assertFalse(validator.validate_file(valid))
+
+    def test_cache_entries(self):
+        validator = QaJsonValidator(self.schema_path, self.cache_path)
+        validator.max_entries = 2
+        paths = [
+            self.write('{}.json'.format(i), {"qa": {"version": str(i)}})
+            for i in range(3)]
+        for path in paths:
+            self.assertTrue(validator.validate_file(path))
+        with open(self.cache_path) as f:
+            self.assertEqual(len(json.load(f)), 2)
+        # an unreadable cache is ignored and replaced
+        with open(self.cache_path, 'w') as f:
+            f.write('{')
+        self.assertTrue(validator.validate_file(paths[0]))
+        with open(self.cache_path) as f:
+            self.assertEqual(len(json.load(f)), 1)
+
+    def test_unusable_cache(self):
+        # the folder of the cache is a file
+        folder = self.write('cache', {})
+        validator = QaJsonValidator(
+            self.schema_path, os.path.join(folder, 'valid.json'))
+        valid = self.write('valid.json', {"qa": {"version": "0.1.3"}})
+        with self.assertLogs(level='WARNING'):
+            self.assertTrue(validator.validate_file(valid))
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(
+            TestMateQaJsonValidation))
+    return s
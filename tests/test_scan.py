@@ -2,6 +2,9 @@ import unittest
 import os
 import pytest
 import time
+from datetime import datetime, timedelta
+from hyo2.mate.lib.scan import date_to_epoch, record_time_to_epoch, \
+    haversine
 from hyo2.mate.lib.scan_utils import get_scan
 
 TEST_FILE1 = "0200_MBES_EM122_20150203_010431_Supporter_GA4430.all"
@@ -21,13 +24,61 @@ class TestMateScan(unittest.TestCase):
         scan = get_scan(self.test_file, extension)
         self.assertEqual(type(scan).__name__, 'ScanALL')
 
+    def test_get_scan_all_engine(self):
+        scan = get_scan(self.test_file, 'all', 'mmap')
+        self.assertEqual(type(scan).__name__, 'ScanALL')
+        self.assertEqual(scan.engine, 'mmap')
+
+    def test_get_scan_wcd(self):
+        scan = get_scan(self.test_file, 'wcd')
+        self.assertEqual(type(scan).__name__, 'ScanWCD')
+
+    def test_get_scan_kmall(self):
+        scan = get_scan(self.test_file, 'kmall')
+        self.assertEqual(type(scan).__name__, 'ScanKMALL')
+
     def test_get_scan_unsupported(self):
         with pytest.raises(NotImplementedError):
             # following fn should raise a `NotImplementedError` when called
             get_scan('doesnotexist.something', 'unsupported_type')
 
 
+class TestMateScanTime(unittest.TestCase):
+
+    def test_date_to_epoch(self):
+        self.assertEqual(date_to_epoch(19700101), 0)
+        self.assertEqual(date_to_epoch(20150207), 1423267200)
+        with pytest.raises(ValueError):
+            date_to_epoch(20150230)
+
+    def test_record_time_to_epoch(self):
+        # must match the conversion of the date and time with datetime
+        for record_date, record_time in [
+                (20150203, 3871533), (20150207, 0), (20161231, 86399999)]:
+            expected = (datetime.strptime(str(record_date), '%Y%m%d')
+                        + timedelta(0, record_time / 1000.0)
+                        - datetime(1970, 1, 1)).total_seconds()
+            self.assertEqual(
+                record_time_to_epoch(record_date, record_time), expected)
+
+
+class TestMateScanTrack(unittest.TestCase):
+
+    def test_haversine(self):
+        # a minute of latitude is about a nautical mile
+        self.assertAlmostEqual(
+            haversine(-42.0, 147.0, -42.0 + 1 / 60, 147.0), 1853.25, 2)
+        self.assertEqual(haversine(-42.0, 147.0, -42.0, 147.0), 0.0)
+        # element by element, across the antimeridian
+        distances = haversine(
+            [0.0, 0.0], [179.5, 0.0], [0.0, 0.0], [-179.5, 0.0])
+        self.assertAlmostEqual(distances[0], 111195.1, 1)
+        self.assertEqual(distances[1], 0.0)
+
+
 def suite():
     s = unittest.TestSuite()
     s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateScan))
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateScanTime))
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateScanTrack))
     return s
@@ -1,8 +1,13 @@
 import unittest
 import os
+import shutil
+import tempfile
 import time
-from hyo2.mate.lib.scan_ALL import ScanALL
+from hyo2.mate.lib.scan_ALL import ScanALL, ENGINE_MMAP, ENGINE_INDEX, \
+    ENGINE_CHUNKED, ENGINE_BLOCK
 from hyo2.mate.lib import scan
+from hyo2.mate.lib.synth_ALL import write_synthetic_all, LEGACY_MIX, \
+    CORRUPT_LENGTH, CORRUPT_FAKE_HEADERS, SynthALLWriter, position_body
 
 TEST_FILE1 = "0200_MBES_EM122_20150203_010431_Supporter_GA4430.all"
 TEST_FILE = "0243_P007_MBES_EM122_20150207_044356_Supporter_GA4430.all"
@@ -67,7 +72,463 @@ class TestMateScanALL(unittest.TestCase):
                          scan.A_PASS)
 
 
+class TestMateScanALLMmap(unittest.TestCase):
+
+    def setUp(self):
+        self.test_files = [
+            os.path.abspath(os.path.join(
+                os.path.dirname(__file__), "test_data", f))
+            for f in [TEST_FILE, TEST_FILE1]
+        ]
+
+    def test_same_scan_result(self):
+        for test_file in self.test_files:
+            file_scan = ScanALL(test_file)
+            file_scan.scan_datagram()
+            mmap_scan = ScanALL(test_file, ENGINE_MMAP)
+            mmap_scan.scan_datagram()
+            self.assertEqual(mmap_scan.scan_result, file_scan.scan_result)
+
+    def test_progress(self):
+        progress = []
+        mmap_scan = ScanALL(self.test_files[0], ENGINE_MMAP)
+        mmap_scan.scan_datagram(progress.append)
+        self.assertGreater(len(progress), 0)
+        self.assertEqual(progress, sorted(progress))
+        self.assertLess(progress[-1], 1.0)
+
+    def test_index_same_scan_result(self):
+        for test_file in self.test_files:
+            file_scan = ScanALL(test_file)
+            file_scan.scan_datagram()
+            index_scan = ScanALL(test_file, ENGINE_INDEX)
+            index_scan.scan_datagram()
+            self.assertEqual(index_scan.scan_result, file_scan.scan_result)
+
+    def test_block_same_scan_result(self):
+        for test_file in self.test_files:
+            file_scan = ScanALL(test_file)
+            file_scan.scan_datagram()
+            # blocks smaller than some datagrams, and than the I datagram
+            for block_size in [100, 5000, 1024 * 1024]:
+                block_scan = ScanALL(test_file, ENGINE_BLOCK)
+                block_scan.block_size = block_size
+                block_scan.scan_datagram()
+                self.assertEqual(
+                    block_scan.scan_result, file_scan.scan_result)
+
+    def test_header_index(self):
+        test = ScanALL(self.test_files[0])
+        index = test.header_index
+        self.assertEqual(index[0]['offset'], 0)
+        self.assertEqual(
+            int(index[-1]['offset']) + int(index[-1]['numberOfBytes']) + 4,
+            test.file_size)
+        self.assertTrue(all(index['STX'] == 2))
+        test.scan_datagram()
+        self.assertEqual(
+            len(index), sum(
+                test.get_datagram_info(t)['recordCount']
+                for t in test.scan_result))
+
+    def test_required_datagrams(self):
+        full_scan = ScanALL(self.test_files[0])
+        full_scan.scan_datagram()
+        self.assertTrue(full_scan.scan_complete)
+        for engine in ScanALL.engines:
+            test = ScanALL(self.test_files[0], engine)
+            test.scan_datagram(required_datagrams=['I'])
+            self.assertFalse(test.scan_complete)
+            self.assertEqual(
+                test.get_datagram_info('I'), full_scan.get_datagram_info('I'))
+            self.assertEqual(
+                test.is_filename_changed(), full_scan.is_filename_changed())
+            self.assertEqual(test.is_date_match(), full_scan.is_date_match())
+            self.assertLess(
+                test.total_datagram_bytes(), full_scan.total_datagram_bytes())
+
+            # a missing datagram type requires the whole file
+            test.scan_datagram(required_datagrams=['I', 'D'])
+            self.assertTrue(test.scan_complete)
+            self.assertEqual(test.scan_result, full_scan.scan_result)
+
+    def test_time_converter(self):
+        class ZeroTimeScan(ScanALL):
+            time_converter = staticmethod(
+                lambda record_date, record_time: 0.0)
+
+        for engine in ScanALL.engines:
+            test = ScanALL(self.test_files[0], engine)
+            test.time_converter = lambda record_date, record_time: 0.0
+            test.scan_datagram()
+            self.assertEqual(test.get_datagram_info('I')['startTime'], 0.0)
+            test = ZeroTimeScan(self.test_files[0], engine)
+            test.scan_datagram()
+            self.assertEqual(test.get_datagram_info('I')['startTime'], 0.0)
+
+    def test_unsupported_engine(self):
+        with self.assertRaises(NotImplementedError):
+            ScanALL(self.test_files[0], 'unsupported_engine')
+
+
+class TestMateScanALLIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.source_file = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "test_data", TEST_FILE))
+        with open(self.source_file, 'rb') as f:
+            self.data = f.read()
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.temp_dir, TEST_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, size):
+        with open(self.test_file, 'ab') as f:
+            f.write(self.data[os.path.getsize(self.test_file):size])
+
+    def test_scan_new_data(self):
+        full_scan = ScanALL(self.source_file)
+        full_scan.scan_datagram()
+
+        self._write(1000)
+        test = ScanALL(self.test_file)
+        self.assertGreater(test.scan_new_data(), 0)
+        # the datagram being written is not reported
+        self.assertIsNone(test.get_datagram_info('XXX'))
+        for size in range(5000, len(self.data), 30011):
+            self._write(size)
+            test.scan_new_data()
+        self._write(len(self.data))
+        test.scan_new_data()
+        self.assertEqual(test.scan_new_data(), 0)
+        self.assertEqual(test.scan_result, full_scan.scan_result)
+
+    def test_resume_truncated_scan(self):
+        full_scan = ScanALL(self.source_file)
+        full_scan.scan_datagram()
+
+        self._write(100000)
+        test = ScanALL(self.test_file)
+        test.scan_datagram()
+        self.assertIsNotNone(test.get_datagram_info('XXX'))
+        self._write(len(self.data))
+        test.scan_new_data()
+        self.assertEqual(test.scan_result, full_scan.scan_result)
+
+
+class FalseBoundaryScanALL(ScanALL):
+    '''resyncs every byte range on its first byte, a false boundary'''
+
+    def _find_datagram(self, buf, start, stop):
+        return start
+
+
+class TestMateScanALLChunked(unittest.TestCase):
+
+    def setUp(self):
+        self.test_files = [
+            os.path.abspath(os.path.join(
+                os.path.dirname(__file__), "test_data", f))
+            for f in [TEST_FILE, TEST_FILE1]
+        ]
+
+    def test_same_scan_result(self):
+        for test_file in self.test_files:
+            file_scan = ScanALL(test_file)
+            file_scan.scan_datagram()
+            for chunk_size in [1000, 4096, 65536]:
+                chunked_scan = ScanALL(test_file, ENGINE_CHUNKED)
+                chunked_scan.chunk_size = chunk_size
+                chunked_scan.max_workers = 2
+                chunked_scan.scan_datagram()
+                self.assertEqual(
+                    chunked_scan.scan_result, file_scan.scan_result)
+
+    def test_find_datagram(self):
+        test = ScanALL(self.test_files[0])
+        offsets = test.header_index['offset']
+        with open(self.test_files[0], 'rb') as f:
+            buf = f.read()
+        for start in [1, 1000, 100000]:
+            expected = int(offsets[offsets >= start][0])
+            self.assertEqual(
+                test._find_datagram(buf, start, test.file_size), expected)
+
+    def test_false_boundary(self):
+        file_scan = ScanALL(self.test_files[0])
+        file_scan.scan_datagram()
+        chunked_scan = FalseBoundaryScanALL(self.test_files[0], ENGINE_CHUNKED)
+        chunked_scan.chunk_size = 10000
+        chunked_scan.max_workers = 2
+        chunked_scan.scan_datagram()
+        self.assertEqual(chunked_scan.scan_result, file_scan.scan_result)
+
+
+class TestMateScanALLSynthetic(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(
+            self.temp_dir, "0001_20150207_044356_Synthetic.all")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _scan(self, engine, record=True):
+        test = ScanALL(self.test_file, engine)
+        test.chunk_size = 100000
+        test.max_workers = 2
+        test.block_size = 4096
+        test.record_ping_offsets = record
+        test.record_time_series = record
+        test.record_positions = record
+        test.scan_datagram()
+        return test
+
+    def test_counts(self):
+        written = write_synthetic_all(
+            self.test_file, pings=300, missed_pings=[10, 11, 200])
+        test = self._scan(ENGINE_MMAP)
+        for dg_type in ['X', 'N', 'Y']:
+            info = test.get_datagram_info(dg_type)
+            self.assertEqual(info['recordCount'], 297)
+            self.assertEqual(info['missedPings'], 3)
+            self.assertEqual(info['pingCount'], 296)
+        self.assertEqual(test.get_datagram_info('P')['recordCount'], 300)
+        self.assertEqual(test.get_datagram_info('I')['recordCount'], 2)
+        self.assertEqual(
+            sum(info['recordCount'] for info in test.scan_result.values()),
+            written['datagrams'])
+        self.assertFalse(test.is_filename_changed())
+        self.assertTrue(test.is_date_match())
+        self.assertEqual(test.PU_status(), scan.A_PASS)
+
+    def test_same_scan_result(self):
+        for mix in [None, LEGACY_MIX]:
+            write_synthetic_all(
+                self.test_file, pings=400, mix=mix, missed_pings=[50],
+                corrupt_pings=[3, 150], truncate=11)
+            file_scan = self._scan(ScanALL.engines[0])
+            self.assertEqual(
+                file_scan.get_datagram_info('XXX')['recordCount'], 1)
+            for engine in ScanALL.engines[1:]:
+                self.assertEqual(
+                    self._scan(engine).scan_result, file_scan.scan_result)
+
+    def test_false_boundaries(self):
+        # a chunk boundary in the corrupt datagram of ping 3: a length
+        # spanning the next datagram, or fake datagrams in its body, make
+        # the datagram found from the boundary a false one
+        for corruption in [CORRUPT_LENGTH, CORRUPT_FAKE_HEADERS]:
+            written = write_synthetic_all(
+                self.test_file, pings=20, corrupt_pings=[3],
+                corruption=corruption)
+            mmap_scan = self._scan(ENGINE_MMAP)
+            self.assertEqual(
+                sum(info['recordCount']
+                    for info in mmap_scan.scan_result.values()),
+                written['datagrams'])
+            index = mmap_scan.header_index
+            corrupt = index[
+                (index['typeOfDatagram'] == ord('X')) &
+                (index['Counter'] == 3)][0]
+            boundary = int(corrupt['offset']) + 100
+            with open(self.test_file, 'rb') as f:
+                found = mmap_scan._find_datagram(
+                    f.read(), boundary, 2 * boundary)
+            self.assertIsNotNone(found)
+            self.assertNotIn(found, index['offset'].tolist())
+
+            test = ScanALL(self.test_file, ENGINE_CHUNKED)
+            test.chunk_size = boundary
+            test.max_workers = 2
+            test.scan_datagram()
+            self.assertEqual(test.scan_result, mmap_scan.scan_result)
+            for engine in ScanALL.engines:
+                self.assertEqual(
+                    self._scan(engine).scan_result, mmap_scan.scan_result)
+
+    def test_time_series(self):
+        write_synthetic_all(
+            self.test_file, pings=400, missed_pings=[50, 51, 52],
+            truncate=11)
+        file_scan = self._scan(ScanALL.engines[0])
+        position = file_scan.get_time_stamps('P')
+        self.assertEqual(len(position), 400)
+        self.assertEqual(len(file_scan.get_time_stamps('X')), 397)
+        self.assertEqual(len(file_scan.get_time_stamps('C')), 0)
+        self.assertIsNone(file_scan.get_time_stamps('I'))
+        gaps = file_scan.get_time_gaps('X', 2.0)
+        self.assertEqual(gaps.tolist(), [[position[49], 4.0]])
+        self.assertEqual(
+            file_scan.get_ping_dropouts(),
+            {'X': (396, 1), 'N': (396, 1), 'Y': (396, 1)})
+        for engine in ScanALL.engines[1:]:
+            test = self._scan(engine)
+            for dg_type in ScanALL.time_series_datagrams:
+                self.assertEqual(
+                    test.get_time_stamps(dg_type).tolist(),
+                    file_scan.get_time_stamps(dg_type).tolist())
+
+    def test_not_recorded(self):
+        write_synthetic_all(self.test_file, pings=400, truncate=11)
+        for engine in ScanALL.engines:
+            test = self._scan(engine, record=False)
+            self.assertIsNone(test.result.ping_offsets)
+            self.assertIsNone(test.get_time_stamps('P'))
+            self.assertIsNone(test.get_positions())
+            # the same statistics as a scan recording them
+            self.assertEqual(
+                test.scan_result, self._scan(engine).scan_result)
+
+    def test_positions(self):
+        write_synthetic_all(
+            self.test_file, pings=400, corrupt_pings=[3], truncate=11)
+        file_scan = self._scan(ScanALL.engines[0])
+        positions = file_scan.get_positions()
+        self.assertEqual(positions.shape, (400, 4))
+        self.assertEqual(
+            positions[:, 0].tolist(), file_scan.get_time_stamps('P').tolist())
+        self.assertEqual(positions[0, 1:].tolist(), [-42.0, 147.0, 2.5])
+        track = file_scan.get_track_summary()
+        # heading north at about 2.5 m/s for 399 s
+        self.assertAlmostEqual(track['trackLength'], 998.2, 1)
+        self.assertAlmostEqual(track['lineExtent'], track['trackLength'], 3)
+        self.assertAlmostEqual(track['maxSpeed'], 2.5, 2)
+        self.assertEqual(track['maxLoggedSpeed'], 2.5)
+        self.assertEqual(track['minLongitude'], 147.0)
+        self.assertEqual(track['minLatitude'], -42.0)
+        for engine in ScanALL.engines[1:]:
+            self.assertEqual(
+                self._scan(engine).get_positions().tolist(),
+                positions.tolist())
+
+    def test_position_systems(self):
+        # the fixes of an inactive second system 0.001 degree east are
+        # logged between the fixes of the active system
+        with SynthALLWriter(self.test_file) as writer:
+            for i in range(100):
+                latitude = -42.0 + i * 2.5 / 111120.0
+                writer.write(
+                    'P', position_body(latitude, 147.0, speed=2.5), 2 * i,
+                    1423284236.0 + i)
+                writer.write(
+                    'P', position_body(latitude, 147.001, descriptor=0x02),
+                    2 * i + 1, 1423284236.0 + i)
+        for engine in ScanALL.engines:
+            test = self._scan(engine)
+            self.assertEqual(test.get_datagram_info('P')['recordCount'], 200)
+            positions = test.get_positions()
+            self.assertEqual(positions.shape, (100, 4))
+            self.assertEqual(set(positions[:, 2]), {147.0})
+            track = test.get_track_summary()
+            self.assertAlmostEqual(track['trackLength'], 247.7, 1)
+            self.assertAlmostEqual(track['maxSpeed'], 2.5, 2)
+
+    def test_size_n_pings(self):
+        for mix in [None, LEGACY_MIX]:
+            written = write_synthetic_all(
+                self.test_file, pings=400, mix=mix, missed_pings=[50, 51],
+                corrupt_pings=[3], truncate=11)
+            # not scanned: the headers are read
+            sizes = [
+                ScanALL(self.test_file).get_size_n_pings(n)
+                for n in [0, 1, 2, 100, 396, 397, 1000]]
+            self.assertEqual(sizes[-1], written['bytes'])
+            for engine in ScanALL.engines:
+                test = self._scan(engine)
+                self.assertEqual(
+                    [test.get_size_n_pings(n)
+                     for n in [0, 1, 2, 100, 396, 397, 1000]],
+                    sizes)
+
+
+class TestMateScanALLIndexFile(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.temp_dir, TEST_FILE)
+        shutil.copy(
+            os.path.join(os.path.dirname(__file__), "test_data", TEST_FILE),
+            self.test_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _scan(self):
+        test = ScanALL(self.test_file, ENGINE_INDEX)
+        test.use_index_file = True
+        test.scan_datagram()
+        return test
+
+    def test_save_load(self):
+        file_scan = ScanALL(self.test_file)
+        file_scan.scan_datagram()
+        test = self._scan()
+        self.assertTrue(os.path.exists(test.index_path))
+        index = test.header_index
+
+        loaded = self._scan()
+        # the index was loaded rather than built
+        self.assertIsNone(loaded._header_index)
+        self.assertEqual(loaded.scan_result, file_scan.scan_result)
+        self.assertEqual(len(loaded.datagram_index), len(index))
+        for name in ['offset', 'numberOfBytes', 'typeOfDatagram', 'Counter',
+                     'timeStamp']:
+            self.assertTrue(all(loaded.datagram_index[name] == index[name]))
+
+    def test_changed_file(self):
+        self._scan()
+        # the beginning of a datagram being written
+        with open(self.test_file, 'rb') as f:
+            data = f.read(100)
+        with open(self.test_file, 'ab') as f:
+            f.write(data)
+        test = ScanALL(self.test_file, ENGINE_INDEX)
+        self.assertFalse(test.load_index())
+        test = self._scan()
+        self.assertIsNotNone(test._header_index)
+        self.assertEqual(test.get_datagram_info('XXX')['byteCount'], 100)
+
+    def test_find_datagrams(self):
+        test = ScanALL(self.test_file)
+        test.scan_datagram()
+        x = test.find_datagrams(['X'])
+        self.assertEqual(len(x), test.get_datagram_info('X')['recordCount'])
+        self.assertTrue(all(x['typeOfDatagram'] == ord('X')))
+        start_time = float(x[1]['timeStamp'])
+        stop_time = float(x[-2]['timeStamp'])
+        selected = test.find_datagrams(['X', 'Y'], start_time, stop_time)
+        self.assertTrue(all(selected['timeStamp'] >= start_time))
+        self.assertTrue(all(selected['timeStamp'] <= stop_time))
+        self.assertEqual(
+            len(selected[selected['typeOfDatagram'] == ord('X')]),
+            len(x) - 2)
+        self.assertEqual(
+            len(test.find_datagrams()), len(test.header_index))
+
+        for entry, data in test.read_datagrams(['X'], start_time, start_time):
+            self.assertEqual(len(data), int(entry['numberOfBytes']) + 4)
+            # STX and type
+            self.assertEqual(data[4:6], b'\x02X')
+
+
 def suite():
     s = unittest.TestSuite()
     s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateScanALL))
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(TestMateScanALLMmap))
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(TestMateScanALLChunked))
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(
+            TestMateScanALLIncremental))
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(
+            TestMateScanALLSynthetic))
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(
+            TestMateScanALLIndexFile))
     return s
@@ -0,0 +1,250 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+from hyo2.mate.lib import scan, scan_result
+from hyo2.mate.lib.scan_KMALL import ScanKMALL
+from hyo2.mate.lib.scan_ALL import ENGINE_FILE, ENGINE_MMAP, ENGINE_INDEX
+
+START_TIME = datetime(2020, 5, 4, 10, 11, 12, tzinfo=timezone.utc).timestamp()
+
+
+def datagram(dg_type, body, time_stamp):
+    """ Bytes of a KMALL datagram: header, body and repeated length. The
+    type is a name or the bytes of a corrupt type.
+    """
+    num_bytes = 20 + len(body) + 4
+    seconds = int(time_stamp)
+    if isinstance(dg_type, str):
+        dg_type = dg_type.encode('ascii')
+    header = struct.pack(
+        '<I4sBBHII', num_bytes, dg_type, 0, 0, 2040,
+        seconds, int(round((time_stamp - seconds) * 1e9)))
+    return header + body + struct.pack('<I', num_bytes)
+
+
+def iip_body(text):
+    return struct.pack('<HHH', 6, 0, 0) + text.encode('ascii')
+
+
+def spo_body(sensor_status=0, ellipsoid_height=12.5):
+    return struct.pack(
+        '<HHHHIIfddfff', 8, 1, sensor_status, 0, 0, 0, 0.1, -42.0, 147.0,
+        2.5, 0.0, ellipsoid_height) + b'NMEA'
+
+
+def skm_body(sensor_status=0):
+    return struct.pack('<HBBHHHH', 12, 1, sensor_status, 0, 0, 0, 0) + \
+        bytes(100)
+
+
+def mrz_body(ping_cnt, num_of_dgms=1, dgm_num=1, size=2000):
+    return struct.pack('<HHHH', num_of_dgms, dgm_num, 12, ping_cnt) + \
+        bytes(size)
+
+
+def write_kmall(path, pings=50, missed=(), partitioned=(), truncate=0):
+    """ Writes a KMALL file with an #IIP datagram, then per ping #SKM and
+    #SPO datagrams and one #MRZ datagram per swath of a dual swath, and
+    #IOP and #SVP datagrams.
+    """
+    data = datagram(
+        '#IIP', iip_body('OSCV:Empty,EMXV:EM2040,PU_0,\nSN=53011,'),
+        START_TIME)
+    data += datagram('#IOP', bytes(200), START_TIME)
+    data += datagram('#SVP', bytes(400), START_TIME)
+    for ping in range(pings):
+        time_stamp = START_TIME + ping * 0.5
+        data += datagram('#SKM', skm_body(), time_stamp)
+        data += datagram('#SPO', spo_body(), time_stamp)
+        if ping in missed:
+            continue
+        for swath in range(2):
+            if ping in partitioned:
+                data += datagram('#MRZ', mrz_body(ping, 2, 1), time_stamp)
+                # only the first partition has the ping counter
+                data += datagram(
+                    '#MRZ', struct.pack('<HH', 2, 2) + b'\xff' * 500,
+                    time_stamp)
+            else:
+                data += datagram('#MRZ', mrz_body(ping), time_stamp)
+    if truncate:
+        data = data[:-truncate]
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+class TestMateScanKMALL(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(
+            self.temp_dir, "0001_20200504_101112_EM2040.kmall")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _scan(self, engine=ENGINE_MMAP):
+        test = ScanKMALL(self.test_file, engine)
+        test.record_time_series = True
+        test.record_positions = True
+        test.scan_datagram()
+        return test
+
+    def test_pings(self):
+        size = write_kmall(
+            self.test_file, pings=50, missed=[10, 20, 21],
+            partitioned=[30, 31])
+        test = self._scan()
+        info = test.get_datagram_info('#MRZ')
+        self.assertEqual(info['recordCount'], (50 - 3 + 2) * 2)
+        self.assertEqual(info['pingCount'], 50 - 3 - 1)
+        self.assertEqual(info['missedPings'], 3)
+        self.assertEqual(test.get_total_pings(), 46)
+        self.assertEqual(test.get_datagram_info('#SPO')['recordCount'], 50)
+        self.assertEqual(test.total_datagram_bytes(), size)
+        self.assertTrue(test.is_size_matched())
+        self.assertEqual(info['startTime'], START_TIME)
+        self.assertTrue(test.has_minimum_pings())
+        self.assertFalse(test.is_missing_pings_tolerable())
+
+    def test_same_scan_result(self):
+        write_kmall(self.test_file, missed=[5], partitioned=[7], truncate=9)
+        mmap_scan = self._scan()
+        self.assertEqual(
+            mmap_scan.get_datagram_info('XXX')['recordCount'], 1)
+        self.assertEqual(
+            self._scan(ENGINE_FILE).scan_result, mmap_scan.scan_result)
+
+    def test_time_series(self):
+        write_kmall(self.test_file, missed=[10, 11], partitioned=[30])
+        for engine in ScanKMALL.engines:
+            test = self._scan(engine)
+            # the ALL position datagrams map to the #SPO datagrams
+            self.assertEqual(len(test.get_time_stamps('P')), 50)
+            self.assertEqual(test.get_time_stamps('P')[1], START_TIME + 0.5)
+            self.assertEqual(
+                test.get_time_gaps('#MRZ', 1.0).tolist(),
+                [[START_TIME + 4.5, 1.5]])
+            # the datagrams of a partitioned ping are a single ping
+            self.assertEqual(test.get_ping_dropouts(), {'#MRZ': (47, 1)})
+            positions = test.get_positions()
+            self.assertEqual(positions.shape, (50, 4))
+            self.assertEqual(positions[0, 1:].tolist(), [-42.0, 147.0, 2.5])
+
+    def test_availability(self):
+        write_kmall(self.test_file)
+        test = self._scan()
+        self.assertEqual(test.bathymetry_availability(), scan.A_FULL)
+        self.assertEqual(test.backscatter_availability(), scan.A_FULL)
+        self.assertTrue(test.ray_tracing_availability())
+        self.assertTrue(test.ellipsoid_height_availability())
+        self.assertEqual(test.PU_status(), scan.A_PASS)
+        self.assertTrue(test.is_date_match())
+        self.assertFalse(test.is_filename_changed())
+        self.assertEqual(
+            test.get_installation_parameters(),
+            {'OSCV': 'Empty', 'EMXV': 'EM2040', 'SN': '53011'})
+
+    def test_required_datagrams(self):
+        write_kmall(self.test_file)
+        for engine in ScanKMALL.engines:
+            test = ScanKMALL(self.test_file, engine)
+            # the ALL installation datagram is mapped to #IIP
+            test.scan_datagram(required_datagrams=['I'])
+            self.assertFalse(test.scan_complete)
+            self.assertEqual(list(test.scan_result), ['#IIP'])
+
+    def test_scan_new_data(self):
+        size = write_kmall(self.test_file, truncate=100)
+        test = ScanKMALL(self.test_file)
+        self.assertGreater(test.scan_new_data(), 0)
+        self.assertIsNone(test.get_datagram_info('XXX'))
+        write_kmall(self.test_file)
+        self.assertGreater(test.scan_new_data(), 0)
+        self.assertEqual(test.scan_result, self._scan().scan_result)
+        self.assertGreater(test.total_datagram_bytes(), size)
+
+    def test_corrupt_types(self):
+        # the types of corrupt datagrams are reported as truncated, without
+        # giving them codes that would run out for the later scans of the
+        # process
+        named_types = len(scan_result._named_types)
+        for i in range(300):
+            with open(self.test_file, 'wb') as f:
+                f.write(datagram('#IIP', iip_body('SN=1,'), START_TIME))
+                f.write(datagram(
+                    struct.pack('<I', 0x80000000 + i), bytes(50),
+                    START_TIME))
+                f.write(datagram('#SVP', bytes(40), START_TIME))
+            test = self._scan(ScanKMALL.engines[i % 2])
+            self.assertEqual(list(test.scan_result), ['#IIP', 'XXX'])
+        self.assertEqual(len(scan_result._named_types), named_types)
+
+        with open(self.test_file, 'wb') as f:
+            f.write(datagram('#IIP', iip_body('SN=1,'), START_TIME))
+            f.write(datagram('#ZZZ', bytes(50), START_TIME))
+        for engine in ScanKMALL.engines:
+            test = self._scan(engine)
+            self.assertEqual(list(test.scan_result), ['#IIP', '#ZZZ'])
+
+    def test_short_ping(self):
+        # a ping datagram too short to hold the ping counter, at the end of
+        # the file
+        size = write_kmall(self.test_file, pings=5)
+        pings = self._scan().get_total_pings()
+        with open(self.test_file, 'ab') as f:
+            f.write(datagram('#MRZ', b'', START_TIME))
+        for engine in ScanKMALL.engines:
+            test = self._scan(engine)
+            self.assertEqual(
+                test.get_datagram_info('XXX')['recordCount'], 1)
+            self.assertEqual(test.get_total_pings(), pings)
+            self.assertEqual(test.total_datagram_bytes(), size + 24)
+
+    def test_size_n_pings(self):
+        write_kmall(
+            self.test_file, pings=50, missed=[10], partitioned=[30],
+            truncate=9)
+        # not scanned: the headers are read
+        sizes = [
+            ScanKMALL(self.test_file).get_size_n_pings(n)
+            for n in [0, 1, 2, 30, 48, 49, 1000]]
+        self.assertEqual(sizes[-1], os.path.getsize(self.test_file))
+        self.assertEqual(sorted(sizes), sizes)
+        # a ping is counted at the first #MRZ with a new counter: the bytes
+        # of #IIP, #IOP, #SVP, then of the #SKM, #SPO and two #MRZ of the
+        # first two pings and up to the first #MRZ of the third one
+        offset = 0
+        with open(self.test_file, 'rb') as f:
+            data = f.read()
+        for _ in range(3 + 4 * 2 + 3):
+            offset += struct.unpack_from('<I', data, offset)[0]
+        self.assertEqual(sizes[1], offset)
+        for engine in ScanKMALL.engines:
+            for record in [False, True]:
+                test = ScanKMALL(self.test_file, engine)
+                test.record_ping_offsets = record
+                test.scan_datagram()
+                self.assertEqual(
+                    [test.get_size_n_pings(n)
+                     for n in [0, 1, 2, 30, 48, 49, 1000]],
+                    sizes)
+                # the scan is left as it was
+                self.assertEqual(test.get_total_pings('#MRZ'), 48)
+
+    def test_unsupported_engine(self):
+        write_kmall(self.test_file)
+        with self.assertRaisesRegex(NotImplementedError, 'file, mmap'):
+            ScanKMALL(self.test_file, ENGINE_INDEX)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(TestMateScanKMALL))
+    return s
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from hyo2.mate.lib.scan_ALL import ENGINE_BLOCK
+from hyo2.mate.lib.scan_WCD import ScanWCD
+from hyo2.mate.lib.synth_ALL import write_synthetic_all, WCD_MIX
+
+
+class CountingReader:
+    """ Binary file wrapper counting the bytes read """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self._reader.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+
+class TestMateScanWCD(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(
+            self.temp_dir, "0001_20150207_044356_Synthetic.wcd")
+        self.written = write_synthetic_all(
+            self.test_file, pings=100, mix=WCD_MIX, missed_pings=[40])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_pings(self):
+        test = ScanWCD(self.test_file)
+        test.scan_datagram()
+        info = test.get_datagram_info('k')
+        self.assertEqual(info['recordCount'], 99)
+        self.assertEqual(info['pingCount'], 98)
+        self.assertEqual(info['missedPings'], 1)
+        self.assertEqual(test.get_total_pings(), 98)
+        self.assertTrue(test.has_minimum_pings())
+        self.assertFalse(test.is_filename_changed())
+        self.assertTrue(test.is_size_matched())
+
+    def test_same_scan_result(self):
+        file_scan = ScanWCD(self.test_file)
+        file_scan.scan_datagram()
+        for engine in ScanWCD.engines[1:]:
+            test = ScanWCD(self.test_file, engine)
+            test.scan_datagram()
+            self.assertEqual(test.scan_result, file_scan.scan_result)
+
+    def test_sparse_reads(self):
+        test = ScanWCD(self.test_file)
+        test.reader = CountingReader(test.reader)
+        test.scan_datagram()
+        # only the headers of the water-column datagrams are read
+        self.assertLess(test.reader.bytes_read, self.written['bytes'] / 100)
+
+    def test_unsupported_engine(self):
+        with self.assertRaises(NotImplementedError):
+            ScanWCD(self.test_file, ENGINE_BLOCK)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateScanWCD))
+    return s
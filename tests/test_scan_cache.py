@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from hyo2.mate.lib.scan_ALL import ScanALL
+from hyo2.mate.lib.scan_cache import ScanCache
+
+TEST_FILE1 = "0200_MBES_EM122_20150203_010431_Supporter_GA4430.all"
+TEST_FILE = "0243_P007_MBES_EM122_20150207_044356_Supporter_GA4430.all"
+
+
+class TestMateScanCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.temp_dir, TEST_FILE)
+        shutil.copy(
+            os.path.join(os.path.dirname(__file__), "test_data", TEST_FILE),
+            self.test_file)
+        self.cache = ScanCache(os.path.join(self.temp_dir, 'cache.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_save(self):
+        scan = ScanALL(self.test_file)
+        self.assertFalse(self.cache.load(scan))
+        scan.scan_datagram()
+        self.cache.save(scan)
+
+        cached = ScanALL(self.test_file)
+        self.assertTrue(self.cache.load(cached))
+        self.assertEqual(
+            cached.get_datagram_info('Y')['byteCount'], 81386)
+        self.assertEqual(cached.get_total_pings(), scan.get_total_pings())
+        self.assertEqual(
+            cached.get_datagram_info('I'), scan.get_datagram_info('I'))
+        self.assertEqual(
+            cached.bathymetry_availability(), scan.bathymetry_availability())
+        self.assertEqual(cached.PU_status(), scan.PU_status())
+
+    def test_partial_scan(self):
+        scan = ScanALL(self.test_file)
+        scan.scan_datagram(required_datagrams=['I'])
+        self.cache.save(scan)
+        self.assertFalse(self.cache.load(ScanALL(self.test_file)))
+
+    def test_changed_file(self):
+        scan = ScanALL(self.test_file)
+        scan.scan_datagram()
+        self.cache.save(scan)
+        with open(self.test_file, 'ab') as f:
+            f.write(b'\0' * 8)
+        self.assertFalse(self.cache.load(ScanALL(self.test_file)))
+
+    def test_scanner_version(self):
+        scan = ScanALL(self.test_file)
+        scan.scan_datagram()
+        self.cache.save(scan)
+        scan = ScanALL(self.test_file)
+        scan.scanner_version = 'new'
+        self.assertFalse(self.cache.load(scan))
+
+    def test_hash_content(self):
+        cache = ScanCache(self.cache.path, hash_content=True)
+        scan = ScanALL(self.test_file)
+        scan.scan_datagram()
+        cache.save(scan)
+        self.assertTrue(cache.load(ScanALL(self.test_file)))
+        self.assertFalse(self.cache.load(ScanALL(self.test_file)))
+
+    def test_invalidate(self):
+        scan = ScanALL(self.test_file)
+        scan.scan_datagram()
+        self.cache.save(scan)
+        self.cache.invalidate(self.test_file)
+        self.assertFalse(self.cache.load(ScanALL(self.test_file)))
+
+    def test_eviction(self):
+        other_file = os.path.join(self.temp_dir, TEST_FILE1)
+        shutil.copy(
+            os.path.join(os.path.dirname(__file__), "test_data", TEST_FILE1),
+            other_file)
+        scan = ScanALL(self.test_file)
+        scan.scan_datagram()
+        other_scan = ScanALL(other_file)
+        other_scan.scan_datagram()
+
+        # only room for one of the two results
+        cache = ScanCache(self.cache.path, max_size=4000)
+        cache.save(scan)
+        cache.save(other_scan)
+        self.assertFalse(cache.load(ScanALL(self.test_file)))
+        self.assertTrue(cache.load(ScanALL(other_file)))
+
+    def test_unusable_cache(self):
+        scan = ScanALL(self.test_file)
+        scan.scan_datagram()
+        # a cache whose folder is a file, and a corrupt database
+        not_a_folder = os.path.join(self.temp_dir, 'not_a_folder')
+        corrupt = os.path.join(self.temp_dir, 'corrupt.sqlite')
+        for path, content in [(not_a_folder, b''), (corrupt, b'x' * 4096)]:
+            with open(path, 'wb') as f:
+                f.write(content)
+        for cache_path in [
+                os.path.join(not_a_folder, 'cache.sqlite'), corrupt]:
+            cache = ScanCache(cache_path)
+            with self.assertLogs(level='WARNING'):
+                cache.save(scan)
+            cached = ScanALL(self.test_file)
+            with self.assertLogs(level='WARNING'):
+                self.assertFalse(cache.load(cached))
+            self.assertFalse(cached.scan_complete)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateScanCache))
+    return s
@@ -1,8 +1,14 @@
 import unittest
 import os
+import shutil
+import tempfile
 import time
 import pytest
-from hyo2.mate.lib.scan_utils import get_scan, get_check
+from hyo2.mate.lib.scan_check import MaximumTimeGapCheck, \
+    PingRateStabilityCheck, TrackCheck
+from hyo2.mate.lib.scan_utils import get_scan, get_check, all_checks
+from hyo2.mate.lib.synth_ALL import write_synthetic_all
+from hyo2.qax.lib.qa_json import QaJsonParam
 
 
 TEST_FILE1 = "0200_MBES_EM122_20150203_010431_Supporter_GA4430.all"
@@ -37,8 +43,106 @@ class TestMateScanCheck(unittest.TestCase):
         with pytest.raises(NotImplementedError):
             check = get_check(check_id, check_version, scan, check_params)
 
+    def test_ellipsoid_height_check(self):
+        scan = get_scan(self.test_file, 'all')
+        scan.scan_datagram()
+        check = get_check(
+            '0d2155da-3244-455c-a403-89319156bd9a', '1', scan, [])
+        self.assertEqual(
+            type(check).__name__, 'EllipsoidHeightAvailableCheck')
+        check.run_check()
+        self.assertEqual(check.output.qa_pass, 'yes')
+        self.assertIsNone(check.output.message)
+
+    def test_run_batch(self):
+        test_files = [
+            os.path.join(os.path.dirname(self.test_file), f)
+            for f in [TEST_FILE, TEST_FILE1]]
+        scans = [get_scan(f, 'all') for f in test_files]
+        for scan in scans:
+            scan.scan_datagram()
+        for check_class in all_checks:
+            for params in [[], check_class.default_params]:
+                outputs = check_class.run_batch(scans, params)
+                self.assertEqual(len(outputs), len(scans))
+                for scan, output in zip(scans, outputs):
+                    check = check_class(scan, params)
+                    try:
+                        check.run_check()
+                    except Exception as e:
+                        self.assertEqual(str(output), str(e))
+                        continue
+                    self.assertEqual(
+                        output.to_dict(), check.output.to_dict())
+
+
+class TestMateTimeSeriesCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        test_file = os.path.join(
+            self.temp_dir, "0001_20150207_044356_Synthetic.all")
+        write_synthetic_all(test_file, pings=400, missed_pings=[50, 51, 52])
+        self.scan = get_scan(test_file, 'all', time_series=True)
+        self.scan.scan_datagram()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_maximum_time_gap(self):
+        check = MaximumTimeGapCheck(self.scan, [])
+        check.run_check()
+        self.assertEqual(check.output.qa_pass, 'yes')
+        self.assertEqual(check.output.count, 0)
+        # no clock datagrams in the synthetic file
+        self.assertIn('No C datagrams', check.output.message)
+
+        params = [
+            QaJsonParam(name='datagram_types', value=['P', 'X']),
+            QaJsonParam(name='max_gap', value=2.0)]
+        check = MaximumTimeGapCheck(self.scan, params)
+        check.run_check()
+        self.assertEqual(check.output.qa_pass, 'no')
+        self.assertEqual(check.output.count, 1)
+
+        params[1].value = 5.0
+        check = MaximumTimeGapCheck(self.scan, params)
+        check.run_check()
+        self.assertEqual(check.output.qa_pass, 'yes')
+        self.assertIsNone(check.output.message)
+
+    def test_ping_rate_stability(self):
+        check = PingRateStabilityCheck(self.scan, [])
+        check.run_check()
+        self.assertEqual(check.output.count, 3)
+        self.assertEqual(check.output.qa_pass, 'yes')
+
+        params = [QaJsonParam(name='max_dropout_percentage', value=0.1)]
+        check = PingRateStabilityCheck(self.scan, params)
+        check.run_check()
+        self.assertEqual(check.output.qa_pass, 'no')
+
+    def test_track(self):
+        check = TrackCheck(self.scan, [])
+        check.run_check()
+        self.assertEqual(check.output.qa_pass, 'yes')
+        self.assertEqual(check.output.count, 400)
+        self.assertIn('Track length 998.2 m', check.output.message)
+        self.assertIn('logged speed up to 2.5 m/s', check.output.message)
+
+        params = [
+            QaJsonParam(name='min_track_length', value=1000.0),
+            QaJsonParam(name='max_speed', value=2.0)]
+        check = TrackCheck(self.scan, params)
+        check.run_check()
+        self.assertEqual(check.output.qa_pass, 'no')
+        self.assertIn('less than 1000.0 m', check.output.message)
+        self.assertIn('more than 2.0 m/s', check.output.message)
+
 
 def suite():
     s = unittest.TestSuite()
     s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateScanCheck))
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(
+        TestMateTimeSeriesCheck))
     return s
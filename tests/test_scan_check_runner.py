@@ -1,10 +1,18 @@
+import asyncio
+import contextlib
+import copy
 import json
 import os
 import pytest
+import shutil
+import tempfile
 import time
 import unittest
 
-from hyo2.mate.lib.check_runner import CheckRunner
+from hyo2.mate.lib.check_runner import CheckRunner, _required_datagrams, \
+    _scan_file
+from hyo2.mate.lib.metrics import Metrics, CProfileHook, profile_path
+from hyo2.mate.lib.scan_cache import ScanCache
 from hyo2.mate.lib.scan_utils import get_scan
 
 qajson = """
@@ -60,6 +68,9 @@ qajson = """
 ]
 """
 
+TEST_FILE1 = "0200_MBES_EM122_20150203_010431_Supporter_GA4430.all"
+TEST_FILE = "0243_P007_MBES_EM122_20150207_044356_Supporter_GA4430.all"
+
 
 class TestMateCheckRunner(unittest.TestCase):
 
@@ -95,9 +106,413 @@ class TestMateCheckRunner(unittest.TestCase):
         file_three_checks = checkrunner._file_checks['test/three.all']
         self.assertEqual(len(file_three_checks), 1)
 
+    def test_batches(self):
+        """ Checks the files sharing a checklist are batched together """
+        self.checks_json[1]['inputs']['files'] = \
+            self.checks_json[0]['inputs']['files'] + [
+                {"path": "test/three.all", "description": "raw input"}]
+        checkrunner = CheckRunner(self.checks_json, batch_size=1)
+        checkrunner.initialize()
+        self.assertEqual(
+            [filenames for filenames, _ in checkrunner._batches(2)],
+            [['test/one.all', 'test/two.all'], ['test/three.all']])
+        self.assertEqual(
+            [filenames for filenames, _ in checkrunner._batches(1)],
+            [['test/one.all'], ['test/two.all'], ['test/three.all']])
+        checkrunner.file_hook = CProfileHook('profiles')
+        self.assertEqual(len(checkrunner._batches(2)), 3)
+
+    def test_batches_per_file_checks(self):
+        """ Checks the files with their own definitions of the same checks,
+        as written by the QAX plugin, are batched together unless their
+        parameters differ
+        """
+        checks = []
+        for filename in ['a.all', 'b.all', 'c.all']:
+            for check in json.loads(qajson):
+                check['inputs']['files'] = [
+                    {"path": filename, "description": "raw input"}]
+                check['inputs']['params'] = [
+                    {"name": "threshold",
+                     "value": 2 if filename == 'c.all' else 1}]
+                checks.append(check)
+        checkrunner = CheckRunner(checks)
+        checkrunner.initialize()
+        self.assertEqual(checkrunner.batch_size, 64)
+        self.assertEqual(
+            [filenames for filenames, _ in checkrunner._batches(64)],
+            [['a.all', 'b.all'], ['c.all']])
+        # outputs are passed to the callback as soon as each file is checked
+        checkrunner = CheckRunner(checks, output_callback=print)
+        self.assertEqual(checkrunner.batch_size, 1)
+
+    def test_required_datagrams(self):
+        """ Checks the filename and date checks only require the scan of the
+        first I datagram, and others the whole file.
+        """
+        self.assertEqual(_required_datagrams(self.checks_json), ['I'])
+        bathy_check = copy.deepcopy(self.checks_json[0])
+        bathy_check['info']['id'] = "8c909ace-8759-4c2c-b86a-f76f888cd821"
+        self.assertIsNone(
+            _required_datagrams(self.checks_json + [bathy_check]))
+
+
+class TestMateCheckRunnerParallel(unittest.TestCase):
+
+    def setUp(self):
+        test_files = [
+            os.path.abspath(os.path.join(
+                os.path.dirname(__file__), "test_data", f))
+            for f in [TEST_FILE, TEST_FILE1]
+        ]
+        checks_json = json.loads(qajson)
+        for check in checks_json:
+            check['inputs']['files'] = [
+                {"path": f, "description": "raw input"} for f in test_files]
+        self.checks_json = checks_json
+
+    def _run(self, max_workers):
+        progress = []
+        checkrunner = CheckRunner(
+            self.checks_json, max_workers=max_workers, use_scan_cache=False)
+        checkrunner.initialize()
+        checkrunner.run_checks(progress.append)
+        return checkrunner.output, progress
+
+    def test_same_output(self):
+        serial_output, _ = self._run(1)
+        parallel_output, progress = self._run(2)
+        for serial_check, parallel_check in zip(
+                serial_output, parallel_output):
+            self.assertEqual(
+                serial_check['outputs'].get('qa_pass'),
+                parallel_check['outputs'].get('qa_pass'))
+            self.assertEqual(
+                parallel_check['outputs']['execution']['status'],
+                'completed')
+        self.assertEqual(progress, sorted(progress))
+        self.assertAlmostEqual(progress[-1], 1.0)
+
+    def test_async(self):
+        serial_output, _ = self._run(1)
+        progress = []
+        metrics = Metrics()
+        checkrunner = CheckRunner(
+            self.checks_json, use_scan_cache=False, metrics=metrics)
+        checkrunner.initialize()
+        asyncio.run(checkrunner.run_checks_async(
+            progress.append, max_concurrency=2, buffer_size=1024 * 1024))
+        for serial_check, async_check in zip(
+                serial_output, checkrunner.output):
+            self.assertEqual(
+                serial_check['outputs'].get('qa_pass'),
+                async_check['outputs'].get('qa_pass'))
+            self.assertEqual(
+                async_check['outputs']['execution']['status'], 'completed')
+        self.assertEqual(progress, sorted(progress))
+        self.assertAlmostEqual(progress[-1], 1.0)
+        self.assertEqual(metrics.counters['files_scanned'], 2)
+        self.assertIn('run_checks', metrics.timers)
+
+    def test_async_file_hook(self):
+        """ Checks the files are checked one at a time with a file hook """
+        active = []
+        overlaps = []
+
+        @contextlib.contextmanager
+        def file_hook(filename):
+            overlaps.append(len(active))
+            active.append(filename)
+            time.sleep(0.05)
+            try:
+                yield
+            finally:
+                active.remove(filename)
+
+        checkrunner = CheckRunner(
+            self.checks_json, use_scan_cache=False, file_hook=file_hook)
+        checkrunner.initialize()
+        asyncio.run(checkrunner.run_checks_async(max_concurrency=4))
+        self.assertEqual(overlaps, [0, 0])
+
+    def test_scan_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        cache = ScanCache(os.path.join(temp_dir, 'cache.sqlite'))
+        # a check requiring the whole file, only complete scans are cached
+        bathy_check = copy.deepcopy(self.checks_json[0])
+        bathy_check['info']['id'] = "8c909ace-8759-4c2c-b86a-f76f888cd821"
+        self.checks_json.append(bathy_check)
+        try:
+            checkrunner = CheckRunner(self.checks_json)
+            checkrunner.scan_cache = cache
+            checkrunner.initialize()
+            checkrunner.run_checks()
+            for filename in checkrunner._file_checks:
+                self.assertTrue(cache.load(get_scan(filename, 'all')))
+
+            # results from the cache are the same
+            cached_checkrunner = CheckRunner(self.checks_json)
+            cached_checkrunner.scan_cache = cache
+            cached_checkrunner.initialize()
+            cached_checkrunner.run_checks()
+            for check, cached_check in zip(
+                    checkrunner.output, cached_checkrunner.output):
+                self.assertEqual(
+                    check['outputs'].get('qa_pass'),
+                    cached_check['outputs'].get('qa_pass'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_stop_batch(self):
+        """ Checks the files of a batch scanned before a stop are checked
+        """
+        outputs = []
+
+        def output_callback(check_id, filename, output):
+            outputs.append(filename)
+
+        checkrunner = CheckRunner(
+            self.checks_json, use_scan_cache=False,
+            output_callback=output_callback, batch_size=2)
+        checkrunner.initialize()
+        checkrunner.run_checks(lambda progress: checkrunner.stop())
+        first_file = list(checkrunner._file_checks)[0]
+        self.assertEqual(outputs, [first_file] * len(self.checks_json))
+
+    def test_unusable_scan_cache(self):
+        """ Checks a scan cache that cannot be used does not stop the run
+        """
+        serial_output, _ = self._run(1)
+        temp_dir = tempfile.mkdtemp()
+        not_a_folder = os.path.join(temp_dir, 'not_a_folder')
+        open(not_a_folder, 'w').close()
+        try:
+            checkrunner = CheckRunner(self.checks_json)
+            checkrunner.scan_cache = ScanCache(
+                os.path.join(not_a_folder, 'cache.sqlite'))
+            checkrunner.initialize()
+            with self.assertLogs(level='WARNING'):
+                checkrunner.run_checks()
+            self.assertEqual(
+                [check['outputs'].get('qa_pass') for check in serial_output],
+                [check['outputs'].get('qa_pass')
+                 for check in checkrunner.output])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_output_callback(self):
+        outputs = []
+
+        def output_callback(check_id, filename, output):
+            outputs.append((check_id, filename, output))
+
+        checkrunner = CheckRunner(
+            self.checks_json, use_scan_cache=False,
+            output_callback=output_callback, keep_output=False)
+        checkrunner.initialize()
+        checkrunner.run_checks()
+        # one output per check and file
+        self.assertEqual(len(outputs), 4)
+        for check_id, filename, output in outputs:
+            self.assertEqual(output['execution']['status'], 'completed')
+        # the outputs are not collected
+        self.assertIs(checkrunner.output, self.checks_json)
+        for check in checkrunner.output:
+            self.assertNotIn('outputs', check)
+
+    def test_metrics(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            metrics = {}
+            for max_workers in [1, 2]:
+                metrics[max_workers] = Metrics()
+                checkrunner = CheckRunner(
+                    self.checks_json, max_workers=max_workers,
+                    use_scan_cache=False, metrics=metrics[max_workers],
+                    file_hook=CProfileHook(temp_dir))
+                checkrunner.initialize()
+                checkrunner.run_checks()
+            for m in metrics.values():
+                self.assertEqual(m.counters['files_scanned'], 2)
+                self.assertEqual(sorted(m.files), sorted(
+                    checkrunner._file_checks))
+                for check in m.checks.values():
+                    self.assertEqual(check['count'], 2)
+                self.assertIn('scan', m.timers)
+                self.assertIn('run_checks', m.timers)
+            self.assertEqual(metrics[1].datagrams, metrics[2].datagrams)
+            self.assertEqual(
+                metrics[1].counters['bytes_scanned'],
+                metrics[2].counters['bytes_scanned'])
+            self.assertEqual(
+                sorted(os.listdir(temp_dir)),
+                sorted(os.path.basename(profile_path(temp_dir, f, 'prof'))
+                       for f in checkrunner._file_checks))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_unnamed_check(self):
+        # the name of a check is optional, with or without metrics
+        del self.checks_json[1]['info']['name']
+        for metrics in [None, Metrics()]:
+            checkrunner = CheckRunner(
+                copy.deepcopy(self.checks_json), use_scan_cache=False,
+                metrics=metrics)
+            checkrunner.initialize()
+            checkrunner.run_checks()
+            for check in checkrunner.output:
+                self.assertEqual(
+                    check['outputs']['execution']['status'], 'completed')
+
+    def test_batch(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # two copies of each file, and a check reading the ping counts
+            test_files = []
+            for test_file in self.checks_json[0]['inputs']['files']:
+                for copy_name in ['a_', 'b_']:
+                    path = os.path.join(
+                        temp_dir,
+                        copy_name + os.path.basename(test_file['path']))
+                    shutil.copyfile(test_file['path'], path)
+                    test_files.append(path)
+            ping_check = copy.deepcopy(self.checks_json[0])
+            ping_check['info']['id'] = "d762fd79-75bc-4aff-a9d2-e0c36e744e17"
+            ping_check['inputs']['params'] = [
+                {"name": "threshold", "value": 50}]
+            self.checks_json.append(ping_check)
+            for check in self.checks_json:
+                check['inputs']['files'] = [
+                    {"path": f, "description": "raw input"}
+                    for f in test_files]
+
+            outputs = {}
+            for max_workers, batch_size in [(1, 1), (1, 64), (2, 64)]:
+                run_outputs = {}
+
+                def output_callback(check_id, filename, output):
+                    # the outputs but the execution times
+                    self.assertEqual(
+                        output.pop('execution')['status'], 'completed')
+                    run_outputs[check_id, filename] = output
+
+                metrics = Metrics()
+                checkrunner = CheckRunner(
+                    self.checks_json, max_workers=max_workers,
+                    use_scan_cache=False, metrics=metrics,
+                    output_callback=output_callback, keep_output=False,
+                    batch_size=batch_size)
+                checkrunner.initialize()
+                checkrunner.run_checks()
+                for check in metrics.checks.values():
+                    self.assertEqual(check['count'], 4)
+                self.assertEqual(len(run_outputs), 12)
+                outputs[max_workers, batch_size] = run_outputs
+            self.assertEqual(outputs[1, 64], outputs[1, 1])
+            self.assertEqual(outputs[2, 64], outputs[1, 1])
+            # 0243 has less than 50 pings, 0200 no ping datagrams
+            self.assertEqual(
+                [outputs[1, 1][ping_check['info']['id'], f]['qa_pass']
+                 for f in test_files],
+                ['no', 'no', 'yes', 'yes'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_time_series(self):
+        filename = self.checks_json[0]['inputs']['files'][0]['path']
+        # only recorded for the checklists with a check reading them
+        scan = _scan_file(filename, self.checks_json)
+        self.assertIsNone(scan.get_time_stamps('P'))
+        self.assertIsNone(scan.get_positions())
+        track_check = copy.deepcopy(self.checks_json[0])
+        track_check['info']['id'] = "511ffa72-d5ba-4a3e-81ff-a5d2218bd08f"
+        self.checks_json.append(track_check)
+        scan = _scan_file(filename, self.checks_json)
+        self.assertIsNotNone(scan.get_time_stamps('P'))
+        self.assertIsNotNone(scan.get_positions())
+        for max_workers in [1, 2]:
+            checkrunner = CheckRunner(
+                copy.deepcopy(self.checks_json), max_workers=max_workers)
+            checkrunner.initialize()
+            checkrunner.run_checks()
+            for check in checkrunner.output:
+                self.assertEqual(
+                    check['outputs']['execution']['status'], 'completed')
+
+    def test_batch_check_error(self):
+        # a threshold the ping counts cannot be compared with
+        ping_check = copy.deepcopy(self.checks_json[0])
+        ping_check['info']['id'] = "d762fd79-75bc-4aff-a9d2-e0c36e744e17"
+        ping_check['inputs']['params'] = [
+            {"name": "threshold", "value": "50"}]
+        self.checks_json.append(ping_check)
+        test_file = self.checks_json[0]['inputs']['files'][0]['path']
+        for max_workers, batch_size in [(1, 1), (1, 64), (2, 64)]:
+            statuses = {}
+
+            def output_callback(check_id, filename, output):
+                statuses[check_id, filename] = output['execution']['status']
+
+            checkrunner = CheckRunner(
+                copy.deepcopy(self.checks_json), max_workers=max_workers,
+                use_scan_cache=False, output_callback=output_callback,
+                batch_size=batch_size)
+            checkrunner.initialize()
+            checkrunner.run_checks()
+            self.assertEqual(len(statuses), 6)
+            # 0243 has pings to compare with the threshold
+            self.assertEqual(
+                statuses[ping_check['info']['id'], test_file], 'failed')
+            for (check_id, filename), status in statuses.items():
+                if check_id != ping_check['info']['id']:
+                    self.assertEqual(status, 'completed')
+                elif max_workers == 1 and batch_size > 1:
+                    # the check failed for the whole batch (the pool runs
+                    # batches of one file for two files and two workers)
+                    self.assertEqual(status, 'failed')
+
+    def test_follow(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # one file is still being logged
+            test_file = os.path.join(temp_dir, TEST_FILE)
+            source_file = self.checks_json[0]['inputs']['files'][0]['path']
+            with open(source_file, 'rb') as f:
+                data = f.read()
+            with open(test_file, 'wb') as f:
+                f.write(data[:100000])
+            for check in self.checks_json:
+                check['inputs']['files'][0]['path'] = test_file
+
+            updates = []
+
+            def update_callback(filename):
+                updates.append(filename)
+                if filename == test_file and \
+                        os.path.getsize(test_file) < len(data):
+                    with open(test_file, 'ab') as f:
+                        f.write(data[100000:])
+
+            checkrunner = CheckRunner(
+                self.checks_json, use_scan_cache=False)
+            checkrunner.initialize()
+            checkrunner.run_checks_follow(
+                poll_interval=0.01, idle_timeout=0.1,
+                update_callback=update_callback)
+            self.assertEqual(updates.count(test_file), 2)
+            self.assertEqual(len(updates), 3)
+            for check in checkrunner.output:
+                self.assertEqual(
+                    check['outputs']['execution']['status'], 'completed')
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 def suite():
     s = unittest.TestSuite()
     s.addTests(
         unittest.TestLoader().loadTestsFromTestCase(TestMateCheckRunner))
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(
+            TestMateCheckRunnerParallel))
     return s
@@ -0,0 +1,137 @@
+import unittest
+import json
+import os
+from hyo2.mate.lib.scan_ALL import ScanALL
+from hyo2.mate.lib.scan_result import ScanResult, type_code, type_name, \
+    TRUNCATED, TRUNCATED_CODE, result_columns
+
+TEST_FILE = "0243_P007_MBES_EM122_20150207_044356_Supporter_GA4430.all"
+
+
+class TestMateScanResult(unittest.TestCase):
+
+    def test_type_code(self):
+        self.assertEqual(type_code('X'), 88)
+        self.assertEqual(type_name(88), 'X')
+        self.assertEqual(type_code(TRUNCATED), TRUNCATED_CODE)
+        self.assertEqual(type_name(TRUNCATED_CODE), TRUNCATED)
+        # named types get the codes following the truncated datagrams
+        code = type_code('#MRZ')
+        self.assertGreater(code, TRUNCATED_CODE)
+        self.assertEqual(type_code('#MRZ'), code)
+        self.assertEqual(type_name(code), '#MRZ')
+        result = ScanResult()
+        result.add(code, 100, 1.0, 0)
+        self.assertEqual(list(result.to_dict()), ['#MRZ'])
+
+    def test_add(self):
+        result = ScanResult()
+        code = type_code('X')
+        for counter, time_stamp in [(10, 1.0), (11, 2.0), (14, 3.0)]:
+            result.add(code, 100, time_stamp, counter)
+            result.add_ping(code, counter)
+        self.assertEqual(result.get('X'), {
+            'byteCount': 300,
+            'recordCount': 3,
+            'pingCount': 2,
+            'missedPings': 2,
+            'startTime': 1.0,
+            'stopTime': 3.0,
+            'other': None,
+            '_seqNo': 14,
+        })
+        self.assertEqual(result.first_counter[code], 10)
+        self.assertIn('X', result)
+        self.assertNotIn('Y', result)
+        self.assertIsNone(result.get('Y'))
+        self.assertEqual(result.types(), ['X'])
+
+    def test_merge(self):
+        # the same datagrams accumulated at once or in two parts
+        datagrams = [
+            ('I', 1), ('X', 10), ('A', 1), ('X', 11), ('h', 1),
+            ('X', 13), ('A', 2), ('X', 14), ('h', 2), ('I', 2),
+        ]
+
+        def accumulate(datagrams, start=0):
+            result = ScanResult()
+            for i, (dg_type, counter) in enumerate(datagrams, start):
+                code = type_code(dg_type)
+                result.add(code, 10, float(i), counter)
+                if dg_type == 'X':
+                    result.add_ping(code, counter)
+                elif dg_type in ['I', 'h'] and \
+                        (dg_type != 'I' or result.other[code] is None):
+                    result.other[code] = counter
+            return result
+
+        result = accumulate(datagrams[:4])
+        result.merge(
+            accumulate(datagrams[4:], 4), first_other=[type_code('I')])
+        self.assertEqual(result.to_dict(), accumulate(datagrams).to_dict())
+
+    def test_remove(self):
+        result = ScanResult()
+        result.add(type_code('A'), 10, 1.0, 1)
+        result.add(TRUNCATED_CODE, 5, 2.0, 2)
+        result.remove(TRUNCATED)
+        self.assertEqual(result.types(), ['A'])
+        self.assertEqual(sum(result.byte_count), 10)
+
+    def test_times(self):
+        codes = [type_code('P'), type_code('X')]
+        result = ScanResult(time_series=[type_code('P')])
+        result.add(codes[0], 10, 1.0, 1)
+        result.add(codes[1], 10, 1.5, 1)
+        other = ScanResult(time_series=[type_code('P')])
+        other.add(codes[0], 10, 2.0, 2)
+        other.add_records(codes[0], 20, 2, 3.0, 4.0, 3, [3.0, 4.0])
+        result.merge(other)
+        self.assertEqual(list(result.times[codes[0]]), [1.0, 2.0, 3.0, 4.0])
+        self.assertIsNone(result.times[codes[1]])
+        result.remove('P')
+        self.assertEqual(len(result.times[codes[0]]), 0)
+        # the time-stamps are unknown after datagrams without them
+        other = ScanResult()
+        other.add(codes[0], 10, 5.0, 5)
+        result.merge(other)
+        self.assertIsNone(result.times)
+
+    def test_result_columns(self):
+        results = [ScanResult(), ScanResult()]
+        results[0].add(type_code('X'), 10, 1.0, 1)
+        results[0].add(type_code('X'), 10, 2.0, 2)
+        results[1].add(type_code('Y'), 10, 1.0, 1)
+        self.assertEqual(
+            result_columns(results, 'record_count', ['X', 'Y']).tolist(),
+            [[2, 0], [0, 1]])
+        self.assertEqual(
+            result_columns(results, 'byte_count', ['Y']).tolist(),
+            [[0], [10]])
+
+    def test_dict(self):
+        test_file = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "test_data", TEST_FILE))
+        test = ScanALL(test_file)
+        test.scan_datagram()
+        scan_result = test.scan_result
+        self.assertEqual(
+            ScanResult.from_dict(scan_result).to_dict(), scan_result)
+        # the dicts are serializable, as stored by the scan cache
+        loaded = ScanResult.from_dict(json.loads(json.dumps(scan_result)))
+        self.assertEqual(loaded.types(), test.result.types())
+        self.assertEqual(loaded.byte_count, test.result.byte_count)
+
+    def test_not_shared(self):
+        test_file = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "test_data", TEST_FILE))
+        test = ScanALL(test_file)
+        test.scan_datagram()
+        self.assertEqual(ScanALL(test_file).scan_result, {})
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(
+        unittest.TestLoader().loadTestsFromTestCase(TestMateScanResult))
+    return s
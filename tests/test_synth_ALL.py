@@ -0,0 +1,111 @@
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+from datetime import datetime
+from hyo2.mate.lib.scan import record_time_to_epoch
+from hyo2.mate.lib.synth_ALL import SynthALLWriter, write_synthetic_all, \
+    record_date_time, height_body, CORRUPT_LENGTH, CORRUPT_FAKE_HEADERS
+
+
+class TestMateSynthALL(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.temp_dir, "synthetic.all")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_record_date_time(self):
+        time_stamp = 1423284236.123
+        record_date, record_time = record_date_time(time_stamp)
+        self.assertEqual(record_date, 20150207)
+        self.assertEqual(
+            record_time_to_epoch(record_date, record_time), time_stamp)
+
+    def test_datagram(self):
+        with SynthALLWriter(self.test_file) as writer:
+            writer.write('h', height_body(12.5), 7, 1423284236.5)
+        with open(self.test_file, 'rb') as f:
+            data = f.read()
+        length, stx, dg_type, model, record_date, record_time, counter, \
+            serial = struct.unpack_from('<LBBHLLHH', data)
+        self.assertEqual(length + 4, len(data))
+        self.assertEqual(stx, 0x02)
+        self.assertEqual(chr(dg_type), 'h')
+        self.assertEqual(record_date, 20150207)
+        self.assertEqual(counter, 7)
+        self.assertEqual(struct.unpack_from('<l', data, 20)[0], 1250)
+        self.assertEqual(data[-3], 0x03)
+        checksum = struct.unpack_from('<H', data, len(data) - 2)[0]
+        self.assertEqual(checksum, sum(data[5:-3]) & 0xFFFF)
+
+    def test_corrupt(self):
+        body = bytes(100)
+        for corruption in [True, CORRUPT_LENGTH, CORRUPT_FAKE_HEADERS]:
+            with SynthALLWriter(self.test_file) as writer:
+                writer.write('X', body, 1, 1423284236.5, corrupt=corruption)
+                writer.write('N', body, 1, 1423284236.5)
+            with open(self.test_file, 'rb') as f:
+                data = f.read()
+            # the datagrams keep their size
+            self.assertEqual(len(data), 2 * (20 + len(body) + 3))
+            # the N datagram is part of the X one for a scanner
+            self.assertEqual(
+                writer.datagram_count,
+                1 if corruption == CORRUPT_LENGTH else 2)
+            length = struct.unpack_from('<L', data)[0]
+            if corruption is True:
+                self.assertEqual((data[4], data[len(data) // 2 - 3]), (0, 0))
+            elif corruption == CORRUPT_LENGTH:
+                # the length spans the N datagram
+                self.assertEqual(length + 4, len(data))
+            else:
+                # two datagrams in the middle of the body
+                start = data.index(b'\x02', 5) - 4
+                self.assertEqual(
+                    struct.unpack_from('<L', data, start)[0] + 4, 23)
+                self.assertEqual(data[start + 23 + 4], 0x02)
+                self.assertEqual(data[start + 2 * 23 - 3], 0x03)
+        with SynthALLWriter(self.test_file) as writer:
+            with self.assertRaises(ValueError):
+                writer.write(
+                    'h', bytes(20), 1, 1423284236.5,
+                    corrupt=CORRUPT_FAKE_HEADERS)
+
+    def test_chunked_writes(self):
+        chunked = os.path.join(self.temp_dir, "chunked.all")
+        written = write_synthetic_all(
+            self.test_file, pings=100, file_name='synthetic.all')
+        chunk_size = SynthALLWriter.chunk_size
+        SynthALLWriter.chunk_size = 1000
+        try:
+            write_synthetic_all(
+                chunked, pings=100, file_name='synthetic.all')
+        finally:
+            SynthALLWriter.chunk_size = chunk_size
+        with open(self.test_file, 'rb') as f, open(chunked, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+        self.assertEqual(os.path.getsize(chunked), written['bytes'])
+
+    def test_size(self):
+        size = 1000000
+        written = write_synthetic_all(
+            self.test_file, size=size, start=datetime(2020, 1, 1))
+        self.assertGreaterEqual(written['bytes'], size)
+        self.assertLess(written['bytes'], size + 50000)
+        self.assertEqual(os.path.getsize(self.test_file), written['bytes'])
+
+    def test_truncate(self):
+        full = write_synthetic_all(self.test_file, pings=10)
+        truncated = write_synthetic_all(self.test_file, pings=10, truncate=5)
+        self.assertEqual(truncated['bytes'], full['bytes'] - 5)
+        self.assertEqual(os.path.getsize(self.test_file), truncated['bytes'])
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMateSynthALL))
+    return s